@@ -1,19 +1,25 @@
-import requests
 import time
 from plc_connect import plc_db
 from wlkata_mirobot import WlkataMirobot
-import moveSelf
+import motionExecutor
 import maduoXYZ
 from realsense_depth import *
 import cv2 as cv
 import visualSignal
 import ast  # 新增：解析字典字符串必需
 import os   # 新增：创建目录/路径拼接必需（原代码用了os但未导入）
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import visionClient
+import plcSnapshot
+import stackingPlan
 
 # 实例化 arm 对象
 arm = WlkataMirobot()
 # 机械臂初始化（必须）
 arm.home()
+# 运动执行器：独占机械臂的线程按队列执行搬运（moveSelf.carry），放置完成后即可与 PLC 握手，撤离与之并行
+MOTION = motionExecutor.MotionExecutor(motionExecutor.MirobotBackend(arm))
 # 实例化 PLC 对象
 PLC = plc_db()
 
@@ -23,161 +29,105 @@ while True:
     if message_plc == 'connect plc ok':
         break
 
+# PLC 数据块快照：每轮一次整块读取（PLC_POLL_INTERVAL 秒一轮），各字段从快照中解码
+PLC_POLL_INTERVAL = 0.02
+# moveEndSignal 握手中两次读写之间的间隔（秒）
+HANDSHAKE_POLL = 0.01
+# 完成信号最长保持时间（秒）：PLC 撤下搬运请求即提前结束（原先固定等待 2 秒）
+MOVE_END_HOLD = 2
+SNAP = plcSnapshot.PlcSnapshot(PLC, interval=PLC_POLL_INTERVAL)
+SNAP.subscribe(['start', 'carryStatu', 'visual', 'maduoStart'],
+               lambda name, old, new: print(f'PLC {name}: {old} -> {new}'))
+# 托盘参数变化时丢弃已计算的堆垛坐标网格
+SNAP.subscribe(['xNumOne', 'yNumOne', 'zNumOne', 'xNumTwo', 'yNumTwo', 'zNumTwo', 'ranks', 'order'],
+               stackingPlan.invalidate)
+
 # 云平台API地址（根据实际接口调整）
 CLOUD_API_URL = "http://192.168.40.49:5401"
-UPLOAD_ENDPOINT = f"{CLOUD_API_URL}/upload"  # 云平台接收图片的接口
-RESULT_ENDPOINT = f"{CLOUD_API_URL}/result"  # 云平台返回结果的接口
 
 # 结果保存根目录（确保真实运行时目录存在）
 SAVE_ROOT = "./recognition_results"
 os.makedirs(SAVE_ROOT, exist_ok=True)  # 新增：自动创建目录，避免保存失败
 
+# 上传图像的 JPEG 质量；本地是否另存一份采集图（后台线程写盘，不阻塞识别）
+JPEG_QUALITY = visionClient.JPEG_QUALITY
+SAVE_LOCAL_CAPTURES = False
+# 收到视觉信号后等待物料稳定再拍照的秒数（按现场调整；原先为主循环 1 秒 + 采集前 2 秒）
+CAPTURE_SETTLE = 3
+
+# 云平台客户端：整个程序共用一个连接池（keep-alive），失败时退避重试
+VISION = visionClient.VisionClient(CLOUD_API_URL, jpeg_quality=JPEG_QUALITY)
+
+# 相机只启动一次，后台持续取最新彩色帧（设置 LAB401_CAPTURE_REPLAY=<目录> 时回放录制的图片）
+CAMERA = open_capture()
+
 # 补全真实运行所需的时间戳函数（如果主程序已有可忽略）
 def get_timestamped_filename(prefix, ext):
     import datetime
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"{prefix}_{timestamp}.{ext}"
 
+def _save_bytes(path, data):
+    try:
+        with open(path, "wb") as f:
+            f.write(data)
+    except Exception as e:
+        print(f"❌ 采集图留档失败：{e}")
+
 def visualRecognition():
-    time.sleep(2)
-    dc = DepthCamera()
-    ret, depth_frame, color_frame = dc.get_frame()
+    # 等物料稳定后，取稳定之后采集的最新一帧（管线常开，不再每次重启相机）
+    time.sleep(CAPTURE_SETTLE)
+    t0 = time.perf_counter()
+    ret, color_frame, captured_at = CAMERA.get_frame(newer_than=time.time())
+    cycleTiming = {'settle_ms': CAPTURE_SETTLE * 1000, 'capture_ms': (time.perf_counter() - t0) * 1000}
 
     print(f"相机获取帧：ret={ret}")
     if not ret:
         print("警告：未获取到相机帧，跳过保存")
-        return None, None, None
+        return None, None, None, None
 
-    # 1. 裁剪感兴趣区域（保持原有逻辑）
+    # 1. 裁剪感兴趣区域（保持原有逻辑；环形缓冲区中的视图，编码前不拷贝）
     color_frame_belt = color_frame[178:310, 258:400]
 
-    # 2. 临时保存图像（用于上传）
+    # 2. 在内存中编码为 JPEG（用于上传），不再写临时文件再读回
     temp_filename = get_timestamped_filename("temp_upload", "jpg")
-    temp_image_path = os.path.join(SAVE_ROOT, temp_filename)
+    t0 = time.perf_counter()
     try:
-        cv.imwrite(temp_image_path, color_frame_belt)
-        print(f"临时图像已保存至：{temp_image_path}")
-    except Exception as e:
-        print(f"❌ 临时图像保存失败：{e}")
-        return None, None, None
+        image_bytes = VISION.encode(color_frame_belt)
+    except visionClient.VisionError as e:
+        print(f"❌ {e}")
+        return None, None, None, None
+    cycleTiming['encode_ms'] = (time.perf_counter() - t0) * 1000
 
-    # 3. 上传图像到云平台（修正部分）
-    uploaded_filename = None
+    # 本地留档改为可选的后台步骤，不阻塞识别流程
+    if SAVE_LOCAL_CAPTURES:
+        threading.Thread(
+            target=_save_bytes,
+            args=(os.path.join(SAVE_ROOT, temp_filename), image_bytes),
+            daemon=True,
+        ).start()
+
+    # 3. 上传图像并获取解析结果（连接复用、退避重试与耗时统计见 visionClient）
     try:
-        with open(temp_image_path, "rb") as f:
-            # 关键修正：使用动态生成的temp_filename作为上传文件名
-            # 确保与保存的文件名一致，且参数名"file"与app.py匹配
-            files = {"file": (temp_filename, f, "image/jpeg")}
-            response = requests.post(UPLOAD_ENDPOINT, files=files, timeout=30)
-            response.raise_for_status()  # 触发HTTP错误（如500）
-            upload_result = response.json()
-
-            # 容错：判断上传成功的字段（匹配云平台返回）
-            if not upload_result.get("success", False):
-                err_msg = upload_result.get("message", "未知错误")
-                print(f"❌ 云平台上传失败：{err_msg}")
-                return None, None, None
-
-            uploaded_filename = upload_result.get("filename")
-            if not uploaded_filename:
-                print(f"❌ 云平台未返回文件名，上传失败")
-                return None, None, None
-
-            print(f"✅ 图像上传成功，文件名：{uploaded_filename}")
-    except requests.exceptions.Timeout:
-        print(f"❌ 上传请求超时（30秒），请检查云平台网络")
-        return None, None, None
-    except requests.exceptions.ConnectionError:
-        print(f"❌ 云平台连接失败，请检查{UPLOAD_ENDPOINT}是否可达")
-        return None, None, None
-    except requests.exceptions.HTTPError as e:
-        # 捕获并显示具体的HTTP错误信息（方便调试）
-        print(f"❌ 上传请求HTTP错误：{str(e)}")
-        return None, None, None
-    except Exception as e:
-        print(f"❌ 上传请求失败：{str(e)}")
-        return None, None, None
-
-
-    # 4. 轮询云平台获取解析结果（最多等待30秒，每2秒查一次）
-    max_retries = 15
-    retry_count = 0
-    result_data = None
-    while retry_count < max_retries:
-        try:
-            params = {"filename": uploaded_filename}  # 匹配云平台的参数名
-            response = requests.get(RESULT_ENDPOINT, params=params, timeout=10)
-            response.raise_for_status()
-            result_data = response.json()
-
-            # 检查结果是否就绪
-            if result_data.get("ready", False):
-                print("✅ 云平台返回解析结果")
-                break
+        out, conf, shape_type, result_data = VISION.recognize(image_bytes, temp_filename)
+    except visionClient.VisionError as e:
+        print(f"❌ 云平台识别失败：{e}")
+        return None, None, None, None
+    finally:
+        # 采集/编码/上传/等待结果各步骤耗时上报到云平台 /metrics（后台发送，不阻塞）
+        VISION.report(dict(VISION.last_timing, **cycleTiming))
+    print(f"📝 云平台返回原始结果：\n{result_data.get('content', '').strip()}")
 
-            print(f"⏳ 等待解析结果（{retry_count + 1}/{max_retries}）")
-            retry_count += 1
-            time.sleep(2)
-        except requests.exceptions.Timeout:
-            print(f"❌ 结果查询超时（10秒）")
-            retry_count += 1
-            time.sleep(2)
-        except requests.exceptions.ConnectionError:
-            print(f"❌ 云平台连接失败，请检查{RESULT_ENDPOINT}是否可达")
-            retry_count += 1
-            time.sleep(2)
-        except Exception as e:
-            print(f"❌ 结果查询失败：{str(e)}")
-            retry_count += 1
-            time.sleep(2)
-
-    if not result_data or not result_data.get("ready"):
-        print("❌ 超时未获取到解析结果（30秒）")
-        return None, None, None
-
-    # 5. 解析云平台返回的结果（匹配真实测试验证的格式：英文冒号+自定义字段）
-    raw_content = result_data.get("content", "").strip()  # 获取云平台返回的3行文本
-    print(f"📝 云平台返回原始结果：\n{raw_content}")
-
-    # 初始化变量（默认值）
-    out = None  # 识别的数字（如7）
-    conf = None  # 置信度（如0.98）
-    shape_type = None  # 分类结果（如"奇"）
     # 兼容原代码的shapes字典（若后续不需要可删除，这里保留避免报错）
     shapes = {"triangle": 0, "rectangle": 0, "polygons": 0, "circles": 0}
 
-    # 按行分割解析（严格匹配你的3行格式）
-    lines = [line.strip() for line in raw_content.split("\n") if line.strip()]
-    for line in lines:
-        # 解析「识别的数字」（格式：识别的数字:7）
-        if line.startswith("识别的数字:"):
-            num_str = line.split(":", 1)[1].strip()
-            if num_str.isdigit():
-                out = int(num_str)
-            else:
-                print(f"⚠️ 识别数字格式错误：{num_str}（应为整数）")
-        
-        # 解析「置信度」（格式：置信度为:0.98）
-        elif line.startswith("置信度为:"):
-            conf_str = line.split(":", 1)[1].strip()
-            try:
-                conf = float(conf_str)
-            except ValueError:
-                print(f"⚠️ 置信度格式错误：{conf_str}（应为小数）")
-        
-        # 解析「分类结果」（格式：分类结果：奇）
-        elif line.startswith("分类结果："):  # 注意是中文冒号「：」，和前两个英文冒号区分
-            shape_type = line.split("：", 1)[1].strip()  # 用中文冒号分割
-            # 统一分类结果格式（可选：避免大小写/空格问题）
-            shape_type = shape_type.replace(" ", "").lower()
-
     # 校验解析结果
     if out is None or conf is None or shape_type is None:
-        print(f"❌ 解析失败！原始内容：\n{raw_content}")
+        print(f"❌ 解析失败！原始返回：{result_data}")
         print(f"当前解析结果：数字={out}，置信度={conf}，分类={shape_type}")
         return None, None, None, None
 
-    # 5. 保存结果到txt文件（按你的格式保存，包含置信度）
+    # 4. 保存结果到txt文件（按你的格式保存，包含置信度）
     txt_filename = get_timestamped_filename("recognition_result", "txt")
     txt_save_path = os.path.join(SAVE_ROOT, txt_filename)
     try:
@@ -193,7 +143,7 @@ def visualRecognition():
     except Exception as e:
         print(f"❌ 写入结果文件时出错：{str(e)}")
 
-    # 6. 返回结果：shapes（兼容原代码）、shape_type（分类结果）、out（数字）、conf（置信度）
+    # 5. 返回结果：shapes（兼容原代码）、shape_type（分类结果）、out（数字）、conf（置信度）
     print(f"✅ 视觉识别完成：数字={out}，置信度={conf:.2f}，分类结果={shape_type}")
     return shapes, shape_type, out, conf
 
@@ -202,13 +152,111 @@ def moveEndSignal(PLC):
     end = PLC.read('int', 2)
     while end == 0:
         PLC.write(2, bytearray(b'\x00\n'))
+        time.sleep(HANDSHAKE_POLL)
         end = PLC.read('int', 2)
         if end == 10:
             break
-    time.sleep(2)
+    # PLC 收到完成信号后撤下搬运请求（start 不再为 30），最长等待 MOVE_END_HOLD 秒
+    SNAP.wait_until(lambda: SNAP.get('start') != 30, MOVE_END_HOLD)
     PLC.write(2, bytearray(b'\x00\x00'))
 
 
+# 搬运失败后置位；PLC 撤下搬运请求（start 不再为 30，即操作员复位）之前不再提交搬运
+carryFault = False
+# 上一次搬运任务：放置后就返回握手，撤离（及移到下一次取料点上方）可能仍在进行
+lastJob = None
+
+
+def carryAllowed(start):
+    """是否可以执行搬运；故障置位期间返回 False，PLC 撤下搬运请求后清除故障"""
+    global carryFault
+    if carryFault and start != 30:
+        carryFault = False
+        print('✅ 搬运请求已撤下，搬运故障复位')
+    return start == 30 and not carryFault
+
+
+def _carryFailed(job):
+    """搬运出错：不给完成信号，完成信号字清零并置位故障，等 PLC 复位后才会再次搬运"""
+    global carryFault
+    print(f'❌ 搬运故障：{job.error}，等待 PLC 撤下搬运请求后再继续')
+    PLC.write(2, bytearray(b'\x00\x00'))
+    carryFault = True
+
+
+def runCarry(startPoint, endPoint, nextPick=None):
+    """
+    提交搬运并等到放置完成（等待期间继续写回识别结果），然后给 PLC 完成信号；
+    握手期间机械臂撤离，给出 nextPick 时（后端支持的话）预先移到下一次取料点上方。返回是否成功。
+    上一次任务在放置之后（撤离时）出错的，在这里发现并置位故障，不再提交新任务
+    """
+    global lastJob
+    if lastJob is not None:
+        while not lastJob.done.wait(PLC_POLL_INTERVAL):
+            serviceVision(PLC)
+        previous, lastJob = lastJob, None
+        if previous.error is not None:
+            _carryFailed(previous)
+            return False
+    job = lastJob = MOTION.submit(startPoint, endPoint, next_pick=nextPick)
+    while not job.placed.wait(PLC_POLL_INTERVAL):
+        serviceVision(PLC)
+    if job.error is not None:
+        lastJob = None
+        _carryFailed(job)
+        return False
+    t0 = time.perf_counter()
+    moveEndSignal(PLC)
+    handshake_ms = (time.perf_counter() - t0) * 1000
+    # 撤离与握手并行，此时可能还在进行，先拷贝已完成各段的耗时
+    timing = dict(job.timing)
+    print('搬运耗时', {name: round(ms) for name, ms in timing.items()})
+    VISION.report(dict({f'carry_{name}_ms': ms for name, ms in timing.items()}, handshake_ms=handshake_ms))
+    return True
+
+
+# 视觉识别在后台线程执行（只做采集与 HTTP，不访问 PLC），主循环继续轮询 PLC、执行搬运；
+# 识别结果在主线程写回 PLC，PLC 读写与 moveEndSignal 握手始终只在主线程进行
+VISION_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vision')
+visionFuture = None
+
+
+def submitVision(visual):
+    """提交一次识别；上一次识别尚未处理完时忽略（视觉信号在结果写回前一直保持）"""
+    global visionFuture
+    if visionFuture is None:
+        print('视觉识别信号', visual)
+        visionFuture = VISION_EXECUTOR.submit(visualRecognition)
+
+
+def serviceVision(PLC):
+    """识别完成时在主线程把分类结果写给 PLC；未完成时立即返回"""
+    global visionFuture
+    if visionFuture is None or not visionFuture.done():
+        return
+    future, visionFuture = visionFuture, None
+    try:
+        shapes, shape_type, out, conf = future.result()
+    except Exception as e:
+        print(f"❌ 视觉识别异常：{e}")
+        return
+
+    if shape_type == '奇数':  # 001
+        print(shape_type)
+        visualSignal.visual(PLC)
+        visualSignal.circular(PLC)
+
+    elif shape_type == '偶数':
+        print(shape_type)
+        visualSignal.visual(PLC)
+        visualSignal.rectangle(PLC)
+
+    elif shape_type == '零':
+        print(shape_type)
+        visualSignal.visual(PLC)
+        visualSignal.triangle(PLC)
+
+
 # 取料坐标点
 AList = [-65.5, -197.9, 133.6]
 BList = [-17.5, -148.9, 128.6]
@@ -221,13 +269,17 @@ two2 = [40.6, 225.0, 138.0]
 
 # 循环读取 plc 信息
 while True:
-    start = PLC.read('int', 0)
-    carryStatu = PLC.read('int', 18)
-    visual = PLC.read('bool', 44, 0)
-    maduoStart = PLC.read('int', 26)
+    # 先处理已完成的识别，再读取本轮的 PLC 信号
+    serviceVision(PLC)
+    SNAP.poll()
+    start = SNAP.get('start')
+    carryStatu = SNAP.get('carryStatu')
+    visual = SNAP.get('visual')
+    maduoStart = SNAP.get('maduoStart')
+    canCarry = carryAllowed(start)
 
     # 分拣搬运
-    if start == 30 and maduoStart == 0 and visual == False:
+    if canCarry and maduoStart == 0 and visual == False:
         print('搬运信号', start)
         # 分拣 A
         if carryStatu == 10:
@@ -242,86 +294,68 @@ while True:
             startPoint = CList
             endPoint = DList
 
-        # 执行搬运程序
-        moveSelf.carry(arm, startPoint, endPoint)
-        # 完成搬运程序,给 plc 完成信号
-        moveEndSignal(PLC)
+        # 执行搬运程序，放置完成后给 plc 完成信号
+        runCarry(startPoint, endPoint)
 
     elif start == 0 and visual == True:
-        time.sleep(1)
-        print('视觉识别信号', visual)
-        shapes, shape_type, out = visualRecognition()
-        if shape_type == '奇数':  # 001
-            print(shape_type)
-            visualSignal.visual(PLC)
-            visualSignal.circular(PLC)
-
-        elif shape_type == '偶数':
-            print(shape_type)
-            visualSignal.visual(PLC)
-            visualSignal.rectangle(PLC)
-
-        elif shape_type == '零':
-            print(shape_type)
-            visualSignal.visual(PLC)
-            visualSignal.triangle(PLC)
+        # 识别在后台进行，结果由下一轮及之后的 serviceVision 写回
+        submitVision(visual)
 
     # 分拣堆垛（调用 stackingXYZ 获取堆垛坐标点）
-    elif start == 30 and maduoStart == 50 and visual == False:
+    elif canCarry and maduoStart == 50 and visual == False:
         print('分拣堆垛信号', maduoStart)
         # xNumOne, yNumOne, zNumOne 需要读取 plc 获得，分别代表行数，列数，层数
-        xNumOne = PLC.read('int', 28)
-        yNumOne = PLC.read('int', 30)
-        zNumOne = PLC.read('int', 32)
+        xNumOne = SNAP.get('xNumOne')
+        yNumOne = SNAP.get('yNumOne')
+        zNumOne = SNAP.get('zNumOne')
         # xNumTwo, yNumTwo, zNumTwo 需要读取 plc 获得，分别代表行数，列数，层数
-        xNumTwo = PLC.read('int', 34)
-        yNumTwo = PLC.read('int', 36)
-        zNumTwo = PLC.read('int', 38)
+        xNumTwo = SNAP.get('xNumTwo')
+        yNumTwo = SNAP.get('yNumTwo')
+        zNumTwo = SNAP.get('zNumTwo')
 
         num1 = xNumOne * yNumOne * zNumOne
         num2 = xNumTwo * yNumTwo * zNumTwo
 
         # ranks: 1 是行优先，2 是列优先, order：1 是 Z 次序，2 是 S 次序
-        ranks = PLC.read('int', 46)
-        order = PLC.read('int', 48)
+        ranks = SNAP.get('ranks')
+        order = SNAP.get('order')
 
         # 分拣
         while (num1 >= 0 and maduoStart == 50) or (num2 >= 0 and maduoStart == 50):
-            maduoStart = PLC.read('int', 26)
+            # 堆垛过程中同样及时写回已完成的识别结果
+            serviceVision(PLC)
+            SNAP.poll()
+            maduoStart = SNAP.get('maduoStart')
             if maduoStart == 0:
                 print('Stop 分拣堆垛信号', maduoStart)
                 break
 
-            carryStatu = PLC.read('int', 18)
+            carryStatu = SNAP.get('carryStatu')
             if carryStatu == 10:
                 # 确定放物坐标点
                 XYZ = [244.0, -6.8, 141.0]
-                xyzList = maduoXYZ.getXYZList(ranks, order, XYZ[0], XYZ[1], XYZ[2], xNumOne, yNumOne, zNumOne)
-                xyzList = xyzList[::-1]
-                xyz = xyzList[num1 - 1]
-                start = PLC.read('int', 0)
+                # 坐标网格按托盘参数只计算一次，按剩余件数直接取放料点
+                plan = stackingPlan.get_plan(ranks, order, XYZ, (xNumOne, yNumOne, zNumOne))
+                xyz = plan.target(num1)
+                start = SNAP.get('start')
                 print('AList', AList)
-                print('xyz', xyz)
+                print('xyz', xyz, '下一个', plan.upcoming(num1))
 
-                if start == 30:
-                    moveSelf.carry(arm, AList, xyz)
-                    # 完成搬运程序,给 plc 完成信号
-                    moveEndSignal(PLC)
-                    num1 = num1 - 1
-                    print('num1', num1)
+                if carryAllowed(start):
+                    # 堆垛时下一件仍从 AList 取料，撤离后直接移到其上方
+                    if runCarry(AList, xyz, nextPick=AList if num1 > 0 else None):
+                        num1 = num1 - 1
+                        print('num1', num1)
 
             # 分拣 B
             elif carryStatu == 20:
                 # 确定放物坐标点
                 XYZ = [54.8, 177.3, 139.0]
                 xNumOne, yNumOne, zNumOne = 2, 2, 2
-                xyzList = maduoXYZ.getXYZList(ranks, order, XYZ[0], XYZ[1], XYZ[2], xNumTwo, yNumTwo, zNumTwo)
-                xyzList = xyzList[::-1]
-                xyz = xyzList[num2 - 1]
-                start = PLC.read('int', 0)
-                if start == 30:
-                    moveSelf.carry(arm, BList, xyz)
-                    # 完成搬运程序,给 plc 完成信号
-                    moveEndSignal(PLC)
-                    num2 = num2 - 1
-                    print('num2', num2)
\ No newline at end of file
+                plan = stackingPlan.get_plan(ranks, order, XYZ, (xNumTwo, yNumTwo, zNumTwo))
+                xyz = plan.target(num2)
+                start = SNAP.get('start')
+                if carryAllowed(start):
+                    if runCarry(BList, xyz, nextPick=BList if num2 > 0 else None):
+                        num2 = num2 - 1
+                        print('num2', num2)
\ No newline at end of file
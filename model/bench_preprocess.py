@@ -0,0 +1,105 @@
+"""
+预处理基准：对比每帧新分配数组与复用缓冲区两种方式的耗时和内存分配
+
+- fresh：每帧新建 Preprocessor 且不传 dst（等同于原来每一步都分配新数组）
+- reused：复用同一个 Preprocessor 的缓冲区，结果写入预先分配的 dst，逐张处理
+- batch：复用缓冲区，按批写入 [N,H,W,3] 堆叠数组（同尺寸图片）
+
+内存分配用 tracemalloc 统计每次调用期间新增内存的峰值（NumPy 数组的分配会被记录），
+以 JSON 输出每帧的平均耗时与分配字节数。
+
+用法：
+    python model/bench_preprocess.py --images uploads --rounds 50 --batch-size 8
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import getShapeVideo2 as gsv2
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_frames(image_dir, size):
+    """读取图片并缩放到统一尺寸（模拟同一相机的连续帧）"""
+    frames = []
+    for name in sorted(os.listdir(image_dir)):
+        img = cv2.imread(os.path.join(image_dir, name))
+        if img is not None:
+            frames.append(cv2.resize(img, size))
+    return frames
+
+
+def measure(step, units, frames_per_unit, rounds):
+    """
+    units 为每次调用 step 的输入（单张图片或一批图片），
+    返回每帧平均耗时（微秒）与每帧新分配的字节数
+    """
+    for unit in units:
+        step(unit)  # 预热：首次调用分配缓冲区
+
+    tracemalloc.start()
+    allocated = 0
+    elapsed = 0.0
+    for _ in range(rounds):
+        for unit in units:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            t0 = time.perf_counter()
+            result = step(unit)
+            elapsed += time.perf_counter() - t0
+            allocated += tracemalloc.get_traced_memory()[1] - before
+            del result
+    tracemalloc.stop()
+
+    n = rounds * len(units) * frames_per_unit
+    return {
+        'us_per_frame': round(elapsed / n * 1e6, 2),
+        'bytes_per_frame': int(allocated / n),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='预处理耗时与内存分配基准')
+    parser.add_argument('--images', default=os.path.join(BASE_DIR, 'uploads'), help='图片目录')
+    parser.add_argument('--size', default='320x240', help='统一缩放到的尺寸，宽x高')
+    parser.add_argument('--rounds', type=int, default=50, help='重复轮数')
+    parser.add_argument('--batch-size', type=int, default=8, help='batch 模式的批大小')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    frames = load_frames(args.images, (width, height))
+    if not frames:
+        raise SystemExit(f'目录中没有图片: {args.images}')
+
+    shared = gsv2.Preprocessor()
+    out = np.empty((height, width, 3), dtype=np.uint8)
+    # 批模式只统计整批，末尾不足一批的图片丢弃
+    usable = len(frames) - len(frames) % args.batch_size
+    batches = [frames[i:i + args.batch_size] for i in range(0, usable, args.batch_size)]
+    modes = {
+        'fresh': (lambda img: gsv2.Preprocessor().run(img), frames, 1),
+        'reused': (lambda img: shared.run(img, dst=out), frames, 1),
+        'batch': (shared.run_batch, batches, args.batch_size),
+    }
+    report = {
+        'frames': len(frames),
+        'size': [width, height],
+        'rounds': args.rounds,
+        'batch_size': args.batch_size,
+        'modes': {name: measure(step, units, per_unit, args.rounds)
+                  for name, (step, units, per_unit) in modes.items() if units},
+    }
+    fresh = report['modes']['fresh']
+    for name, stats in report['modes'].items():
+        stats['speedup'] = round(fresh['us_per_frame'] / stats['us_per_frame'], 2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
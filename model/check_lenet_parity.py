@@ -0,0 +1,98 @@
+"""
+LeNet 输入一致性检查：对比原始预处理与 ShapeAnalysis.to_tensor 的输入张量和预测结果
+
+原始流程（重构前的 analysis）：灰度 → OTSU 二值化 → 反色 → 腐蚀 → 膨胀 → 写 1.jpg →
+PIL 读回 → transforms.Resize((32, 32)) → ToTensor → Normalize。
+现在的 to_tensor 在内存中完成同样的预处理，用 PIL 双线性缩放，不再经过 JPEG 写盘/读回。
+
+对每张图片输出两种输入的最大逐像素差、两者送入同一个 fp32 模型后的预测是否一致，
+另外单独给出“只去掉 JPEG 往返”造成的差异，便于区分缩放与 JPEG 压缩各自的影响。
+
+用法：
+    python model/check_lenet_parity.py --images uploads --limit 200
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import cv2 as cv
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from getShapeVideo1 import ShapeAnalysis
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE_TRANSFORM = transforms.Compose([
+    transforms.Resize((32, 32)),
+    transforms.ToTensor(),
+    transforms.Normalize((0.1307), (0.3081))
+])
+
+
+def baseline_binary(frame):
+    """重构前 analysis 中的预处理（逐步新建数组）"""
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    _, binary = cv.threshold(gray, 170, 255, cv.THRESH_BINARY | cv.THRESH_OTSU)
+    binary = 255 - binary
+    erosion = cv.erode(binary, np.ones((2, 2), np.uint8))
+    return cv.dilate(erosion, np.ones((10, 10), np.uint8))
+
+
+def baseline_tensor(frame, jpeg_path):
+    """重构前的输入：写 JPEG 后用 PIL 读回，再经 torchvision 变换，返回 [1,32,32]"""
+    cv.imwrite(jpeg_path, baseline_binary(frame))
+    return BASELINE_TRANSFORM(Image.open(jpeg_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比原始预处理与 to_tensor 的 LeNet 输入和预测")
+    parser.add_argument("--images", default=os.path.join(BASE_DIR, "uploads"), help="图片目录")
+    parser.add_argument("--limit", type=int, default=200, help="最多检查的图片数")
+    args = parser.parse_args()
+
+    analyzer = ShapeAnalysis(variant=False)
+    net = analyzer.net
+    names = [n for n in sorted(os.listdir(args.images))
+             if os.path.isfile(os.path.join(args.images, n))][:args.limit]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        jpeg_path = os.path.join(tmp, "1.jpg")
+        for name in names:
+            frame = cv.imread(os.path.join(args.images, name))
+            if frame is None:
+                continue
+            old = baseline_tensor(frame, jpeg_path).unsqueeze(0)
+            # 同样的缩放但不经过 JPEG：差异只来自 JPEG 压缩
+            no_jpeg = BASELINE_TRANSFORM(Image.fromarray(baseline_binary(frame))).unsqueeze(0)
+            new = analyzer.to_tensor([frame])
+            with torch.inference_mode():
+                old_probs = torch.softmax(net(old), dim=1)[0]
+                new_probs = torch.softmax(net(new), dim=1)[0]
+            rows.append({
+                "name": name,
+                "max_diff": float((old - new).abs().max()),
+                "max_diff_without_jpeg": float((no_jpeg - new).abs().max()),
+                "old": int(old_probs.argmax()), "new": int(new_probs.argmax()),
+                "conf_diff": float((old_probs.max() - new_probs.max()).abs()),
+            })
+
+    if not rows:
+        raise SystemExit("没有可读取的图片")
+    mismatched = [r for r in rows if r["old"] != r["new"]]
+    print(json.dumps({
+        "images": len(rows),
+        "prediction_agreement": round(1 - len(mismatched) / len(rows), 4),
+        "max_input_diff": round(max(r["max_diff"] for r in rows), 4),
+        "max_input_diff_without_jpeg": round(max(r["max_diff_without_jpeg"] for r in rows), 6),
+        "max_conf_diff": round(max(r["conf_diff"] for r in rows), 4),
+        "mismatched": mismatched,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
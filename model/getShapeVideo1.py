@@ -1,78 +1,162 @@
 import torch
-import torchvision.transforms as transforms
 from PIL import Image
 from model import MyLeNet
 import cv2 as cv
 import numpy as np
 import argparse  # 新增：支持命令行参数
 import os  # 新增：用于处理路径
+import random
+import time
+
+# 中间结果保存的采样率（0~1）：默认 0 不保存，推理直接使用内存中的数组
+DEBUG_DUMP_RATE = float(os.environ.get("LAB401_DEBUG_DUMP_RATE", "0"))
+
+# 腐蚀/膨胀核只创建一次
+ERODE_KERNEL = np.ones((2, 2), np.uint8)
+DILATE_KERNEL = np.ones((10, 10), np.uint8)
+
+# 模型输入：32x32 单通道，按 MNIST 的均值/方差归一化
+INPUT_SIZE = 32
+NORM_MEAN = 0.1307
+NORM_STD = 0.3081
+
+# torch 计算线程数（0 表示使用 torch 默认值）；LAB401_TORCHSCRIPT=1 时使用 TorchScript 编译后的模型
+TORCH_THREADS = int(os.environ.get("LAB401_TORCH_THREADS", "0"))
+USE_TORCHSCRIPT = os.environ.get("LAB401_TORCHSCRIPT", "0") == "1"
+
+
+def classify_digit(digit):
+    """数字 -> 形状类型（零/奇数/偶数）"""
+    if digit == 0:
+        return "零"
+    if digit % 2 != 0:
+        return "奇数"
+    return "偶数"
 
 
 class ShapeAnalysis:
-    def __init__(self):
+    """
+    数字识别 + 形状计数
+
+    analysis(frame) 处理单帧；analyze_batch(frames) 把多帧一次性转换为
+    [N,1,32,32] 张量并只做一次前向推理，返回每帧的 (数字, 置信度, 形状类型)
+    """
+
+    def __init__(self, num_threads=TORCH_THREADS, torchscript=USE_TORCHSCRIPT, variant=None):
         # 保留形状计数核心逻辑
         self.shapes = {'triangle': 0, 'rectangle': 0, 'polygons': 0, 'circles': 0}
-        # 提前模型初始化（移到__init__，避免重复加载）
-        self.net = MyLeNet()
-        # 关键修改：用绝对路径加载模型
-        # 获取当前脚本（getShapeVideo1.py）所在的目录
-        current_script_dir = os.path.dirname(os.path.abspath(__file__))
-        # 拼接模型文件的绝对路径（假设模型和脚本在同一目录）
-        model_path = os.path.join(current_script_dir, "MNistLeNet.pth")
-        # 加载模型
-        self.net.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
-        self.net.eval()  # 设为评估模式
-        # 保留图像预处理逻辑
-        self.transform = transforms.Compose([
-            transforms.Resize((32, 32)),
-            transforms.ToTensor(),
-            transforms.Normalize((0.1307), (0.3081))
-        ])
+        if num_threads and num_threads > 0:
+            torch.set_num_threads(num_threads)
+        # 导出的优化变体（int8 / TorchScript / ONNX，见 model_variants.py）：
+        # 未显式传入时按 LAB401_LENET_VARIANT 选择；先确定变体，只加载实际使用的模型
+        if variant is None:
+            from model_variants import resolve_variant
+            variant = resolve_variant("lenet")
+        self.variant = variant or None
+        if variant:
+            from model_variants import load_lenet
+            self.net = load_lenet(variant, num_threads or 0)
+        else:
+            # 提前模型初始化（移到__init__，避免重复加载）
+            self.net = MyLeNet()
+            # 关键修改：用绝对路径加载模型
+            # 获取当前脚本（getShapeVideo1.py）所在的目录
+            current_script_dir = os.path.dirname(os.path.abspath(__file__))
+            # 拼接模型文件的绝对路径（假设模型和脚本在同一目录）
+            model_path = os.path.join(current_script_dir, "MNistLeNet.pth")
+            # 加载模型
+            self.net.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+            self.net.eval()  # 设为评估模式
+            if torchscript:
+                self.net = self._compile(self.net)
         self.classes = ('0', '1', '2', '3', '4', '5', '6', '7', '8', '9')
+        # 预处理缓冲区（按帧尺寸复用，尺寸变化时重新分配）
+        self._buffers = {}
 
-    def analysis(self, frame):
-        """保留核心图像分析与形状判断逻辑"""
-        print("start to detect lines...\n")
-        
-        # 保留图像预处理（灰度化→二值化→腐蚀→膨胀）
-        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-        ret, binary = cv.threshold(gray, 170, 255, cv.THRESH_BINARY | cv.THRESH_OTSU)
-        binary = 255 - binary  # 反二值化
-        kernel = np.ones((2, 2), np.uint8)
-        erosion = cv.erode(binary, kernel)  # 腐蚀
-        kernel = np.ones((10, 10), np.uint8)
-        frame_processed = cv.dilate(erosion, kernel)  # 膨胀
-        
-        # 保留中间结果保存（便于调试）
-        cv.imwrite('1.jpg', frame_processed)
-        
-        # 保留模型推理逻辑
-        frame_pil = Image.open('1.jpg')
-        frame_transformed = self.transform(frame_pil)  # [C, H, W]
-        frame_input = torch.unsqueeze(frame_transformed, dim=0)  # [N, C, H, W]
-        
-        with torch.no_grad():  # 禁用梯度计算，加速推理
-            outputs = self.net(frame_input)
-            predict = torch.max(outputs, dim=1)[1].numpy()
-            out = self.classes[int(predict)]
-            out = int(out)
-            print(f"模型预测结果: {out}")
-
-        # 保留形状类型判断与计数逻辑
-        shape_type = ""
-        if out == 0:
-            self.shapes['triangle'] += 1
-            shape_type = "零"
-            print("零")
-        elif (out % 2) != 0:
-            self.shapes['rectangle'] += 1
-            shape_type = "奇数"
-            print("奇数")
-        else:
-            self.shapes['circles'] += 1
-            shape_type = "偶数"
-            print("偶数")
+    def _buffer(self, name, shape):
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.uint8)
+            self._buffers[name] = buf
+        return buf
+
+    @staticmethod
+    def _compile(net):
+        """编译为 TorchScript 并冻结参数；编译失败时继续使用原模型"""
+        try:
+            return torch.jit.freeze(torch.jit.script(net))
+        except Exception as e:
+            print(f"TorchScript 编译失败，使用普通模型: {e}")
+            return net
+
+    def binarize(self, frame):
+        """灰度化→二值化→反色→腐蚀→膨胀，结果写入复用的缓冲区（下一次调用会被覆盖）"""
+        shape = frame.shape[:2]
+        gray = self._buffer('gray', shape)
+        work = self._buffer('work', shape)
+        cv.cvtColor(frame, cv.COLOR_BGR2GRAY, dst=gray)
+        cv.threshold(gray, 170, 255, cv.THRESH_BINARY | cv.THRESH_OTSU, dst=work)
+        cv.bitwise_not(work, dst=work)  # 反二值化
+        cv.erode(work, ERODE_KERNEL, dst=gray)  # 腐蚀
+        cv.dilate(gray, DILATE_KERNEL, dst=work)  # 膨胀
+        return work
+
+    def to_array(self, frames):
+        """
+        多帧 → 归一化后的 [N,32,32] float32 数组（不经过 torchvision）：
+        预处理后用 PIL 双线性缩放到 32x32（与原 transforms.Resize((32, 32)) 对 PIL 图像的缩放相同，
+        缩小时带抗锯齿），写入同一个数组，再按 (x/255 - mean) / std 归一化
+        """
+        batch = np.empty((len(frames), INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+        for i, frame in enumerate(frames):
+            binary = self.binarize(frame)
+            # 中间结果按采样率保存（便于调试），不再写盘后读回
+            if DEBUG_DUMP_RATE > 0 and random.random() < DEBUG_DUMP_RATE:
+                cv.imwrite('1.jpg', binary)
+            batch[i] = Image.fromarray(binary).resize((INPUT_SIZE, INPUT_SIZE), Image.BILINEAR)
+        batch *= 1.0 / (255.0 * NORM_STD)
+        batch -= NORM_MEAN / NORM_STD
+        return batch
 
+    def to_tensor(self, frames):
+        """多帧 → 归一化后的 [N,1,32,32] 张量（见 to_array）"""
+        return torch.from_numpy(self.to_array(frames)).unsqueeze(1)
+
+    def analyze_batch(self, frames, timing=None):
+        """
+        批量识别：返回与 frames 一一对应的 (数字, softmax 置信度, 形状类型)，
+        并累加形状计数；传入 timing 字典时写入预处理/推理耗时（毫秒）
+        """
+        if timing is not None:
+            timing.update({'preprocess_ms': 0.0, 'inference_ms': 0.0})
+        if len(frames) == 0:
+            return []
+        t0 = time.perf_counter()
+        inputs = self.to_tensor(frames)
+        t1 = time.perf_counter()
+        with torch.inference_mode():
+            probs = torch.softmax(self.net(inputs), dim=1)
+            confs, preds = probs.max(dim=1)
+        if timing is not None:
+            timing.update({'preprocess_ms': (t1 - t0) * 1000,
+                           'inference_ms': (time.perf_counter() - t1) * 1000})
+
+        results = []
+        for digit, conf in zip(preds.tolist(), confs.tolist()):
+            digit = int(self.classes[digit])
+            shape_type = classify_digit(digit)
+            if digit == 0:
+                self.shapes['triangle'] += 1
+            elif digit % 2 != 0:
+                self.shapes['rectangle'] += 1
+            else:
+                self.shapes['circles'] += 1
+            results.append((digit, conf, shape_type))
+        return results
+
+    def analysis(self, frame):
+        """保留核心图像分析与形状判断逻辑（单帧，内部走批量路径；不逐帧打印，结果由调用方输出）"""
+        out, _, shape_type = self.analyze_batch([frame])[0]
         return self.shapes, shape_type, out
 
 
@@ -81,6 +165,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", required=True, help="输入图片路径")
     parser.add_argument("--output", required=True, help="结果输出路径")
+    parser.add_argument("--threads", type=int, default=TORCH_THREADS, help="torch 计算线程数（0 为默认）")
+    parser.add_argument("--torchscript", action="store_true", default=USE_TORCHSCRIPT,
+                        help="使用 TorchScript 编译后的模型推理")
     args = parser.parse_args()
 
     try:
@@ -90,7 +177,7 @@ if __name__ == "__main__":
             raise Exception(f"无法读取图片: {args.input}")
 
         # 执行分析（保留核心流程）
-        ld = ShapeAnalysis()
+        ld = ShapeAnalysis(num_threads=args.threads, torchscript=args.torchscript)
         shapes_count, shape_type, detectes_num = ld.analysis(src)
 
         # 保存结果到输出文件（适配自动处理脚本的结果读取）
@@ -1,13 +1,88 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import os
+import time
+import hashlib
+import random
 import argparse
 
 # 1. 加载你训练好的模型
+# ultralytics/torch 导入和权重加载都很慢，推迟到第一次推理（或 warm_up）时进行，
+# 这样仅解析参数（如 --help）或被其他模块导入时不会付出这部分开销
 current_script_dir = os.path.dirname(os.path.abspath(__file__))
 model_path = os.path.join(current_script_dir, "gsv2.pt")
-model = YOLO(model_path)
+model = None
+# 实际加载的权重文件：LAB401_YOLO_VARIANT 选中导出的变体时指向 model/variants/ 下的文件
+active_model_path = None
+
+# 替身模型：LAB401_STUB_MODEL=1 时不加载 gsv2.pt，改用 stub_model.StubModel（基准测试/离线环境），
+# 模拟耗时由 LAB401_STUB_BATCH_MS（每批）与 LAB401_STUB_IMAGE_MS（每张）控制
+STUB_MODEL = os.environ.get("LAB401_STUB_MODEL", "0") == "1"
+STUB_BATCH_MS = float(os.environ.get("LAB401_STUB_BATCH_MS", "5"))
+STUB_IMAGE_MS = float(os.environ.get("LAB401_STUB_IMAGE_MS", "2"))
+
+def get_model():
+    """返回已加载的模型，首次调用时导入 ultralytics 并加载权重"""
+    global model
+    if model is None:
+        if STUB_MODEL:
+            from stub_model import StubModel
+            model = StubModel(batch_ms=STUB_BATCH_MS, per_image_ms=STUB_IMAGE_MS)
+        else:
+            from ultralytics import YOLO
+            model = YOLO(resolve_model_path(), task="detect")
+    return model
+
+def resolve_model_path():
+    """按 LAB401_YOLO_VARIANT 选择权重文件（见 model_variants.py），未配置时为 gsv2.pt"""
+    global active_model_path
+    if active_model_path is None:
+        from model_variants import resolve_variant, variant_path
+        variant = resolve_variant("yolo")
+        active_model_path = variant_path(variant) if variant else model_path
+    return active_model_path
+
+# 调试图保存的采样率（0~1）：默认 0 不保存，避免每次推理都同步写盘
+# 例如 LAB401_DEBUG_DUMP_RATE=0.05 表示约 5% 的图片会把预处理结果写到 debug.jpg
+DEBUG_DUMP_RATE = float(os.environ.get("LAB401_DEBUG_DUMP_RATE", "0"))
+
+def maybe_dump_debug(preprocessed_img, path="debug.jpg"):
+    """按采样率保存预处理后的调试图"""
+    if DEBUG_DUMP_RATE > 0 and random.random() < DEBUG_DUMP_RATE:
+        cv2.imwrite(path, preprocessed_img)
+
+def model_version():
+    """模型版本：权重文件名 + 内容哈希前 12 位，用于在结果中标明由哪个模型产生"""
+    if STUB_MODEL:
+        return f"stub@{STUB_BATCH_MS:g}+{STUB_IMAGE_MS:g}ms"
+    path = resolve_model_path()
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{os.path.basename(path)}@{digest.hexdigest()[:12]}"
+
+def warm_up():
+    """
+    预热模型：用一张空白图跑一次推理，
+    让常驻进程在接收第一张真实图片前完成权重加载和算子初始化
+    """
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    get_model()(blank, verbose=False)
+
+def format_result(cls_id, category_cn, conf):
+    """生成结果文本（命令行与常驻推理进程共用同一格式）"""
+    if cls_id is not None:
+        return (
+            f"识别的数字:{cls_id}\n"
+            f"置信度为:{conf:.2f}\n"
+            f"分类结果：{category_cn}\n"
+        )
+    return (
+        f"识别的数字:无\n"
+        f"置信度为:0.00\n"
+        f"分类结果：{category_cn}\n"
+    )
 
 def classify_number_logic(label_id):
     digit = int(label_id)
@@ -18,59 +93,159 @@ def classify_number_logic(label_id):
     else:
         return "奇数"
 
+# 预处理用到的常量：膨胀核与高斯模糊核只创建一次
+DILATE_KERNEL = np.ones((3, 3), np.uint8)
+BLUR_KSIZE = (5, 5)
+
+class Preprocessor:
+    """
+    复用缓冲区的预处理器
+
+    灰度、模糊、二值化、膨胀各步骤都写入预先分配的缓冲区（OpenCV 的 dst= 参数），
+    图片尺寸不变时每帧不再分配新数组。缓冲区属于实例，非线程安全：
+    每个推理进程/线程各用一个实例
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def _buffer(self, name, shape):
+        """按名字取缓冲区，尺寸变化时重新分配"""
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape:
+            buf = np.empty(shape, dtype=np.uint8)
+            self._buffers[name] = buf
+        return buf
+
+    def binarize(self, img):
+        """
+        灰度 → 高斯模糊 → OTSU 反色二值化 → 膨胀，返回单通道结果。
+        返回的是内部缓冲区，下一次调用会被覆盖
+        """
+        shape = img.shape[:2]
+        gray = self._buffer('gray', shape)
+        blurred = self._buffer('blurred', shape)
+        if img.ndim == 3:
+            cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=gray)
+        else:
+            np.copyto(gray, img)
+        cv2.GaussianBlur(gray, BLUR_KSIZE, 0, dst=blurred)
+        # 二值化结果写回 gray，膨胀结果写回 blurred，两个缓冲区轮流使用
+        cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=gray)
+        cv2.dilate(gray, DILATE_KERNEL, dst=blurred, iterations=1)
+        return blurred
+
+    def run(self, img, dst=None):
+        """单张预处理，结果写入 dst（形状 H×W×3，不传则新分配）"""
+        binary = self.binarize(img)
+        if dst is None:
+            dst = np.empty(binary.shape + (3,), dtype=np.uint8)
+        cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR, dst=dst)
+        return dst
+
+    def run_batch(self, images, channels=3):
+        """
+        批量预处理：尺寸相同时结果写入复用的堆叠缓冲区 [N,H,W,C]（C 为 3 或 1），
+        模型直接读取该数组，不再逐张分配；尺寸不一致时返回逐张新分配的列表。
+        channels=1 时跳过 GRAY2BGR 扩展，供单通道模型使用。
+        返回的堆叠数组在下一次 run_batch 时会被覆盖
+        """
+        shapes = {img.shape[:2] for img in images}
+        if len(shapes) != 1:
+            if channels == 1:
+                return [self.binarize(img).copy() for img in images]
+            return [self.run(img) for img in images]
+
+        (h, w), = shapes
+        out_shape = (len(images), h, w) if channels == 1 else (len(images), h, w, 3)
+        stack = self._buffer(f'stack{channels}', out_shape)
+        for i, img in enumerate(images):
+            if channels == 1:
+                np.copyto(stack[i], self.binarize(img))
+            else:
+                self.run(img, dst=stack[i])
+        return stack
+
+_PREPROCESSOR = Preprocessor()
+
 def preprocess_image(img):
     """
     【Linux 适配最终版】
     输入：原本是黑字（深色字）
     输出：黑底白字（模型要求的格式）
     逻辑：使用 OTSU 自动寻找阈值 + 颜色反转
+
+    1. 转为灰度图
+    2. 高斯模糊 (关键)：去除噪点，防止 OTSU 计算的阈值受干扰，(5, 5) 模糊核必须是奇数
+    3. OTSU 二值化 + 颜色反转 (核心)：threshold 设为 0，OpenCV 会自动找最佳值；
+       THRESH_BINARY_INV 让暗的数字变白 (255)、亮的背景变黑 (0)
+    4. 形态学膨胀：二值化后数字可能变细，膨胀让字变粗，利于 YOLO 识别
+    5. 强制转为 3通道 BGR (YOLO 格式要求)
+
+    中间步骤复用模块级 Preprocessor 的缓冲区，只有返回的 3 通道结果是新分配的
     """
-    # 1. 转为灰度图
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    
-    # 2. 高斯模糊 (关键)
-    # 这一步是为了去除噪点，防止 OTSU 计算的阈值受干扰
-    # (5, 5) 是模糊核，必须是奇数
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    
-    # 3. OTSU 二值化 + 颜色反转 (核心)
-    # threshold 设为 0，因为用了 THRESH_OTSU，OpenCV 会自动找最佳值覆盖掉它
-    # THRESH_BINARY_INV 作用：
-    #   - 图像中"暗"的像素（你的黑色数字） -> 变白 (255)
-    #   - 图像中"亮"的像素（你的背景）     -> 变黑 (0)
-    ret, binary_img = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-    
-    # 打印一下自动计算出的阈值，方便你调试观察
-    print(f"【调试】OTSU 自动计算的阈值为: {ret}")
-
-    # 4. 形态学膨胀 (可选，建议保留)
-    # 因为二值化后数字可能会变细，膨胀可以让字变粗，利于 YOLO 识别
-    # 如果你的数字本身就很粗，可以把 iterations 改为 0 或者注释掉
-    kernel = np.ones((3, 3), np.uint8)
-    dilated_img = cv2.dilate(binary_img, kernel, iterations=1)
-    
-    # 5. 强制转为 3通道 BGR (YOLO 格式要求)
-    preprocessed_img = cv2.cvtColor(dilated_img, cv2.COLOR_GRAY2BGR)
-    
-    return preprocessed_img
+    return _PREPROCESSOR.run(img)
 
-def predict_and_classify_silent(image_path):
+def read_image(image_path):
+    """读取图片（支持中文路径），失败时返回 None"""
     try:
-        # 读取图片（支持中文路径）
         image_bytes = np.fromfile(image_path, dtype=np.uint8)
         img = cv2.imdecode(image_bytes, cv2.IMREAD_COLOR)
         if img is None:
             print(f"无法读取图像: {image_path}")
-            return None, None, None
+            return None
         print(f"原图通道数：{img.shape[-1]}")  # 应该输出3
+        return img
     except Exception as e:
         print(f"读取文件错误: {e}")
+        return None
+
+def load_image(source):
+    """
+    统一的图片输入：文件路径、编码后的图片字节（JPEG/PNG 等）或已解码的 BGR 数组
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            print("无法解码图像数据")
+        return img
+    return read_image(source)
+
+def parse_result(result):
+    """从单张图片的推理结果中取置信度最高的框，返回 (数字, 分类, 置信度)"""
+    boxes = result.boxes
+
+    if len(boxes) == 0:
+        print("画面中未检测到数字")
+        return None, "未检测到数字", 0.0
+
+    # 取置信度最高的结果
+    best_conf = 0.0
+    best_cls_id = None
+    best_category_cn = None
+    
+    for box in boxes:
+        cls_id = int(box.cls[0].item())
+        conf = box.conf[0].item()
+        
+        if conf > best_conf:
+            best_conf = conf
+            best_cls_id = cls_id
+            best_category_cn = classify_number_logic(cls_id)
+    
+    return best_cls_id, best_category_cn, best_conf
+
+def predict_and_classify_silent(image_path):
+    img = read_image(image_path)
+    if img is None:
         return None, None, None
 
     # --- 图片预处理 ---
     print("正在进行图片预处理...")
     preprocessed_img = preprocess_image(img)
-    cv2.imwrite("debug.jpg", preprocessed_img)
+    maybe_dump_debug(preprocessed_img)
     print("down")
     
     # 额外验证：确保预处理后是3通道
@@ -81,63 +256,119 @@ def predict_and_classify_silent(image_path):
     
     # --- 模型推理 ---
     print("正在进行模型推理...")
-    results = model(preprocessed_img, verbose=False)
+    results = get_model()(preprocessed_img, verbose=False)
 
     # --- 处理结果 ---
     for result in results:
-        boxes = result.boxes
+        return parse_result(result)
 
-        if len(boxes) == 0:
-            print("画面中未检测到数字")
-            return None, "未检测到数字", 0.0
+def predict_and_classify_batch(images, timing=None):
+    """
+    批量推理：把多张图片预处理后放进同一次 model([...]) 调用，
+    返回与输入一一对应的 (数字, 分类, 置信度) 列表；
+    无法读取的图片（None）对应 (None, None, None)。
+    传入 timing 字典时写入预处理/推理耗时（毫秒）
+    """
+    outputs = [(None, None, None)] * len(images)
+    valid = [i for i, img in enumerate(images) if img is not None]
+    if timing is not None:
+        timing.update({'preprocess_ms': 0.0, 'inference_ms': 0.0})
+    if not valid:
+        return outputs
 
-        # 取置信度最高的结果
-        best_conf = 0.0
-        best_cls_id = None
-        best_category_cn = None
-        
-        for box in boxes:
-            cls_id = int(box.cls[0].item())
-            conf = box.conf[0].item()
-            
-            if conf > best_conf:
-                best_conf = conf
-                best_cls_id = cls_id
-                best_category_cn = classify_number_logic(cls_id)
-        
-        return best_cls_id, best_category_cn, best_conf
+    t0 = time.perf_counter()
+    # 同尺寸时为复用的 [N,H,W,3] 堆叠缓冲区，按张切片直接交给模型，不再逐张分配
+    batch = list(_PREPROCESSOR.run_batch([images[i] for i in valid]))
+    t1 = time.perf_counter()
+    maybe_dump_debug(batch[-1])
+    print(f"正在进行批量推理，共 {len(batch)} 张...")
+    results = get_model()(batch, verbose=False)
+    t2 = time.perf_counter()
+
+    for i, result in zip(valid, results):
+        outputs[i] = parse_result(result)
+    if timing is not None:
+        timing.update({'preprocess_ms': (t1 - t0) * 1000, 'inference_ms': (t2 - t1) * 1000})
+    return outputs
+
+class MicroBatcher:
+    """
+    动态微批调度器
+
+    阻塞等待第一条请求，之后在 max_wait 秒内继续收集后续请求，
+    收满 max_batch_size 条或到达截止时间即返回，交给一次前向推理处理。
+    单张图片时最多只多等待 max_wait，突发上传时则合并成一个批次。
+    """
+
+    def __init__(self, max_batch_size=8, max_wait=0.01):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.last_timing = {}
+
+    def collect(self, conn):
+        """
+        从管道（需支持 poll/recv）收集一批请求。
+        收到 None 表示停止：返回 (已收集的请求, True)
+        """
+        first = conn.recv()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not conn.poll(remaining):
+                break
+            msg = conn.recv()
+            if msg is None:
+                return batch, True
+            batch.append(msg)
+        return batch, False
+
+    def run(self, sources):
+        """
+        读取/解码一批图片（路径、图片字节或 BGR 数组）并执行一次批量推理，
+        各阶段耗时（毫秒）记录在 last_timing 中
+        """
+        t0 = time.perf_counter()
+        images = [load_image(src) for src in sources]
+        t1 = time.perf_counter()
+        outputs = predict_and_classify_batch(images, timing=self.last_timing)
+        self.last_timing.update({
+            'decode_ms': (t1 - t0) * 1000,
+            'batch_size': len(sources),
+        })
+        return outputs
 
 # --- 主程序 ---
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", required=True, help="输入图片路径")
-    parser.add_argument("--output", required=True, help="结果输出路径")
+    parser.add_argument("--input", required=True, nargs='+', help="输入图片路径（可传多张，批量推理）")
+    parser.add_argument("--output", required=True, nargs='+', help="结果输出路径（与 --input 一一对应）")
     parser.add_argument("--threshold", type=int, default=80, help="黑色阈值（0-255）")
+    parser.add_argument("--batch-size", type=int, default=8, help="单次前向推理的最大图片数")
     args = parser.parse_args()
 
-    test_image_path = args.input
+    if len(args.input) != len(args.output):
+        parser.error("--input 与 --output 的数量必须一致")
     
     # 检查模型文件
-    if not os.path.exists(model_path):
+    if not STUB_MODEL and not os.path.exists(model_path):
         print(f"错误: 未找到模型文件 {model_path}")
     else:
-        # 运行推理
-        cls_id, category_cn, conf = predict_and_classify_silent(test_image_path)
-        
-        # 保存结果
-        if cls_id is not None:
-            result = (
-                f"识别的数字:{cls_id}\n"
-                f"置信度为:{conf:.2f}\n"
-                f"分类结果：{category_cn}\n"
-            )
-        else:
-            result = (
-                f"识别的数字:无\n"
-                f"置信度为:0.00\n"
-                f"分类结果：{category_cn}\n"
-            )
-        
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(result)
-        print("处理完成，结果已保存")
\ No newline at end of file
+        batcher = MicroBatcher(max_batch_size=args.batch_size)
+        for start in range(0, len(args.input), batcher.max_batch_size):
+            inputs = args.input[start:start + batcher.max_batch_size]
+            outputs = args.output[start:start + batcher.max_batch_size]
+
+            # 运行推理
+            predictions = batcher.run(inputs)
+
+            # 保存结果
+            for output_path, (cls_id, category_cn, conf) in zip(outputs, predictions):
+                result = format_result(cls_id, category_cn, conf)
+                
+                with open(output_path, "w", encoding="utf-8") as f:
+                    f.write(result)
+        print("处理完成，结果已保存")
@@ -0,0 +1,360 @@
+"""
+CPU 模型变体：导出、评估与自动选择
+
+两个识别模型都在 CPU 上以全精度运行（LeNet：MNistLeNet.pth，YOLO：gsv2.pt）。
+这里导出优化后的变体，并在已保存的上传图片上评估准确率与单张耗时：
+- lenet-fp32：原始权重（基准）
+- lenet-int8：全连接层动态 int8 量化（卷积层不支持动态量化，保持 fp32），保存为 TorchScript
+- lenet-ts：TorchScript 编译并冻结
+- lenet-onnx：ONNX 导出，用 onnxruntime 推理
+- yolo-pt：原始 gsv2.pt（基准）
+- yolo-torchscript / yolo-onnx：ultralytics 导出，仍通过 ultralytics.YOLO 加载
+- yolo-onnx-int8：在 yolo-onnx 基础上用 onnxruntime 做动态 int8 量化
+
+评估集：uploads/ 中按文件名哈希固定抽出的一部分图片。
+- 用 --labels 指定人工标注的 {文件名: 数字} JSON 时，记录各变体的准确率（accuracy），
+  并把满足准确率下限且最快的变体写入清单的 selected
+- 不指定时标签取结果库中已保存的识别结果（result/results.db，兼容旧的 `_result.txt`）。
+  这些结果本身就是基准模型的输出，基准变体必然为 1.0，只能说明与基准是否一致，
+  因此只记录一致率（agreement），不写 selected，也不参与自动选择
+评估结果写入 model/variants/variants.json。
+
+服务启动时，LAB401_YOLO_VARIANT / LAB401_LENET_VARIANT 为 auto 则在用标注集评估过的变体中
+选出满足准确率下限（LAB401_ACCURACY_FLOOR）且最快的；也可直接指定变体名；不设置时使用原始模型。
+
+用法：
+    python model/model_variants.py --family lenet yolo --holdout 0.2 --floor 0.98 --labels labels.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(MODEL_DIR)
+VARIANTS_DIR = os.path.join(MODEL_DIR, "variants")
+VARIANTS_FILE = os.path.join(VARIANTS_DIR, "variants.json")
+LENET_WEIGHTS = os.path.join(MODEL_DIR, "MNistLeNet.pth")
+YOLO_WEIGHTS = os.path.join(MODEL_DIR, "gsv2.pt")
+
+# 变体选择：空/default 使用原始模型，auto 自动选择，其余视为变体名
+VARIANT_CHOICE = {
+    "yolo": os.environ.get("LAB401_YOLO_VARIANT", ""),
+    "lenet": os.environ.get("LAB401_LENET_VARIANT", ""),
+}
+ACCURACY_FLOOR = float(os.environ.get("LAB401_ACCURACY_FLOOR", "0.98"))
+
+_DIGIT_RE = re.compile(r"识别的数字:(\d+)")
+
+
+# ---- 变体清单 ----
+def load_manifest(path=VARIANTS_FILE):
+    if not os.path.exists(path):
+        return {"variants": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=VARIANTS_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def select_variant(family, floor=ACCURACY_FLOOR, manifest=None):
+    """
+    返回该模型族中用标注集评估、准确率不低于 floor 且单张耗时最短的变体，没有时返回 None；
+    只有一致率（agreement）的变体不参与选择
+    """
+    manifest = manifest or load_manifest()
+    candidates = [
+        v for v in manifest["variants"]
+        if v["family"] == family and v.get("metric") == "accuracy" and v["accuracy"] >= floor
+        and os.path.exists(os.path.join(VARIANTS_DIR, v["path"]))
+    ]
+    return min(candidates, key=lambda v: v["ms_per_image"]) if candidates else None
+
+
+def resolve_variant(family, choice=None, floor=ACCURACY_FLOOR):
+    """
+    按配置解析要加载的变体：返回变体记录，或 None 表示使用原始模型。
+    choice 默认取该模型族的环境变量；指定的变体不存在时打印提示并回退到原始模型
+    """
+    if choice is None:
+        choice = VARIANT_CHOICE[family]
+    if choice in ("", "default"):
+        return None
+    manifest = load_manifest()
+    if choice == "auto":
+        variant = select_variant(family, floor, manifest)
+        if variant is None:
+            print(f"没有用标注集评估且满足准确率下限 {floor} 的 {family} 变体，使用原始模型")
+        else:
+            print(f"自动选择模型变体 {variant['name']}（准确率 {variant['accuracy']:.3f}，"
+                  f"{variant['ms_per_image']:.2f} ms/张）")
+        return variant
+    for variant in manifest["variants"]:
+        if variant["name"] == choice and variant["family"] == family:
+            return variant
+    print(f"未找到模型变体 {choice}，使用原始模型")
+    return None
+
+
+def variant_path(variant):
+    return os.path.join(VARIANTS_DIR, variant["path"])
+
+
+# ---- LeNet ----
+class OnnxLeNet:
+    """onnxruntime 推理的 LeNet，调用方式与 torch 模型一致：输入 [N,1,32,32] 张量，返回 logits"""
+
+    def __init__(self, path, num_threads=0):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, inputs):
+        import torch
+        logits = self.session.run(None, {self.input_name: inputs.numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def _load_lenet_fp32():
+    import torch
+    from model import MyLeNet
+    net = MyLeNet()
+    net.load_state_dict(torch.load(LENET_WEIGHTS, map_location=torch.device("cpu")))
+    net.eval()
+    return net
+
+
+def load_lenet(variant, num_threads=0):
+    """按变体记录加载 LeNet"""
+    import torch
+    if variant["format"] == "onnx":
+        return OnnxLeNet(variant_path(variant), num_threads)
+    if variant["format"] == "state_dict":
+        return _load_lenet_fp32()
+    return torch.jit.load(variant_path(variant), map_location="cpu")
+
+
+def export_lenet():
+    """导出 LeNet 的各个变体，返回变体记录列表（尚未评估）"""
+    import torch
+    net = _load_lenet_fp32()
+    example = torch.zeros(1, 1, 32, 32)
+    variants = [{"name": "lenet-fp32", "family": "lenet", "format": "state_dict",
+                 "path": os.path.relpath(LENET_WEIGHTS, VARIANTS_DIR)}]
+
+    quantized = torch.ao.quantization.quantize_dynamic(net, {torch.nn.Linear}, dtype=torch.qint8)
+    torch.jit.save(torch.jit.script(quantized), os.path.join(VARIANTS_DIR, "lenet-int8.pt"))
+    variants.append({"name": "lenet-int8", "family": "lenet", "format": "torchscript",
+                     "path": "lenet-int8.pt"})
+
+    scripted = torch.jit.freeze(torch.jit.script(net))
+    torch.jit.save(scripted, os.path.join(VARIANTS_DIR, "lenet-ts.pt"))
+    variants.append({"name": "lenet-ts", "family": "lenet", "format": "torchscript",
+                     "path": "lenet-ts.pt"})
+
+    try:
+        torch.onnx.export(net, example, os.path.join(VARIANTS_DIR, "lenet.onnx"),
+                          input_names=["input"], output_names=["logits"],
+                          dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                          opset_version=13)
+        variants.append({"name": "lenet-onnx", "family": "lenet", "format": "onnx",
+                         "path": "lenet.onnx"})
+    except Exception as e:
+        print(f"LeNet ONNX 导出失败，跳过: {e}")
+    return variants
+
+
+def evaluate_lenet(variant, samples, batch_size=8):
+    """返回 (与标签一致的比例, 单张耗时毫秒)"""
+    from getShapeVideo1 import ShapeAnalysis
+    import torch
+    analyzer = ShapeAnalysis(variant=False)  # 只借用预处理，模型由 variant 决定
+    net = load_lenet(variant)
+    frames = [img for img, _ in samples]
+    labels = [label for _, label in samples]
+
+    correct, elapsed = 0, 0.0
+    with torch.inference_mode():
+        net(analyzer.to_tensor(frames[:1]))  # 预热
+    for start in range(0, len(frames), batch_size):
+        inputs = analyzer.to_tensor(frames[start:start + batch_size])
+        t0 = time.perf_counter()
+        with torch.inference_mode():
+            preds = net(inputs).argmax(dim=1).tolist()
+        elapsed += time.perf_counter() - t0
+        correct += sum(int(p == y) for p, y in zip(preds, labels[start:start + batch_size]))
+    return correct / len(samples), elapsed / len(samples) * 1000
+
+
+# ---- YOLO ----
+def load_yolo(variant):
+    from ultralytics import YOLO
+    return YOLO(variant_path(variant), task="detect")
+
+
+def export_yolo():
+    """用 ultralytics 导出 TorchScript / ONNX，并尝试对 ONNX 做动态 int8 量化"""
+    import shutil
+    from ultralytics import YOLO
+    variants = [{"name": "yolo-pt", "family": "yolo", "format": "pt",
+                 "path": os.path.relpath(YOLO_WEIGHTS, VARIANTS_DIR)}]
+    for fmt, name, filename in (("torchscript", "yolo-torchscript", "gsv2.torchscript"),
+                                ("onnx", "yolo-onnx", "gsv2.onnx")):
+        try:
+            exported = YOLO(YOLO_WEIGHTS).export(format=fmt)
+            shutil.move(exported, os.path.join(VARIANTS_DIR, filename))
+            variants.append({"name": name, "family": "yolo", "format": fmt, "path": filename})
+        except Exception as e:
+            print(f"YOLO {fmt} 导出失败，跳过: {e}")
+
+    if any(v["name"] == "yolo-onnx" for v in variants):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(os.path.join(VARIANTS_DIR, "gsv2.onnx"),
+                             os.path.join(VARIANTS_DIR, "gsv2-int8.onnx"),
+                             weight_type=QuantType.QUInt8)
+            variants.append({"name": "yolo-onnx-int8", "family": "yolo", "format": "onnx",
+                             "path": "gsv2-int8.onnx"})
+        except Exception as e:
+            print(f"YOLO ONNX 量化失败，跳过: {e}")
+    return variants
+
+
+def evaluate_yolo(variant, samples):
+    """返回 (与标签一致的比例, 单张耗时毫秒)"""
+    import getShapeVideo2 as gsv2
+    model = load_yolo(variant)
+    model(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)  # 预热
+
+    correct, elapsed = 0, 0.0
+    for img, label in samples:
+        preprocessed = gsv2.preprocess_image(img)
+        t0 = time.perf_counter()
+        result = model(preprocessed, verbose=False)[0]
+        elapsed += time.perf_counter() - t0
+        digit, _, _ = gsv2.parse_result(result)
+        correct += int(digit == label)
+    return correct / len(samples), elapsed / len(samples) * 1000
+
+
+# ---- 评估集 ----
+def _list_files(directory):
+    """uploads/ 或 result/ 中的文件（含按日期分片的，由服务端的 ShardedStore 列出）：(文件名, 路径)"""
+    python_dir = os.path.join(BASE_DIR, "python")
+    if python_dir not in sys.path:
+        sys.path.insert(0, python_dir)
+    from storage import ShardedStore
+    return ShardedStore(directory, managed=lambda name: True).iter_files()
+
+
+def _stored_labels(result_dir):
+    """结果库与兼容文本文件中已保存的识别结果：{上传文件名: 数字}（基准模型的输出，不是人工标注）"""
+    labels = {}
+    db_path = os.path.join(result_dir, "results.db")
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute("SELECT filename, digit FROM results WHERE digit IS NOT NULL")
+            labels.update({name: int(digit) for name, digit in rows})
+        finally:
+            conn.close()
+    for name, path in _list_files(result_dir):
+        if not name.endswith("_result.txt"):
+            continue
+        with open(path, encoding="utf-8") as f:
+            match = _DIGIT_RE.search(f.read())
+        if match:
+            labels.setdefault(name[:-len("_result.txt")], int(match.group(1)))
+    return labels
+
+
+def load_holdout(upload_dir, result_dir, holdout=0.2, labels_path=None, limit=500):
+    """
+    按文件名哈希固定抽取评估图片（同一张图片每次都落在同一侧），
+    返回 [(BGR 图像, 标签)]
+    """
+    import cv2
+    if labels_path:
+        with open(labels_path, encoding="utf-8") as f:
+            labels = {k: int(v) for k, v in json.load(f).items()}
+    else:
+        labels = _stored_labels(result_dir)
+
+    samples = []
+    for name, path in _list_files(upload_dir):
+        base = os.path.splitext(name)[0]
+        label = labels.get(name, labels.get(base))
+        if label is None:
+            continue
+        bucket = int(hashlib.sha1(name.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+        if holdout < 1.0 and bucket >= holdout:
+            continue
+        img = cv2.imread(path)
+        if img is not None:
+            samples.append((img, label))
+        if len(samples) >= limit:
+            break
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出并评估 CPU 模型变体")
+    parser.add_argument("--family", nargs="+", default=["lenet", "yolo"], choices=["lenet", "yolo"])
+    parser.add_argument("--uploads", default=os.environ.get("LAB401_UPLOAD_DIR", os.path.join(BASE_DIR, "uploads")))
+    parser.add_argument("--results", default=os.environ.get("LAB401_RESULT_DIR", os.path.join(BASE_DIR, "result")))
+    parser.add_argument("--labels", help="人工标注 JSON：{上传文件名: 数字}；不指定则只对比已保存的识别结果（一致率），不做自动选择")
+    parser.add_argument("--holdout", type=float, default=0.2, help="用作评估集的图片比例（0~1）")
+    parser.add_argument("--limit", type=int, default=500, help="评估集最多图片数")
+    parser.add_argument("--floor", type=float, default=ACCURACY_FLOOR, help="准确率下限（仅用于打印推荐）")
+    args = parser.parse_args()
+
+    samples = load_holdout(args.uploads, args.results, args.holdout, args.labels, args.limit)
+    if not samples:
+        raise SystemExit("评估集为空：没有带标签的上传图片")
+    # 没有人工标注时，“标签”是基准模型自己的输出，只能得到与基准的一致率
+    metric = "accuracy" if args.labels else "agreement"
+    print(f"评估集: {len(samples)} 张（{'人工标注' if args.labels else '已保存的识别结果，只计算一致率'}）")
+
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    manifest = load_manifest()
+    exporters = {"lenet": (export_lenet, evaluate_lenet), "yolo": (export_yolo, evaluate_yolo)}
+    for family in args.family:
+        export, evaluate = exporters[family]
+        manifest["variants"] = [v for v in manifest["variants"] if v["family"] != family]
+        for variant in export():
+            score, ms = evaluate(variant, samples)
+            variant.update({"metric": metric, metric: round(score, 4), "ms_per_image": round(ms, 3),
+                            "samples": len(samples)})
+            manifest["variants"].append(variant)
+            print(f"{variant['name']:<18} {'准确率' if args.labels else '一致率'} {score:.3f}  {ms:.2f} ms/张")
+
+    selected = manifest.setdefault("selected", {})
+    for family in args.family:
+        if not args.labels:
+            selected.pop(family, None)
+            print(f"{family}: 未指定 --labels，不做自动选择")
+            continue
+        best = select_variant(family, args.floor, manifest)
+        selected[family] = best["name"] if best else None
+        print(f"{family}: 推荐变体 {best['name'] if best else '无（使用原始模型）'}")
+    manifest["updated_at"] = time.time()
+    save_manifest(manifest)
+
+
+if __name__ == "__main__":
+    main()
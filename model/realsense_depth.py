@@ -1,9 +1,26 @@
-import pyrealsense2 as rs
+"""
+RealSense 相机采集
+
+- DepthCamera：原有的同步接口（每次 get_frame 阻塞等待一帧深度 + 彩色），保留兼容
+- CaptureService：常驻采集服务。管线只启动一次（自动曝光只收敛一次），
+  后台线程持续取帧写入固定大小的环形缓冲区，get_frame() 直接返回最新一帧
+- RealSenseSource：只开启用到的彩色流（可选深度流）
+- ReplaySource：按帧率回放磁盘上录制的图片，无需相机即可测试
+
+pyrealsense2 在用到相机时才导入，回放不依赖它。
+"""
+import os
+import threading
+import time
+
 import numpy as np
 import cv2 as cv
 
+
 class DepthCamera:
     def __init__(self):
+        import pyrealsense2 as rs
+
         # Configure depth and color streams
         self.pipeline = rs.pipeline()
         config = rs.config()
@@ -26,11 +43,170 @@ class DepthCamera:
         depth_frame = frames.get_depth_frame()
         color_frame = frames.get_color_frame()
 
-        depth_image = np.asanyarray(depth_frame.get_data())
-        color_image = np.asanyarray(color_frame.get_data())
         if not depth_frame or not color_frame:
             return False, None, None
+        depth_image = np.asanyarray(depth_frame.get_data())
+        color_image = np.asanyarray(color_frame.get_data())
         return True, depth_image, color_image
 
     def release(self):
         self.pipeline.stop()
+
+
+class RealSenseSource:
+    """RealSense 彩色流（depth=True 时同时开启深度流，但只返回彩色图）"""
+
+    def __init__(self, width=640, height=480, fps=30, depth=False):
+        import pyrealsense2 as rs
+
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+        config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, fps)
+        if depth:
+            config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+        self.pipeline.start(config)
+
+    def read(self, timeout_ms=1000):
+        """返回 (是否成功, 彩色图)；彩色图是 SDK 帧内存上的视图，调用方需在下一次 read 前拷走"""
+        ok, frames = self.pipeline.try_wait_for_frames(timeout_ms)
+        if not ok:
+            return False, None
+        color_frame = frames.get_color_frame()
+        if not color_frame:
+            return False, None
+        return True, np.asanyarray(color_frame.get_data())
+
+    def release(self):
+        self.pipeline.stop()
+
+
+class ReplaySource:
+    """
+    回放目录中录制的图片（按文件名排序），按 fps 控制节奏，loop 为 True 时循环播放。
+    录制方法：对 CaptureService.get_frame() 的结果逐帧 cv.imwrite 到同一目录
+    """
+
+    EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, path, fps=30, loop=True):
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(self.EXTENSIONS))
+        if not names:
+            raise FileNotFoundError(f'回放目录中没有图片: {path}')
+        self.frames = [cv.imread(os.path.join(path, n)) for n in names]
+        self.interval = 1.0 / fps if fps else 0.0
+        self.loop = loop
+        self._index = 0
+        self._next_at = time.monotonic()
+
+    def read(self, timeout_ms=1000):
+        if self._index >= len(self.frames):
+            if not self.loop:
+                time.sleep(timeout_ms / 1000)
+                return False, None
+            self._index = 0
+        delay = self._next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_at = max(self._next_at, time.monotonic() - self.interval) + self.interval
+        frame = self.frames[self._index]
+        self._index += 1
+        return frame is not None, frame
+
+    def release(self):
+        pass
+
+
+class CaptureService:
+    """
+    常驻采集服务：后台线程从 source 取帧，拷入预先分配的环形缓冲区（slots 个槽位）
+
+    get_frame() 返回最新一帧在缓冲区中的视图（不拷贝）与采集时间戳（time.time()）。
+    视图所在槽位在之后 slots - 1 帧内不会被覆盖（30fps、8 个槽位约 0.23 秒），
+    需要更久保留时调用方自行 copy()
+    """
+
+    def __init__(self, source, slots=8):
+        self.source = source
+        self.slots = max(2, int(slots))
+        self._buffer = None  # [slots, H, W, C]，按第一帧的尺寸分配
+        self._timestamps = np.zeros(self.slots)
+        self._count = 0      # 已写入的帧数，最新一帧在 (count - 1) % slots
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name='capture', daemon=True)
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while self._running:
+            try:
+                ok, frame = self.source.read()
+            except Exception as e:
+                print(f'采集失败: {e}')
+                time.sleep(0.1)
+                continue
+            if not ok:
+                continue
+            captured_at = time.time()
+            if self._buffer is None or self._buffer.shape[1:] != frame.shape:
+                self._buffer = np.empty((self.slots,) + frame.shape, dtype=frame.dtype)
+            # 写入的槽位不是任何已发布的“最新一帧”，读者不会看到写了一半的图像
+            slot = self._count % self.slots
+            np.copyto(self._buffer[slot], frame)
+            with self._cond:
+                self._timestamps[slot] = captured_at
+                self._count += 1
+                self._cond.notify_all()
+
+    def get_frame(self, timeout=1.0, newer_than=None):
+        """
+        返回 (是否成功, 最新彩色帧视图, 采集时间戳)。
+        newer_than 为 time.time() 时间戳时等待该时刻之后采集的帧（例如触发信号之后）
+        """
+        deadline = time.monotonic() + timeout
+
+        def ready():
+            if self._count == 0:
+                return False
+            return newer_than is None or self._timestamps[(self._count - 1) % self.slots] > newer_than
+
+        with self._cond:
+            while not ready():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False, None, None
+                self._cond.wait(remaining)
+            slot = (self._count - 1) % self.slots
+            return True, self._buffer[slot], float(self._timestamps[slot])
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def release(self):
+        self.stop()
+        self.source.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def open_capture(replay_dir=None, slots=8, **kwargs):
+    """
+    打开并启动采集服务：给出 replay_dir（或设置环境变量 LAB401_CAPTURE_REPLAY）时回放录制的图片，
+    否则使用 RealSense 相机（kwargs 传给 RealSenseSource）
+    """
+    replay_dir = replay_dir or os.environ.get('LAB401_CAPTURE_REPLAY')
+    source = ReplaySource(replay_dir) if replay_dir else RealSenseSource(**kwargs)
+    return CaptureService(source, slots=slots).start()
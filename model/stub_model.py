@@ -0,0 +1,45 @@
+"""
+离线替身模型（用于基准测试 / 没有 gsv2.pt 的环境）
+
+接口与 ultralytics YOLO 的调用方式一致：model(图片或图片列表, verbose=False)
+返回每张图片一个结果对象，结果对象的 boxes 中每个框都有 cls / conf。
+识别的数字由图像内容确定性地算出，推理耗时按“每批固定开销 + 每张耗时”模拟。
+"""
+import time
+
+import numpy as np
+
+
+class _Box:
+    def __init__(self, cls_id, conf):
+        self.cls = np.array([cls_id])
+        self.conf = np.array([conf])
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubModel:
+    """
+    batch_ms: 每次前向推理的固定耗时（毫秒）
+    per_image_ms: 批内每张图片额外的耗时（毫秒）
+    """
+
+    def __init__(self, batch_ms=5.0, per_image_ms=2.0):
+        self.batch_ms = float(batch_ms)
+        self.per_image_ms = float(per_image_ms)
+
+    def __call__(self, source, verbose=False):
+        images = source if isinstance(source, list) else [source]
+        time.sleep((self.batch_ms + self.per_image_ms * len(images)) / 1000)
+        return [self._predict(img) for img in images]
+
+    @staticmethod
+    def _predict(img):
+        # 全黑（空白）画面视为没有数字，其余按像素均值映射到 0~9
+        mean = float(np.mean(img))
+        if mean == 0:
+            return _Result([])
+        return _Result([_Box(int(mean) % 10, 0.5 + (mean % 50) / 100)])
@@ -0,0 +1,206 @@
+"""
+机械臂运动执行器
+
+原先主循环同步调用 moveSelf.carry，搬运结束后再做 PLC 握手，机械臂撤离期间主线程也在等。
+MotionExecutor 在独立线程中独占机械臂，按队列执行搬运：
+
+- submit() 把搬运任务放入队列，返回 CarryJob
+- 后端的 carry(start, end, mark) 在每段结束时调用 mark(段名)；放置完成后调用 mark('placed')，
+  job.placed 随即置位，主线程可以开始 PLC 握手，撤离与握手并行，撤离结束后队列中的下一次搬运紧接着开始
+- submit(..., next_pick) 给出下一次取料点时，后端若提供 prepare(point, mark)，撤离后预先移到其上方，
+  下一次搬运的接近段与本次握手重叠；后端没有 prepare 时忽略
+- 每段耗时记录在 job.timing 中（另有 queue_wait 与整次 carry），stats() 汇总最近 HISTORY_SIZE 次的平均耗时
+
+机械臂后端：
+- MirobotBackend：调用现场验证过的 moveSelf.carry(arm, start, end)，不改动运动路径。
+  moveSelf 不在本仓库中；只有当 moveSelf.carry 接受关键字参数 mark 时才把 mark 传进去，
+  否则只能在整次搬运结束时置位 placed，也只有整次 carry 的耗时；不提供 prepare（不猜测机械臂接口）
+- SimArm：按距离和速度模拟各段耗时，在释放后调用 mark('placed')，并提供 prepare，用于离线测量节拍
+
+PLC 读写仍只在主线程进行，执行器不访问 PLC。
+
+离线测量（模拟机械臂，对比等搬运结束再握手与放置后即握手的节拍）：
+    python motionExecutor.py --jobs 10 --speed 150 --ack 0.5
+"""
+import argparse
+import inspect
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+HISTORY_SIZE = 200   # stats() 统计最近多少次搬运
+
+
+class MirobotBackend:
+    """wlkata_mirobot 机械臂：调用 moveSelf.carry 完成一次搬运（阻塞到搬运结束）"""
+
+    def __init__(self, arm):
+        import moveSelf
+        self.arm = arm
+        self._carry = moveSelf.carry
+        try:
+            self._accepts_mark = 'mark' in inspect.signature(moveSelf.carry).parameters
+        except (TypeError, ValueError):
+            self._accepts_mark = False
+        if not self._accepts_mark:
+            print('⚠️ moveSelf.carry 不支持 mark 钩子：搬运结束后才开始握手，只记录整次搬运耗时')
+
+    def carry(self, start, end, mark):
+        if self._accepts_mark:
+            self._carry(self.arm, start, end, mark=mark)
+        else:
+            self._carry(self.arm, start, end)
+
+
+class SimArm:
+    """模拟机械臂：移动耗时 = 距离 / 速度 + 稳定时间，吸取/释放耗时固定，接近/撤离在取放点上方 clearance 处"""
+
+    def __init__(self, speed=150.0, settle=0.05, grip_time=0.3, clearance=40.0, home=(200.0, 0.0, 170.0)):
+        self.speed = speed
+        self.settle = settle
+        self.grip_time = grip_time
+        self.clearance = clearance
+        self.position = list(home)
+
+    def _move(self, point):
+        distance = math.dist(self.position, point)
+        if distance > 0:
+            time.sleep(distance / self.speed + self.settle)
+        self.position = list(point)
+
+    def _above(self, point):
+        return [point[0], point[1], point[2] + self.clearance]
+
+    def carry(self, start, end, mark):
+        self._move(self._above(start))
+        mark('approach_pick')
+        self._move(start)
+        mark('descend_pick')
+        time.sleep(self.grip_time)
+        mark('grip')
+        self._move(self._above(start))
+        mark('lift')
+        self._move(self._above(end))
+        mark('approach_place')
+        self._move(end)
+        mark('descend_place')
+        time.sleep(self.grip_time)
+        mark('release')
+        mark('placed')
+        self._move(self._above(end))
+        mark('retreat')
+
+    def prepare(self, point, mark):
+        self._move(self._above(point))
+        mark('prepare_next')
+
+
+class CarryJob:
+    """一次搬运：placed 在放置完成时置位（可以开始 PLC 握手），done 在整个任务结束时置位"""
+
+    def __init__(self, start, end, next_pick=None):
+        self.start = start
+        self.end = end
+        self.next_pick = next_pick
+        self.placed = threading.Event()
+        self.done = threading.Event()
+        self.timing = {}
+        self.error = None
+        self.submitted_at = time.perf_counter()
+
+
+class MotionExecutor:
+    """在独立线程中按顺序执行搬运任务"""
+
+    def __init__(self, backend, history_size=HISTORY_SIZE):
+        self.backend = backend
+        self.history = deque(maxlen=history_size)  # 最近完成任务的 timing
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name='motion', daemon=True)
+        self._thread.start()
+
+    def submit(self, start, end, next_pick=None):
+        job = CarryJob(start, end, next_pick)
+        self._jobs.put(job)
+        return job
+
+    @staticmethod
+    def _marker(job):
+        """返回 mark(段名)：记录距上一次 mark 的耗时；'placed' 只置位事件"""
+        last = [time.perf_counter()]
+
+        def mark(name):
+            if name == 'placed':
+                job.placed.set()
+                return
+            now = time.perf_counter()
+            job.timing[name] = (now - last[0]) * 1000
+            last[0] = now
+        return mark
+
+    def _loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            try:
+                job.timing['queue_wait'] = (time.perf_counter() - job.submitted_at) * 1000
+                t0 = time.perf_counter()
+                mark = self._marker(job)
+                self.backend.carry(job.start, job.end, mark)
+                job.timing['carry'] = (time.perf_counter() - t0) * 1000
+                if job.next_pick is not None and hasattr(self.backend, 'prepare'):
+                    job.placed.set()
+                    self.backend.prepare(job.next_pick, mark)
+            except Exception as e:
+                job.error = e
+                print(f'❌ 搬运失败：{e}')
+            finally:
+                job.placed.set()
+                job.done.set()
+                self.history.append(job.timing)
+
+    def stats(self):
+        """最近各次搬运各段平均耗时（毫秒）与任务数"""
+        totals = {}
+        for timing in list(self.history):
+            for name, ms in timing.items():
+                totals.setdefault(name, []).append(ms)
+        return {'jobs': len(self.history),
+                'segments_ms': {name: round(sum(v) / len(v), 1) for name, v in totals.items()}}
+
+    def stop(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+
+def _simulate(jobs, speed, ack, pipelined):
+    """模拟 jobs 次搬运 + PLC 握手，返回平均节拍（秒）与执行器统计"""
+    executor = MotionExecutor(SimArm(speed=speed))
+    pick, places = [-65.5, -197.9, 133.6], [[244.0, -6.8 + 30 * i, 141.0] for i in range(jobs)]
+    t0 = time.perf_counter()
+    for i, place in enumerate(places):
+        job = executor.submit(pick, place, next_pick=pick if pipelined and i < jobs - 1 else None)
+        (job.placed if pipelined else job.done).wait()
+        time.sleep(ack)  # PLC 握手
+    executor.stop()
+    return (time.perf_counter() - t0) / jobs, executor.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用模拟机械臂离线测量搬运节拍')
+    parser.add_argument('--jobs', type=int, default=10, help='搬运次数')
+    parser.add_argument('--speed', type=float, default=150.0, help='模拟移动速度（mm/s）')
+    parser.add_argument('--ack', type=float, default=0.5, help='每次 PLC 握手耗时（秒）')
+    args = parser.parse_args()
+
+    for pipelined in (False, True):
+        cycle, stats = _simulate(args.jobs, args.speed, args.ack, pipelined)
+        print(f"{'放置后即握手' if pipelined else '搬运结束后握手'}：平均节拍 {cycle:.2f} 秒/件，"
+              f"各段平均耗时 {stats['segments_ms']}")
+
+
+if __name__ == '__main__':
+    main()
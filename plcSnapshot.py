@@ -0,0 +1,210 @@
+"""
+PLC 数据块快照
+
+主循环原先每轮对每个字段单独调用 PLC.read（每次一个网络往返），且不限速地空转。
+PlcSnapshot 每轮只读取一次整个连续数据块（0~49 字节），再从缓冲区按字段解码：
+- int：S7 INT，2 字节大端有符号（struct '>h'）
+- bool：字节中的某一位
+poll() 按固定间隔限速刷新，并把发生变化的字段通知给订阅者。
+
+PLC 读写只在主线程进行（见 mainself2(1).py），快照不开后台线程，由主循环调用 poll()。
+
+FakePLC 是内存中的假 PLC（接口与 plc_db 相同），用于在没有硬件时测试。
+"""
+import struct
+import time
+
+# 主循环用到的字段：名称 -> (类型, 字节偏移[, 位])
+FIELDS = {
+    'start': ('int', 0),
+    'moveEnd': ('int', 2),
+    'carryStatu': ('int', 18),
+    'maduoStart': ('int', 26),
+    'xNumOne': ('int', 28),
+    'yNumOne': ('int', 30),
+    'zNumOne': ('int', 32),
+    'xNumTwo': ('int', 34),
+    'yNumTwo': ('int', 36),
+    'zNumTwo': ('int', 38),
+    'visual': ('bool', 44, 0),
+    'ranks': ('int', 46),
+    'order': ('int', 48),
+}
+BLOCK_SIZE = 50          # 覆盖以上所有字段的数据块长度（字节）
+POLL_INTERVAL = 0.02     # 默认刷新间隔（秒），即 50 Hz
+
+_INT = struct.Struct('>h')
+
+
+def decode(buffer, kind, offset, bit=0):
+    """从数据块缓冲区中解码一个字段（参数与 plc_db.read 相同）"""
+    if kind == 'int':
+        return _INT.unpack_from(buffer, offset)[0]
+    if kind == 'bool':
+        return bool(buffer[offset] >> bit & 1)
+    raise ValueError(f'不支持的字段类型: {kind}')
+
+
+def _field_reader(plc, size, fields=FIELDS):
+    """逐字段调用 plc.read 后拼成数据块缓冲区（与整块读取结果相同，只是没有减少往返次数）"""
+    def read_fields():
+        buffer = bytearray(size)
+        for kind, offset, *bit in fields.values():
+            value = plc.read(kind, offset, *bit)
+            if kind == 'int':
+                _INT.pack_into(buffer, offset, value)
+            elif value:
+                buffer[offset] |= 1 << bit[0]
+        return buffer
+    return read_fields
+
+
+def _block_reader(plc, size, fields=FIELDS):
+    """
+    找到一次读取整个数据块的方法。plc_db 不在本仓库中，整块读取的接口是假设的：
+    plc.db_read(start, size)，或 snap7 客户端 plc.client.db_read(db_number, start, size)。
+    构造时各试一次：返回长度必须等于 size，且各字段解码结果与逐字段 plc.read 一致，
+    否则（含抛出异常）不使用；都不可用时逐字段读取。
+    运行中整块读取出错或长度不符时同样改为逐字段读取，不再尝试整块读取
+    """
+    read_fields = _field_reader(plc, size, fields)
+    candidates = []
+    if hasattr(plc, 'db_read'):
+        candidates.append(('plc.db_read', lambda: plc.db_read(0, size)))
+    client, db_number = getattr(plc, 'client', None), getattr(plc, 'db_number', None)
+    if client is not None and db_number is not None:
+        candidates.append(('plc.client.db_read', lambda: client.db_read(db_number, 0, size)))
+
+    for name, read in candidates:
+        try:
+            block = bytes(read())
+            if len(block) != size:
+                raise ValueError(f'返回 {len(block)} 字节，应为 {size} 字节')
+            expected = read_fields()
+            for field, (kind, offset, *bit) in fields.items():
+                if decode(block, kind, offset, *bit) != decode(expected, kind, offset, *bit):
+                    raise ValueError(f'字段 {field} 与逐字段读取的值不一致')
+        except Exception as e:
+            print(f'⚠️ {name} 整块读取不可用：{e}')
+            continue
+        return _guarded(name, read, read_fields, size)
+    print('⚠️ 没有可用的整块读取方法，快照退回逐字段读取')
+    return read_fields
+
+
+def _guarded(name, read, read_fields, size):
+    """整块读取出错或长度不符时改为逐字段读取（之后不再尝试整块读取）"""
+    current = [None]
+
+    def read_block():
+        if current[0] is not None:
+            return current[0]()
+        try:
+            block = read()
+            if len(block) == size:
+                return block
+            reason = f'返回 {len(block)} 字节，应为 {size} 字节'
+        except Exception as e:
+            reason = str(e)
+        print(f'⚠️ {name} 整块读取失败（{reason}），改为逐字段读取')
+        current[0] = read_fields
+        return read_fields()
+    return read_block
+
+
+class PlcSnapshot:
+    """
+    数据块快照：poll() 刷新并返回变化的字段，get()/read() 从最近一次快照中解码。
+    subscribe(names, callback) 在字段变化时调用 callback(name, old, new)
+    """
+
+    def __init__(self, plc, interval=POLL_INTERVAL, size=BLOCK_SIZE, fields=FIELDS):
+        self.plc = plc
+        self.interval = interval
+        self.fields = fields
+        self._read_block = _block_reader(plc, size, fields)
+        self._buffer = memoryview(bytes(size))
+        self._values = {}
+        self._subscribers = []
+        self._next_at = time.monotonic()
+        self.refreshed_at = None
+        self.reads = 0
+
+    def subscribe(self, names, callback):
+        names = [names] if isinstance(names, str) else list(names)
+        self._subscribers.append((set(names), callback))
+
+    def refresh(self):
+        """立即读取一次整个数据块，返回 {字段: (旧值, 新值)}（只含变化的字段）"""
+        self._buffer = memoryview(bytes(self._read_block()))
+        self.reads += 1
+        self.refreshed_at = time.time()
+        changed = {}
+        for name, (kind, offset, *bit) in self.fields.items():
+            value = decode(self._buffer, kind, offset, *bit)
+            old = self._values.get(name)
+            if old != value:
+                changed[name] = (old, value)
+                self._values[name] = value
+        for names, callback in self._subscribers:
+            for name in names & changed.keys():
+                callback(name, *changed[name])
+        return changed
+
+    def poll(self):
+        """等到下一个刷新时刻再读取（主循环据此限速），返回变化的字段"""
+        delay = self._next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_at = max(self._next_at, time.monotonic() - self.interval) + self.interval
+        return self.refresh()
+
+    def wait_until(self, predicate, timeout):
+        """按刷新间隔轮询，直到 predicate() 成立（返回 True）或超时（返回 False）"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self.poll()
+            if predicate():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+
+    def get(self, name):
+        return self._values[name]
+
+    def read(self, kind, offset, bit=0):
+        """与 plc_db.read 相同的参数，从快照中解码（不访问 PLC）"""
+        return decode(self._buffer, kind, offset, bit)
+
+
+class FakePLC:
+    """内存中的假 PLC：接口与 plc_db 相同，另有 db_read 整块读取与 set_int/set_bool 便于测试"""
+
+    def __init__(self, size=BLOCK_SIZE):
+        self.memory = bytearray(size)
+        self.reads = 0
+        self.writes = []
+
+    def connect(self):
+        return True
+
+    def db_read(self, start, size):
+        self.reads += 1
+        return bytes(self.memory[start:start + size])
+
+    def read(self, kind, offset, bit=0):
+        self.reads += 1
+        return decode(self.memory, kind, offset, bit)
+
+    def write(self, offset, data):
+        self.writes.append((offset, bytes(data)))
+        self.memory[offset:offset + len(data)] = data
+
+    def set_int(self, offset, value):
+        _INT.pack_into(self.memory, offset, value)
+
+    def set_bool(self, offset, bit, value):
+        if value:
+            self.memory[offset] |= 1 << bit
+        else:
+            self.memory[offset] &= ~(1 << bit) & 0xFF
@@ -1,25 +1,53 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+import time
+_STARTUP_T0 = time.perf_counter()  # 启动耗时统计的起点（尽量早，包含后续导入）
+
+from flask import Flask, Response, g, request, jsonify, send_from_directory, send_file
 import os
+import hmac
 import io
+import json
+import re
 import uuid
+import zipfile
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from PIL import Image
-import importlib
-import pkgutil
 import threading
-import time
-import sys
-import subprocess
-from typing import Dict, List, Optional, Set
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Optional
+
+from inference import InferencePool, InferenceError, PoolBusyError
+from metrics import MetricsRegistry
+from plugins import discover
+from profiler import DEFAULT_INTERVAL, ProfileSession
+from recognizers import RecognizerSpec, discover_recognizers, parse_spec
+from result_store import ResultStore, format_result_text, result_text_name
+from shared_state import SharedState
+from storage import ShardedStore
+
+# 启动各阶段耗时（秒），服务开始接受请求前输出到日志
+STARTUP_PHASES: Dict[str, float] = {}
+_startup_mark = _STARTUP_T0
+
+
+def _mark_startup(phase: str) -> None:
+    """记录从上一个阶段结束到现在的耗时"""
+    global _startup_mark
+    now = time.perf_counter()
+    STARTUP_PHASES[phase] = now - _startup_mark
+    _startup_mark = now
+
+
+_mark_startup('imports')
 
 # 路径配置
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # lab401/
 HTML_DIR = os.path.join(BASE_DIR, 'html')
 HTML_FILES_DIR = os.path.join(HTML_DIR, 'html_files')
 CSS_DIR = os.path.join(HTML_DIR, 'css_files')
-UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
-RESULT_DIR = os.path.join(BASE_DIR, 'result')
+# 上传与结果目录可通过环境变量改到别处（例如基准测试使用临时目录）
+UPLOAD_DIR = os.environ.get('LAB401_UPLOAD_DIR', os.path.join(BASE_DIR, 'uploads'))
+RESULT_DIR = os.environ.get('LAB401_RESULT_DIR', os.path.join(BASE_DIR, 'result'))
+MODEL_DIR = os.path.join(BASE_DIR, 'model')
 PROCESSORS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'processors')
 
 # 确保目录存在
@@ -30,22 +58,185 @@ app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 限制上传文件大小为16MB
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
-# 线程安全的变量和锁
-queue_lock = threading.Lock()
-PROCESSED_FILES: Set[str] = set()
-NEW_FILES_QUEUE: List[str] = []
-LATEST_IMAGE: Optional[str] = None
-LATEST_IMAGE_UPDATED_AT: float = 0.0
-
-# 处理器相关
-PROCESSORS: Dict[str, Dict] = {}
-
 
 def allowed_file(filename: str) -> bool:
     """检查文件是否为允许的类型"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+# 旧版本的已处理文件清单：共享状态中还没有上传记录时导入一次
+MANIFEST_PATH = os.path.join(UPLOAD_DIR, '.manifest')
+MAX_RESULT_WAIT = 30.0  # /result?wait= 的最长等待秒数
+SSE_KEEPALIVE = 15.0  # SSE 空闲时发送心跳的间隔（秒）
+
+# 处理器相关（插件在第一次用到时才导入）
+PROCESSORS: Dict[str, Dict] = {}
+PROCESSORS_LOADED = False
+PROCESSORS_LOCK = threading.Lock()
+
+# 识别后端（recognizers/ 插件）：LAB401_RECOGNIZER 为默认后端，也可写成级联（如 template>yolo）；
+# 请求参数 recognizer=cascade 时使用 LAB401_CASCADE，前一级 softmax 置信度低于阈值时交给下一级；
+# 已放行的画面按 LAB401_CASCADE_AUDIT_RATE 抽检交给最后一级复核，用于估计两级不一致率
+DEFAULT_RECOGNIZER = os.environ.get('LAB401_RECOGNIZER', 'yolo')
+CASCADE = os.environ.get('LAB401_CASCADE', 'lenet>yolo')
+CASCADE_THRESHOLD = float(os.environ.get('LAB401_CASCADE_THRESHOLD', '0.9'))
+CASCADE_AUDIT_RATE = float(os.environ.get('LAB401_CASCADE_AUDIT_RATE', '0.02'))
+DEFAULT_SPEC = parse_spec(DEFAULT_RECOGNIZER, None, CASCADE, CASCADE_THRESHOLD, CASCADE_AUDIT_RATE)
+RECOGNIZERS: Dict[str, Dict] = {}
+RECOGNIZERS_LOCK = threading.Lock()
+
+# 常驻推理进程池（每个进程只加载一次模型）
+# INFER_WORKERS: 推理进程数；INFER_QUEUE_SIZE: 等待队列上限，满了之后上传接口返回 503
+# 微批参数：单次前向推理最多合并的图片数，以及为凑批最多额外等待的秒数
+INFER_WORKERS = int(os.environ.get('LAB401_INFER_WORKERS', '1'))
+INFER_QUEUE_SIZE = int(os.environ.get('LAB401_INFER_QUEUE_SIZE', '64'))
+INFER_MAX_BATCH = int(os.environ.get('LAB401_INFER_MAX_BATCH', '8'))
+INFER_MAX_WAIT = float(os.environ.get('LAB401_INFER_MAX_WAIT', '0.01'))
+BUSY_RETRY_AFTER = 1  # 繁忙时建议客户端重试的间隔（秒）
+DEFAULT_PRIORITY = 10  # 数值越小越优先
+RECOGNIZE_PRIORITY = 0  # /recognize 同步请求优先于普通上传
+RECOGNIZE_TIMEOUT = 30.0  # /recognize 等待推理结果的最长时间（秒）
+# 去重缓存（在每个推理进程内）：容量为 0 时关闭；感知哈希阈值小于 0 时只做精确匹配
+CACHE_CONFIG = {
+    'max_entries': int(os.environ.get('LAB401_CACHE_SIZE', '256')),
+    'ttl': float(os.environ.get('LAB401_CACHE_TTL', '300')),
+    'phash_distance': int(os.environ.get('LAB401_CACHE_PHASH_DISTANCE', '-1'))
+}
+# 快速启动：推理进程在后台预热，服务无需等待模型加载完成即可开始接受上传
+FAST_START = os.environ.get('LAB401_FAST_START', '1') == '1'
+INFERENCE = InferencePool(MODEL_DIR, workers=INFER_WORKERS, queue_size=INFER_QUEUE_SIZE,
+                          timeout=60, max_batch_size=INFER_MAX_BATCH, max_wait=INFER_MAX_WAIT,
+                          cache_config=CACHE_CONFIG, recognizer=DEFAULT_SPEC)
+
+# 文件存储：uploads/ 与 result/ 下按日期分片（YYYYMMDD/），后台线程每 LAB401_STORAGE_INTERVAL 秒整理一次：
+# 超过 LAB401_COMPACT_AFTER_DAYS 天的分片打包为 archive/YYYYMMDD.zip，再按保留天数 / 文件数 / 字节数
+# （LAB401_RETENTION_DAYS / LAB401_RETENTION_MAX_FILES / LAB401_RETENTION_MAX_BYTES，0 表示不限）删除最旧的几天；
+# LAB401_STORAGE_MIGRATE=1 时把旧版本留在根目录的文件逐批移入分片
+RETENTION_DAYS = float(os.environ.get('LAB401_RETENTION_DAYS', '30'))
+RETENTION_MAX_FILES = int(os.environ.get('LAB401_RETENTION_MAX_FILES', '0'))
+RETENTION_MAX_BYTES = int(os.environ.get('LAB401_RETENTION_MAX_BYTES', '0'))
+COMPACT_AFTER_DAYS = float(os.environ.get('LAB401_COMPACT_AFTER_DAYS', '2'))
+STORAGE_INTERVAL = float(os.environ.get('LAB401_STORAGE_INTERVAL', '600'))
+STORAGE_MIGRATE = os.environ.get('LAB401_STORAGE_MIGRATE', '0') == '1'
+# 共享状态中上传登记的条数上限（同时按 RETENTION_DAYS 过期）
+PROCESSED_MAX = int(os.environ.get('LAB401_PROCESSED_MAX', '100000'))
+_STORAGE_OPTIONS = dict(retention_days=RETENTION_DAYS, max_files=RETENTION_MAX_FILES,
+                        max_bytes=RETENTION_MAX_BYTES, compact_after_days=COMPACT_AFTER_DAYS,
+                        migrate=STORAGE_MIGRATE)
+UPLOAD_FILES = ShardedStore(UPLOAD_DIR, allowed_file, **_STORAGE_OPTIONS)
+RESULT_FILES = ShardedStore(RESULT_DIR, lambda name: name.endswith('_result.txt'),
+                            compression=zipfile.ZIP_DEFLATED, **_STORAGE_OPTIONS)
+
+# 结果存储：SQLite 表 + 内存 LRU 缓存；RESULT_TEXT_EXPORT 控制是否同时导出兼容的 _result.txt
+RESULT_DB_PATH = os.path.join(RESULT_DIR, 'results.db')
+RESULT_CACHE_SIZE = int(os.environ.get('LAB401_RESULT_CACHE_SIZE', '256'))
+RESULT_TEXT_EXPORT = os.environ.get('LAB401_RESULT_TEXT_EXPORT', '1') == '1'
+STORE = ResultStore(RESULT_DB_PATH, cache_size=RESULT_CACHE_SIZE, export_dir=RESULT_DIR,
+                    export_path=lambda name: RESULT_FILES.path_for(name, create=True))
+
+# 跨进程共享状态（已登记的上传、结果事件与最新图片），与结果库同一个 SQLite 文件；
+# 多进程部署时其他进程写入的结果最迟 LAB401_SHARED_POLL 秒后被长轮询与 SSE 发现
+SHARED_POLL_INTERVAL = float(os.environ.get('LAB401_SHARED_POLL', '0.25'))
+STATE = SharedState(RESULT_DB_PATH, history=100, poll_interval=SHARED_POLL_INTERVAL)
+
+# 归档线程：上传的图片先在内存中推理，落盘放到后台按提交顺序执行
+ARCHIVER = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+
+# 指标（GET /metrics，Prometheus 文本格式）：每个 Web 进程各自统计。
+# 每个请求带一个追踪 id：沿用请求头 X-Trace-Id（客户端在上传与取结果时带上同一个值），
+# 没有时生成一个；它随推理请求进入队列与推理进程，写入结果记录，并在响应头中返回
+TRACE_HEADER = 'X-Trace-Id'
+_TRACE_ID_RE = re.compile(r'^[0-9A-Za-z._-]{1,64}$')
+_LABEL_RE = re.compile(r'^[0-9A-Za-z_.-]{1,32}$')
+CLIENT_MAX_SERIES = 256  # 客户端上报的 (客户端, 步骤) 组合数上限，避免标签无限增长
+METRICS = MetricsRegistry(prefix='lab401_')
+HTTP_REQUESTS = METRICS.counter('http_requests_total', 'HTTP 请求数', ('endpoint', 'method', 'status'))
+HTTP_LATENCY = METRICS.histogram('http_request_duration_seconds', 'HTTP 请求处理耗时（SSE 只计到开始推送）',
+                                 labels=('endpoint',))
+STAGE_LATENCY = METRICS.histogram(
+    'stage_duration_seconds',
+    '识别链路各阶段耗时：upload_read 读取上传、queue_wait 排队、worker 推理进程往返、decode 解码、'
+    'preprocess 预处理、inference 推理、<后端 id> 各级后端、archive 归档、result_wait 等待结果、end_to_end 入队到入库',
+    labels=('stage',))
+BATCH_SIZE = METRICS.histogram('inference_batch_size', '推理微批大小（0 为命中去重缓存）',
+                               buckets=(0, 1, 2, 4, 8, 16, 32))
+ERRORS = METRICS.counter('errors_total', '错误数（busy 队列已满、inference 推理失败、recognize_timeout、'
+                         'upload、archive、result 读取失败、storage 整理失败）', ('kind',))
+CLIENT_LATENCY = METRICS.histogram('client_stage_duration_seconds',
+                                   '机械臂客户端上报的分拣周期各步骤耗时（POST /client_metrics）',
+                                   labels=('client', 'stage'), max_series=CLIENT_MAX_SERIES)
+METRICS.gauge('inference_queue_depth', '等待推理的请求数', lambda: INFERENCE.qsize())
+METRICS.gauge('inference_in_flight', '已交给推理进程、尚未返回的请求数', lambda: INFERENCE.in_flight)
+METRICS.gauge('model_load_seconds', '推理进程最近一次启动（导入、加载并预热模型）的耗时',
+              lambda: {(str(i),): w.load_seconds for i, w in enumerate(INFERENCE.workers)},
+              labels=('worker',))
+METRICS.gauge('inference_worker_restarts_total', '推理进程重启次数',
+              lambda: sum(w.restarts for w in INFERENCE.workers), kind='counter')
+METRICS.gauge('cache_hits_total', '缓存命中次数（recognition 去重缓存、result 结果 LRU 缓存）',
+              lambda: {('recognition',): INFERENCE.cache_hits, ('result',): STORE.cache_hits},
+              labels=('cache',), kind='counter')
+METRICS.gauge('cache_misses_total', '缓存未命中次数',
+              lambda: {('recognition',): INFERENCE.cache_misses, ('result',): STORE.cache_misses},
+              labels=('cache',), kind='counter')
+METRICS.gauge('uploads_registered', '共享状态中登记的上传数', lambda: STATE.upload_count())
+
+# 采样分析（POST /admin/profile 开启）：Web 进程与推理进程各自采样调用栈，写出折叠栈，
+# 推理进程另可写出 torch profiler 跟踪；文件保存在 LAB401_PROFILE_DIR。
+# 管理接口需要请求头 X-Admin-Token 与 LAB401_ADMIN_TOKEN 一致；未设置令牌时只接受本机请求
+PROFILE_DIR = os.environ.get('LAB401_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILE_MAX_SECONDS = float(os.environ.get('LAB401_PROFILE_MAX_SECONDS', '120'))
+ADMIN_TOKEN = os.environ.get('LAB401_ADMIN_TOKEN', '')
+PROFILE: Optional[ProfileSession] = None
+PROFILE_LOCK = threading.Lock()
+_mark_startup('init_state')
+
+
+def _trace_id() -> Optional[str]:
+    return getattr(g, 'trace_id', None)
+
+
+@app.before_request
+def _start_trace():
+    trace_id = request.headers.get(TRACE_HEADER, '')
+    g.trace_id = trace_id if _TRACE_ID_RE.match(trace_id) else uuid.uuid4().hex[:16]
+    g.started = time.perf_counter()
+
+
+@app.after_request
+def _finish_trace(response):
+    """响应头带回追踪 id，并记录请求数与耗时（按路由模板统计，不按具体 URL）"""
+    if 'trace_id' in g:
+        response.headers[TRACE_HEADER] = g.trace_id
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        HTTP_LATENCY.observe(time.perf_counter() - g.started, endpoint=endpoint)
+    return response
+
+
+def _new_upload_name(original: str) -> str:
+    """生成唯一文件名避免冲突：<时间戳>_<8位随机串>_<原文件名>"""
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    unique_id = str(uuid.uuid4())[:8]
+    filename = secure_filename(original)
+    name, ext = os.path.splitext(filename)
+    return f"{timestamp}_{unique_id}_{name}{ext}"
+
+
+def _busy_response():
+    """推理队列已满时的响应：503 + Retry-After"""
+    ERRORS.inc(kind='busy')
+    resp = jsonify({
+        'success': False,
+        'busy': True,
+        'message': '服务繁忙，请稍后重试',
+        'retry_after': BUSY_RETRY_AFTER,
+        'queue_size': INFERENCE.qsize()
+    })
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(BUSY_RETRY_AFTER)
+    return resp
+
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """处理文件上传"""
@@ -57,31 +248,45 @@ def upload_file():
         return jsonify({'success': False, 'message': '未选择文件'}), 400
     
     if file and allowed_file(file.filename):
+        # 队列已满时直接拒绝
+        if INFERENCE.full():
+            return _busy_response()
+
         try:
-            # 生成唯一文件名避免冲突
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            unique_id = str(uuid.uuid4())[:8]
-            filename = secure_filename(file.filename)
-            name, ext = os.path.splitext(filename)
-            new_filename = f"{timestamp}_{unique_id}_{name}{ext}"
-            
-            file_path = os.path.join(UPLOAD_DIR, new_filename)
-            file.save(file_path)
+            priority = int(request.form.get('priority', DEFAULT_PRIORITY))
+        except ValueError:
+            return jsonify({'success': False, 'message': '参数 priority 必须为整数'}), 400
+        try:
+            recognizer = _request_recognizer()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        try:
+            new_filename = _new_upload_name(file.filename)
+            # 图片字节留在内存中直接交给推理进程解码，落盘作为后台归档步骤
+            t0 = time.perf_counter()
+            image_bytes = file.read()
+            STAGE_LATENCY.observe(time.perf_counter() - t0, stage='upload_read')
             
-            # 添加到处理队列
-            with queue_lock:
-                if new_filename not in PROCESSED_FILES:
-                    NEW_FILES_QUEUE.append(new_filename)
-                    PROCESSED_FILES.add(new_filename)
+            # 添加到处理队列（文件名登记在共享状态中，多个工作进程之间不会重复处理）
+            if STATE.add_upload(new_filename):
+                try:
+                    _submit_result_for(new_filename, priority, image=image_bytes,
+                                       recognizer=recognizer, trace_id=_trace_id())
+                except PoolBusyError:
+                    STATE.discard_upload(new_filename)
+                    return _busy_response()
             
             return jsonify({
                 'success': True,
                 'message': '文件上传成功',
                 'filename': new_filename,
-                'url': f"/uploads/{new_filename}"
+                'url': f"/uploads/{new_filename}",
+                'trace_id': _trace_id()
             })
         except Exception as e:
-            app.logger.error(f"文件上传失败: {str(e)}")
+            ERRORS.inc(kind='upload')
+            app.logger.error(f"[{_trace_id()}] 文件上传失败: {str(e)}")
             return jsonify({'success': False, 'message': f'上传失败：{str(e)}'}), 500
     
     return jsonify({
@@ -90,108 +295,331 @@ def upload_file():
     }), 400
 
 
+def _read_recognize_image():
+    """
+    从请求中取出待识别图片，返回 (图片, 原文件名)：
+    - multipart 字段 file，或 Content-Type 为 image/* 的请求体：编码后的图片字节
+    - Content-Type 为 application/octet-stream：原始 BGR 像素，
+      需附带参数 shape=高,宽,3（dtype 仅支持 uint8）
+    出错时抛出 ValueError
+    """
+    if 'file' in request.files:
+        file = request.files['file']
+        if file.filename == '' or not allowed_file(file.filename):
+            raise ValueError(f'不支持的文件格式，允许的格式：{ALLOWED_EXTENSIONS}')
+        return file.read(), file.filename
+
+    data = request.get_data()
+    if not data:
+        raise ValueError('请求中未包含图片')
+
+    if request.mimetype == 'application/octet-stream':
+        import numpy as np
+        try:
+            shape = tuple(int(v) for v in request.args.get('shape', '').split(','))
+        except ValueError:
+            raise ValueError('参数 shape 格式应为 高,宽,3')
+        if len(shape) != 3 or shape[2] != 3 or int(np.prod(shape)) != len(data):
+            raise ValueError(f'shape={shape} 应为 高,宽,3 且与原始数据长度 {len(data)} 一致')
+        if request.args.get('dtype', 'uint8') != 'uint8':
+            raise ValueError('原始数据仅支持 dtype=uint8')
+        return np.frombuffer(data, dtype=np.uint8).reshape(shape), 'raw.jpg'
+
+    if request.mimetype.startswith('image/'):
+        ext = request.mimetype.split('/', 1)[1]
+        return data, f"recognize.{'jpg' if ext == 'jpeg' else ext}"
+
+    raise ValueError('不支持的 Content-Type，请使用 multipart 字段 file、image/* 或 application/octet-stream')
+
+
+def _archive_upload(filename: str, image) -> None:
+    """后台归档：把内存中的图片写入 uploads 的当日分片（在 ARCHIVER 线程中执行）"""
+    file_path = UPLOAD_FILES.path_for(filename, create=True)
+    t0 = time.perf_counter()
+    try:
+        if isinstance(image, (bytes, bytearray)):
+            with open(file_path, 'wb') as f:
+                f.write(image)
+        else:
+            import cv2
+            cv2.imwrite(file_path, image)
+        STATE.add_upload(filename)
+        STAGE_LATENCY.observe(time.perf_counter() - t0, stage='archive')
+    except Exception as e:
+        ERRORS.inc(kind='archive')
+        app.logger.error(f"归档图片失败: {filename}: {str(e)}")
+
+
+@app.route('/recognize', methods=['POST'])
+def recognize():
+    """
+    同步识别：上传图片并在同一次请求中返回结构化识别结果
+
+    使用已预热的推理进程立即推理（优先于普通上传），
+    返回数字、置信度、分类、各阶段耗时与模型版本；图片归档在后台完成
+    """
+    started = time.perf_counter()
+    try:
+        image, original_name = _read_recognize_image()
+        recognizer = _request_recognizer()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    new_filename = _new_upload_name(original_name)
+    read_ms = (time.perf_counter() - started) * 1000
+    STAGE_LATENCY.observe(read_ms / 1000, stage='upload_read')
+    try:
+        future = _submit_result_for(new_filename, RECOGNIZE_PRIORITY, image=image,
+                                    recognizer=recognizer, trace_id=_trace_id())
+    except PoolBusyError:
+        return _busy_response()
+
+    try:
+        recognition = future.result(timeout=RECOGNIZE_TIMEOUT)
+    except FutureTimeout:
+        ERRORS.inc(kind='recognize_timeout')
+        return jsonify({'success': False, 'message': f'识别超时（{RECOGNIZE_TIMEOUT:.0f}秒）'}), 504
+    except InferenceError as e:
+        app.logger.error(f"[{_trace_id()}] 识别失败: {new_filename}: {e}")
+        return jsonify({'success': False, 'message': f'识别失败: {e}'}), 500
+
+    timing = dict(recognition.timing, read_ms=read_ms,
+                  total_ms=(time.perf_counter() - started) * 1000)
+    return jsonify({
+        'success': True,
+        'filename': new_filename,
+        'url': f"/uploads/{new_filename}",
+        'digit': recognition.digit,
+        'confidence': recognition.confidence,
+        'category': recognition.category,
+        'timing': {k: round(v, 3) for k, v in timing.items()},
+        'model_version': recognition.model_version,
+        'recognizer': recognition.recognizer,
+        'cascade': recognition.cascade,
+        'cached': recognition.cached,
+        'trace_id': _trace_id()
+    })
+
+
 def load_processors() -> None:
     """加载所有处理器插件"""
-    global PROCESSORS
+    global PROCESSORS, PROCESSORS_LOADED
     PROCESSORS.clear()
+    PROCESSORS_LOADED = True
     
     if not os.path.isdir(PROCESSORS_DIR):
         app.logger.warning(f"处理器目录不存在: {PROCESSORS_DIR}")
         return
-        
-    for finder, name, ispkg in pkgutil.iter_modules([PROCESSORS_DIR]):
-        try:
-            module = importlib.import_module(f'processors.{name}')
-            meta = getattr(module, 'PROCESSOR', None)
-            
-            if meta and all(k in meta for k in ('id', 'label', 'process')):
-                PROCESSORS[meta['id']] = meta
-                app.logger.info(f"加载处理器成功: {meta['id']}")
-            else:
-                app.logger.warning(f"处理器 {name} 缺少必要属性")
-        except Exception as e:
-            app.logger.error(f"加载处理器 {name} 失败: {e}")
 
+    PROCESSORS.update(discover(PROCESSORS_DIR, 'processors', 'PROCESSOR',
+                               ('id', 'label', 'process'), app.logger))
 
-def _ensure_result_for(filename: str) -> None:
-    """确保处理结果存在"""
-    base, _ = os.path.splitext(filename)
-    result_name = f"{base}_result.txt"
-    result_path = os.path.join(RESULT_DIR, result_name)
-    
-    if os.path.exists(result_path):
-        return
-        
-    src_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(src_path):
-        app.logger.warning(f"源文件不存在: {src_path}")
-        return
-        
-    algo_path = os.path.join(BASE_DIR, 'model', 'getShapeVideo2.py')
-    if not os.path.exists(algo_path):
-        app.logger.error(f"算法脚本不存在: {algo_path}")
+
+def ensure_processors() -> Dict[str, Dict]:
+    """首次使用时加载处理器插件（插件会导入 PIL 等较重的模块，不放在启动路径上）"""
+    if not PROCESSORS_LOADED:
+        with PROCESSORS_LOCK:
+            if not PROCESSORS_LOADED:
+                load_processors()
+    return PROCESSORS
+
+
+def ensure_recognizers() -> Dict[str, Dict]:
+    """首次使用时发现识别后端插件（只读取元数据，模型在推理进程中加载）"""
+    if not RECOGNIZERS:
+        with RECOGNIZERS_LOCK:
+            if not RECOGNIZERS:
+                RECOGNIZERS.update(discover_recognizers(app.logger))
+    return RECOGNIZERS
+
+
+def _request_recognizer() -> Optional[RecognizerSpec]:
+    """
+    请求参数 recognizer（后端 id、a>b 形式的级联或 cascade）与可选的 threshold；
+    未指定时返回 None，使用默认后端。参数无效时抛出 ValueError
+    """
+    text = request.values.get('recognizer')
+    if not text:
+        return None
+    try:
+        threshold = float(request.values.get('threshold', CASCADE_THRESHOLD))
+    except ValueError:
+        raise ValueError('参数 threshold 必须为数字')
+    return parse_spec(text, ensure_recognizers(), CASCADE, threshold, CASCADE_AUDIT_RATE)
+
+
+def _submit_result_for(filename: str, priority: int = DEFAULT_PRIORITY,
+                       image=None, recognizer: Optional[RecognizerSpec] = None,
+                       trace_id: Optional[str] = None) -> Optional[Future]:
+    """
+    把图片加入推理队列；结果已存在或源文件缺失时返回 None。
+    队列已满时抛出 PoolBusyError
+
+    传入 image（内存中的图片字节或 BGR 数组）时直接用它推理，
+    不再从磁盘读回；图片由 ARCHIVER 线程异步写入 uploads；
+    recognizer 为 None 时使用默认识别后端；trace_id 随请求传到推理进程并写入结果记录
+    """
+    if STORE.contains(filename):
+        return None
+
+    if image is None:
+        src_path = UPLOAD_FILES.locate(filename)
+        if src_path is None:
+            app.logger.warning(f"源文件不存在: {filename}")
+            return None
+        source = os.path.abspath(src_path)
+    else:
+        source = image
+
+    created_at = time.time()
+    future = INFERENCE.put(source, None, priority, recognizer, trace_id)
+    if image is not None:
+        ARCHIVER.submit(_archive_upload, filename, image)
+    # 结果入库在推理完成时立即进行；完成通知排到 ARCHIVER 线程，保证推送事件时图片已经落盘
+    future.add_done_callback(lambda f: _record_result(filename, created_at, f, trace_id))
+    future.add_done_callback(lambda f: ARCHIVER.submit(_on_result_done, filename, f, trace_id))
+    return future
+
+
+def _observe_recognition(recognition, created_at: float, finished_at: float) -> None:
+    """按阶段记录一次识别的耗时（timing 中 *_ms 的各项）与批大小"""
+    for key, value in recognition.timing.items():
+        if key.endswith('_ms'):
+            STAGE_LATENCY.observe(value / 1000, stage=key[:-3])
+    if 'batch_size' in recognition.timing:
+        BATCH_SIZE.observe(recognition.timing['batch_size'])
+    STAGE_LATENCY.observe(finished_at - created_at, stage='end_to_end')
+
+
+def _record_result(filename: str, created_at: float, future: Future,
+                   trace_id: Optional[str] = None) -> None:
+    """推理完成回调：把识别结果写入结果存储"""
+    if future.exception() is not None:
         return
-        
+    recognition = future.result()
+    finished_at = time.time()
+    _observe_recognition(recognition, created_at, finished_at)
     try:
-        cmd = [
-            sys.executable, 
-            algo_path, 
-            '--input', os.path.abspath(src_path), 
-            '--output', os.path.abspath(result_path)
-        ]
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=60
-        )
-        
-        if result.returncode != 0:
-            app.logger.error(f"算法执行失败: {result.stderr}")
-            
-    except subprocess.TimeoutExpired:
-        app.logger.error(f"算法执行超时: {filename}")
+        STORE.put({
+            'filename': filename,
+            'digit': recognition.digit,
+            'confidence': recognition.confidence,
+            'category': recognition.category,
+            'created_at': created_at,
+            'finished_at': finished_at,
+            'timing': recognition.timing,
+            'model_version': recognition.model_version,
+            'recognizer': recognition.recognizer,
+            'trace_id': trace_id
+        })
     except Exception as e:
-        app.logger.error(f"处理文件 {filename} 时出错: {str(e)}")
+        app.logger.error(f"[{trace_id}] 保存识别结果失败: {filename}: {str(e)}")
 
 
-def _background_watch() -> None:
-    """后台监控线程，处理新上传的文件"""
-    global LATEST_IMAGE, LATEST_IMAGE_UPDATED_AT
-    
-    while True:
+def _on_result_done(filename: str, future: Future, trace_id: Optional[str] = None) -> None:
+    """推理完成回调：记录错误、导出文本、发布结果事件（即更新最新图片）并通知等待中的客户端"""
+
+    error = future.exception()
+    if PROFILE is not None:
+        PROFILE.note_request()
+    if error is not None:
+        ERRORS.inc(kind='inference')
+    if isinstance(error, InferenceError):
+        app.logger.error(f"[{trace_id}] 算法执行失败: {filename}: {error}")
+    elif error is not None:
+        app.logger.error(f"[{trace_id}] 处理文件 {filename} 时出错: {str(error)}")
+
+    file_path = UPLOAD_FILES.path_for(filename)
+    try:
+        record = STORE.get(filename)
+        if record is not None and RESULT_TEXT_EXPORT:
+            STORE.export_text(record)
+        event = _result_payload(record) if record is not None else {'ready': False}
+    except Exception as e:
+        app.logger.error(f"读取识别结果失败: {str(e)}")
+        event = {'ready': False}
+    try:
+        image_updated_at = os.path.getmtime(file_path)
+    except Exception:
+        image_updated_at = time.time()
+
+    event.update({
+        'image': filename,
+        'url': f"/uploads/{filename}",
+        'image_updated_at': image_updated_at
+    })
+    try:
+        STATE.publish(event)
+    except Exception as e:
+        app.logger.error(f"发布结果事件失败: {filename}: {str(e)}")
+        STATE.notify()
+
+
+# 存储整理：打包旧分片、按保留策略删除，并裁剪共享状态中的上传登记
+STORAGE_STATS: Dict = {}
+_STORAGE_THREAD: Optional[threading.Thread] = None
+
+
+def run_storage_maintenance() -> Dict:
+    """执行一次整理（多个工作进程同时调用时只有持有锁文件的进程实际整理）"""
+    for name, store in (('uploads', UPLOAD_FILES), ('result', RESULT_FILES)):
         try:
-            # 处理队列中的新文件
-            with queue_lock:
-                files_to_process = NEW_FILES_QUEUE.copy()
-                NEW_FILES_QUEUE.clear()
-            
-            for filename in files_to_process:
-                _ensure_result_for(filename)
-                file_path = os.path.join(UPLOAD_DIR, filename)
-                
-                with queue_lock:
-                    LATEST_IMAGE = filename
-                    try:
-                        LATEST_IMAGE_UPDATED_AT = os.path.getmtime(file_path)
-                    except Exception:
-                        LATEST_IMAGE_UPDATED_AT = time.time()
-            
-            time.sleep(1)
+            STORAGE_STATS[name] = store.enforce()
         except Exception as e:
-            app.logger.error(f"后台监控线程出错: {str(e)}")
-            time.sleep(2)
+            ERRORS.inc(kind='storage')
+            app.logger.error(f"整理 {name} 失败: {str(e)}")
+    older_than = time.time() - RETENTION_DAYS * 86400 if RETENTION_DAYS else None
+    if older_than is not None:
+        try:
+            STORAGE_STATS['results'] = {'pruned': STORE.prune(older_than), 'count': STORE.count()}
+        except Exception as e:
+            ERRORS.inc(kind='storage')
+            app.logger.error(f"裁剪结果库失败: {str(e)}")
+    try:
+        STORAGE_STATS['processed'] = {
+            'pruned': STATE.prune_uploads(older_than, keep=PROCESSED_MAX),
+            'count': STATE.upload_count()
+        }
+    except Exception as e:
+        app.logger.error(f"裁剪上传登记失败: {str(e)}")
+    STORAGE_STATS['finished_at'] = time.time()
+    return STORAGE_STATS
+
+
+def _storage_loop() -> None:
+    while True:
+        run_storage_maintenance()
+        time.sleep(STORAGE_INTERVAL)
+
+
+def start_storage_maintenance() -> None:
+    """启动后台整理线程（每个进程一次；LAB401_STORAGE_INTERVAL <= 0 时不启动）"""
+    global _STORAGE_THREAD
+    if STORAGE_INTERVAL <= 0 or _STORAGE_THREAD is not None:
+        return
+    _STORAGE_THREAD = threading.Thread(target=_storage_loop, name='storage', daemon=True)
+    _STORAGE_THREAD.start()
 
 
 # 初始化已处理文件集合
 def init_processed_files() -> None:
-    """初始化已处理文件集合"""
+    """
+    初始化已处理文件集合
+
+    上传文件名登记在共享状态中，正常启动只需统计数量；共享状态为空时（首次升级）
+    导入旧的 uploads/.manifest 清单，清单也不存在时扫描一次 uploads 目录。
+    多个工作进程同时启动时重复导入是幂等的
+    """
     try:
-        for name in os.listdir(UPLOAD_DIR):
-            file_path = os.path.join(UPLOAD_DIR, name)
-            if os.path.isfile(file_path) and allowed_file(name):
-                PROCESSED_FILES.add(name)
-        app.logger.info(f"初始化已处理文件数量: {len(PROCESSED_FILES)}")
+        if STATE.upload_count() == 0:
+            if os.path.exists(MANIFEST_PATH):
+                with open(MANIFEST_PATH, encoding='utf-8') as f:
+                    names = [line.strip() for line in f if line.strip()]
+            else:
+                with os.scandir(UPLOAD_DIR) as entries:
+                    names = sorted(e.name for e in entries if e.is_file() and allowed_file(e.name))
+            STATE.add_uploads(names)
+        app.logger.info(f"初始化已处理文件数量: {STATE.upload_count()}")
     except Exception as e:
         app.logger.error(f"初始化已处理文件集合失败: {str(e)}")
 
@@ -207,9 +635,20 @@ def serve_css(path):
     return send_from_directory(CSS_DIR, path)
 
 
+def _send_upload(filename: str, as_attachment: bool = False):
+    """发送上传目录中的文件：分片或根目录中的文件直接发送，已打包的从归档中读取；都没有时返回 None"""
+    file_path = UPLOAD_FILES.locate(filename)
+    if file_path is not None:
+        return send_from_directory(os.path.dirname(file_path), filename, as_attachment=as_attachment)
+    data = UPLOAD_FILES.read_archived(filename)
+    if data is not None:
+        return send_file(io.BytesIO(data), download_name=filename, as_attachment=as_attachment)
+    return None
+
+
 @app.route('/uploads/<path:path>')
 def serve_uploads(path):
-    return send_from_directory(UPLOAD_DIR, path)
+    return _send_upload(path) or send_from_directory(UPLOAD_DIR, path)
 
 
 @app.route('/assets/<path:path>')
@@ -222,52 +661,274 @@ def serve_assets(path):
 # API路由
 @app.route('/latest_image', methods=['GET'])
 def latest_image():
-    """获取最新上传的图片"""
-    with queue_lock:
-        fname = LATEST_IMAGE
-        updated_at = LATEST_IMAGE_UPDATED_AT
-        
-    if not fname:
+    """获取最新上传的图片（即最近一条结果事件中的图片，所有工作进程共享）"""
+    latest = STATE.latest_event()
+    if latest is None:
         return jsonify({'success': True, 'ready': False})
-        
+
+    event = latest[1]
     return jsonify({
         'success': True, 
         'ready': True, 
-        'filename': fname, 
-        'url': f"/uploads/{fname}", 
-        'updated_at': updated_at
+        'filename': event['image'], 
+        'url': event['url'], 
+        'updated_at': event['image_updated_at']
     })
 
 
+def _result_payload(record: Dict) -> Dict:
+    """结构化结果 + 兼容旧客户端的 content 文本"""
+    return {
+        'ready': True,
+        'filename': result_text_name(record['filename']),
+        'content': format_result_text(record),
+        'updated_at': record['finished_at'],
+        'digit': record['digit'],
+        'confidence': record['confidence'],
+        'category': record['category'],
+        'created_at': record['created_at'],
+        'latency_ms': record['latency_ms'],
+        'timing': record['timing'],
+        'model_version': record['model_version'],
+        'recognizer': record.get('recognizer'),
+        'trace_id': record.get('trace_id')
+    }
+
+
+def _read_result(filename: str) -> Optional[Dict]:
+    """
+    读取识别结果；尚未生成时返回 None，读取失败时抛出异常。
+    结果存储中没有时回退到旧版本留下的 `<base>_result.txt` 文本文件
+    """
+    record = STORE.get(filename)
+    if record is not None:
+        return _result_payload(record)
+
+    result_path = RESULT_FILES.locate(result_text_name(filename))
+    if result_path is None:
+        return None
+    with open(result_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return {
+        'ready': True,
+        'filename': os.path.basename(result_path),
+        'content': content,
+        'updated_at': os.path.getmtime(result_path)
+    }
+
+
 @app.route('/result', methods=['GET'])
 def get_result():
-    """获取处理结果"""
+    """
+    获取处理结果
+
+    可选参数 wait（秒）：结果尚未生成时挂起等待（长轮询），
+    结果一旦写出立即返回，最长等待 MAX_RESULT_WAIT 秒
+    """
     filename = request.args.get('filename')
     if not filename:
         return jsonify({'success': False, 'message': '缺少参数: filename'}), 400
 
-    base, _ = os.path.splitext(filename)
-    result_name = f"{base}_result.txt"
-    result_path = os.path.join(RESULT_DIR, result_name)
-
-    if not os.path.exists(result_path):
-        return jsonify({'success': True, 'ready': False})
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), MAX_RESULT_WAIT)
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数 wait 必须为数字'}), 400
 
     try:
-        with open(result_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        mtime = os.path.getmtime(result_path)
-        return jsonify({
-            'success': True,
-            'ready': True,
-            'filename': result_name,
-            'content': content,
-            'updated_at': mtime
-        })
+        result = _read_result(filename)
+        if result is None and wait > 0:
+            t0 = time.perf_counter()
+            STATE.wait_until(lambda: STORE.contains(filename), wait)
+            STAGE_LATENCY.observe(time.perf_counter() - t0, stage='result_wait')
+            result = _read_result(filename)
     except Exception as e:
-        app.logger.error(f"读取结果文件失败: {str(e)}")
+        ERRORS.inc(kind='result')
+        app.logger.error(f"[{_trace_id()}] 读取结果失败: {str(e)}")
         return jsonify({'success': False, 'message': f'读取结果失败: {str(e)}'}), 500
 
+    if result is None:
+        return jsonify({'success': True, 'ready': False})
+    return jsonify(dict(result, success=True))
+
+
+@app.route('/results', methods=['GET'])
+def list_results():
+    """按完成时间范围查询识别结果：since / until 为 Unix 时间戳，limit 默认 100（最多 1000）"""
+    try:
+        since = float(request.args['since']) if 'since' in request.args else None
+        until = float(request.args['until']) if 'until' in request.args else None
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'success': False, 'message': '参数 since/until/limit 格式错误'}), 400
+
+    records = STORE.query(since, until, limit)
+    return jsonify({
+        'success': True,
+        'count': len(records),
+        'results': [_result_payload(r) for r in records]
+    })
+
+
+@app.route('/events', methods=['GET'])
+def result_events():
+    """
+    结果推送（Server-Sent Events）
+
+    每当一张图片处理完成就推送一条 result 事件（包含图片地址与结果文本）；
+    断线重连时根据 Last-Event-ID 补发错过的事件
+    """
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID') or request.args.get('since', -1))
+    except ValueError:
+        last_seq = -1
+
+    def stream():
+        nonlocal last_seq
+        yield 'retry: 2000\n\n'
+        if last_seq < 0:
+            # 新连接只推送最近一条，和页面首次打开时的展示保持一致
+            last_seq = max(STATE.last_seq() - 1, 0)
+        while True:
+            STATE.wait_until(lambda: STATE.last_seq() > last_seq, SSE_KEEPALIVE)
+            events = STATE.events_since(last_seq)
+
+            if not events:
+                yield ': ping\n\n'
+                continue
+            for seq, event in events:
+                last_seq = seq
+                yield f"id: {seq}\nevent: result\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """去重缓存命中情况"""
+    return jsonify(dict(INFERENCE.cache_stats(), success=True, config=CACHE_CONFIG))
+
+
+@app.route('/cascade_stats', methods=['GET'])
+def cascade_stats():
+    """级联各阶段的放行/升级次数、置信度与单张耗时直方图，以及抽检不一致率"""
+    return jsonify({
+        'success': True,
+        'threshold': CASCADE_THRESHOLD,
+        'audit_rate': CASCADE_AUDIT_RATE,
+        'cascades': INFERENCE.cascade_stats()
+    })
+
+
+@app.route('/storage_stats', methods=['GET'])
+def storage_stats():
+    """uploads/ 与 result/ 的占用（文件数、字节数、分片与归档数）及最近一次整理的结果"""
+    return jsonify({
+        'success': True,
+        'retention': {'days': RETENTION_DAYS, 'max_files': RETENTION_MAX_FILES,
+                      'max_bytes': RETENTION_MAX_BYTES, 'compact_after_days': COMPACT_AFTER_DAYS},
+        'usage': {'uploads': UPLOAD_FILES.usage(), 'result': RESULT_FILES.usage()},
+        'last_run': STORAGE_STATS
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的指标（本进程的统计）"""
+    return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/client_metrics', methods=['POST'])
+def client_metrics():
+    """
+    机械臂客户端上报一次分拣周期的各步骤耗时，计入 lab401_client_stage_duration_seconds：
+    {"client": "arm-1", "trace_id": "...", "timing": {"capture_ms": 35.2, "recognize_ms": 180.4, ...}}
+    只接受以 _ms 结尾的数值项；client 与步骤名限字母、数字、_.-（最长 32）
+    """
+    data = request.get_json(silent=True) or {}
+    timing = data.get('timing')
+    client = str(data.get('client') or 'default')
+    if not isinstance(timing, dict) or not _LABEL_RE.match(client):
+        return jsonify({'success': False, 'message': '参数格式应为 {"client": 名称, "timing": {"<步骤>_ms": 毫秒}}'}), 400
+
+    observed = 0
+    for key, value in timing.items():
+        stage = key[:-3] if isinstance(key, str) and key.endswith('_ms') else ''
+        if not _LABEL_RE.match(stage) or isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or value < 0:
+            continue
+        CLIENT_LATENCY.observe(value / 1000, client=client, stage=stage)
+        observed += 1
+    return jsonify({'success': True, 'observed': observed, 'trace_id': data.get('trace_id')})
+
+
+def _admin_allowed() -> bool:
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+def _profile_status() -> Dict:
+    return {
+        'success': True,
+        'session': PROFILE.status() if PROFILE is not None else None,
+        'worker_files': [f for w in INFERENCE.workers for f in w.profile_files],
+        'directory': PROFILE_DIR
+    }
+
+
+def _stop_worker_profiling(session: ProfileSession) -> None:
+    INFERENCE.control(('profile', {'action': 'stop'}))
+    app.logger.info(f"采样分析结束: {', '.join(session.files)}")
+
+
+@app.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def admin_profile():
+    """
+    采样分析：GET 查看状态，DELETE 立即结束，POST 开启，JSON 参数：
+    - duration：持续秒数（默认 10，最长 LAB401_PROFILE_MAX_SECONDS）
+    - requests：记满这么多次识别后提前结束（可选）
+    - interval：采样间隔秒数（默认 0.01）；idle：是否包含阻塞等待中的线程（默认否）
+    - torch：推理进程是否同时记录 torch profiler 跟踪（默认是）
+    """
+    global PROFILE
+    if not _admin_allowed():
+        return jsonify({'success': False, 'message': '无权访问管理接口'}), 403
+    if request.method == 'GET':
+        return jsonify(_profile_status())
+    if request.method == 'DELETE':
+        if PROFILE is not None:
+            PROFILE.finish()
+        return jsonify(_profile_status())
+
+    data = request.get_json(silent=True) or {}
+    try:
+        duration = min(float(data.get('duration', 10)), PROFILE_MAX_SECONDS)
+        max_requests = int(data['requests']) if data.get('requests') else None
+        interval = max(float(data.get('interval', DEFAULT_INTERVAL)), 0.001)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '参数 duration/requests/interval 必须为数字'}), 400
+    if duration <= 0:
+        return jsonify({'success': False, 'message': '参数 duration 必须大于 0'}), 400
+
+    with PROFILE_LOCK:
+        if PROFILE is not None and PROFILE.active:
+            return jsonify(dict(_profile_status(), success=False, message='已有采样分析在进行')), 409
+        tag = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.getpid()}"
+        idle = bool(data.get('idle', False))
+        PROFILE = ProfileSession(PROFILE_DIR, f'{tag}_web', duration=duration, requests=max_requests,
+                                 interval=interval, include_idle=idle,
+                                 on_finish=_stop_worker_profiling).start()
+        workers = INFERENCE.control(('profile', {
+            'action': 'start', 'directory': os.path.abspath(PROFILE_DIR), 'tag': tag,
+            'interval': interval, 'idle': idle, 'torch': bool(data.get('torch', True)),
+            'max_seconds': duration + 5
+        }))
+    app.logger.info(f"采样分析开始: {tag}（{duration:.0f} 秒，推理进程 {workers} 个）")
+    return jsonify(dict(_profile_status(), workers=workers))
+
 
 @app.route('/processors', methods=['GET'])
 def list_processors():
@@ -279,7 +940,32 @@ def list_processors():
                 'id': p['id'],
                 'label': p.get('label', p['id']),
                 'description': p.get('description', '')
-            } for p in PROCESSORS.values()
+            } for p in ensure_processors().values()
+        ]
+    })
+
+
+@app.route('/recognizers', methods=['GET'])
+def list_recognizers():
+    """
+    列出可用的识别后端（按预估耗时排序；预估耗时与准确率均为后端声明的估计值，
+    accuracy_estimated 恒为 True）以及默认后端和默认级联
+    """
+    return jsonify({
+        'success': True,
+        'default': DEFAULT_SPEC.name,
+        'cascade': CASCADE,
+        'cascade_threshold': CASCADE_THRESHOLD,
+        'cascade_audit_rate': CASCADE_AUDIT_RATE,
+        'recognizers': [
+            {
+                'id': r['id'],
+                'label': r.get('label', r['id']),
+                'description': r.get('description', ''),
+                'cost': r['cost'],
+                'accuracy': r['accuracy'],
+                'accuracy_estimated': True
+            } for r in sorted(ensure_recognizers().values(), key=lambda r: r['cost'])
         ]
     })
 
@@ -295,14 +981,15 @@ def process_image():
     if not filename or not proc_id:
         return jsonify({'success': False, 'message': '缺少必要参数 filename 或 processor_id'})
         
-    if proc_id not in PROCESSORS:
+    if proc_id not in ensure_processors():
         return jsonify({'success': False, 'message': f'未找到处理器: {proc_id}'})
 
-    src_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(src_path):
+    src_path = UPLOAD_FILES.locate(filename)
+    if src_path is None:
         return jsonify({'success': False, 'message': '图片不存在'})
 
     try:
+        from PIL import Image
         with Image.open(src_path) as img:
             # 确保图片在处理前被正确加载
             img.load()
@@ -310,7 +997,7 @@ def process_image():
 
         ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else 'png'
         out_name = f"{proc_id}_{filename}"
-        out_path = os.path.join(UPLOAD_DIR, out_name)
+        out_path = UPLOAD_FILES.path_for(out_name, create=True)
         processed.save(out_path)
 
         return jsonify({
@@ -327,20 +1014,40 @@ def process_image():
 @app.route('/download/<path:filename>', methods=['GET'])
 def download_file(filename):
     """下载文件"""
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(file_path):
+    response = _send_upload(filename, as_attachment=True)
+    if response is None:
         return jsonify({'success': False, 'message': '文件不存在'}), 404
-    return send_file(file_path, as_attachment=True)
+    return response
+
+
+def _log_startup() -> None:
+    """输出启动耗时分解（类似 python -X importtime 的逐项列表）"""
+    total = sum(STARTUP_PHASES.values())
+    lines = [f"  {phase:<16}{seconds * 1000:9.1f} ms" for phase, seconds in STARTUP_PHASES.items()]
+    app.logger.info("启动耗时 %.1f ms:\n%s", total * 1000, '\n'.join(lines))
+
+
+def start_serving() -> None:
+    """
+    在实际处理请求的进程中初始化并启动推理进程池（每个进程调用一次）；
+    FAST_START 时预热在后台进行，不阻塞服务开始监听
+    """
+    INFERENCE.logger = app.logger
+    INFERENCE.start(background=FAST_START)
+    start_storage_maintenance()
+    _mark_startup('warm_up' if not FAST_START else 'inference_start')
+    _log_startup()
 
 
 if __name__ == '__main__':
-    # 初始化
+    # 开发模式（debug + reloader）；生产环境使用 serve.py
+    # 初始化（处理器插件改为首次使用时加载）
     init_processed_files()
-    load_processors()
-    
-    # 启动后台线程
-    t = threading.Thread(target=_background_watch, daemon=True)
-    t.start()
+    _mark_startup('manifest')
+
+    # debug 模式下 reloader 的监视进程不处理请求，只在实际服务的进程中启动推理进程池
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_serving()
     
     # 运行服务器
     app.run(host='0.0.0.0', port=5401, debug=True)
\ No newline at end of file
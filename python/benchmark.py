@@ -0,0 +1,334 @@
+"""
+上传 → 识别 → 结果 全链路基准测试
+
+把 uploads/ 中的图片按指定并发度与到达速率重放到 /upload，
+再用 /result?wait= 长轮询拿到结果，统计端到端延迟（p50/p95/p99）、
+各阶段耗时与吞吐量（张/秒），以 JSON 输出，便于在不同提交之间对比。
+
+默认在进程内启动 app.py（临时的 uploads/result 目录）并使用替身模型
+（model/stub_model.py，LAB401_STUB_MODEL=1），不需要 gsv2.pt，也不需要联网；
+指定 --url 时改为压测已经运行的服务（此时不统计归档/结果写入耗时）。
+
+各阶段：
+- upload：POST /upload 的响应时间
+- save：后台归档线程把图片写入 uploads/（仅进程内模式）
+- queue_wait：在推理队列中的等待
+- ipc：推理进程往返中除解码/预处理/推理以外的部分（管道传输与批内等待；
+  原先每张图片启动一次子进程的 spawn 开销已由常驻进程取代，这里对应其剩余的调度成本）
+- decode / preprocess / inference：推理进程内的解码、预处理、前向推理
+- result_write：写入结果存储（仅进程内模式）
+- poll_detect：结果写出到客户端长轮询拿到结果的时间
+
+用法：
+    python python/benchmark.py --count 200 --concurrency 8
+    python python/benchmark.py --rate 20 --duration 30 --output bench.json
+    python python/benchmark.py --url http://127.0.0.1:5401 --count 100
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# 推理进程返回的耗时字段 -> 报告中的阶段名
+WORKER_STAGES = {
+    'queue_wait_ms': 'queue_wait',
+    'decode_ms': 'decode',
+    'preprocess_ms': 'preprocess',
+    'inference_ms': 'inference',
+}
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """count/mean/p50/p95/p99/max（最近秩法）"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'p50': round(rank(50), 3),
+        'p95': round(rank(95), 3),
+        'p99': round(rank(99), 3),
+        'max': round(ordered[-1], 3),
+    }
+
+
+def load_images(image_dir: str) -> List[Tuple[str, bytes]]:
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        path = os.path.join(image_dir, name)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                images.append((name, f.read()))
+    return images
+
+
+def _post_image(base_url: str, name: str, data: bytes, timeout: float) -> Dict:
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    req = urllib.request.Request(
+        f'{base_url}/upload', data=body,
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def _get_json(url: str, timeout: float) -> Dict:
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def run_one(base_url: str, name: str, data: bytes, arrival: float,
+            result_timeout: float, poll_wait: float) -> Dict:
+    """上传一张图片并等待结果；延迟从计划到达时刻算起（包含客户端排队）"""
+    busy_retries = 0
+    while True:
+        upload_started = time.time()
+        try:
+            uploaded = _post_image(base_url, name, data, timeout=result_timeout)
+            break
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                raise
+            busy_retries += 1
+            time.sleep(float(e.headers.get('Retry-After', 1)))
+    uploaded_at = time.time()
+
+    deadline = uploaded_at + result_timeout
+    query = urllib.parse.urlencode({'filename': uploaded['filename'], 'wait': poll_wait})
+    while True:
+        result = _get_json(f'{base_url}/result?{query}', timeout=poll_wait + 10)
+        if result.get('ready'):
+            break
+        if time.time() > deadline:
+            raise TimeoutError(f"等待结果超时: {uploaded['filename']}")
+    detected_at = time.time()
+
+    return {
+        'e2e_ms': (detected_at - arrival) * 1000,
+        'upload_ms': (uploaded_at - upload_started) * 1000,
+        'poll_detect_ms': (detected_at - result['updated_at']) * 1000,
+        'busy_retries': busy_retries,
+        'timing': result.get('timing') or {},
+        'model_version': result.get('model_version'),
+    }
+
+
+class _StageTimer:
+    """包装进程内服务的函数，记录每次调用耗时（毫秒）"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[stage].append((time.perf_counter() - t0) * 1000)
+        return wrapper
+
+
+def start_local_server(args, workdir: str):
+    """在进程内启动 app.py（替身模型 + 临时目录），返回 (base_url, server, app 模块, 计时器)"""
+    os.environ.setdefault('LAB401_UPLOAD_DIR', os.path.join(workdir, 'uploads'))
+    os.environ.setdefault('LAB401_RESULT_DIR', os.path.join(workdir, 'result'))
+    if not args.real_model:
+        os.environ['LAB401_STUB_MODEL'] = '1'
+        os.environ['LAB401_STUB_BATCH_MS'] = str(args.stub_batch_ms)
+        os.environ['LAB401_STUB_IMAGE_MS'] = str(args.stub_image_ms)
+    if not args.cache:
+        # 重放的图片会重复，默认关闭去重缓存，测的是真实推理路径
+        os.environ['LAB401_CACHE_SIZE'] = '0'
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as server
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    timer = _StageTimer()
+    # ARCHIVER 提交时按名字查找 _archive_upload，替换模块属性即可计时
+    server._archive_upload = timer.wrap('save', server._archive_upload)
+    server.STORE.put = timer.wrap('result_write', server.STORE.put)
+
+    server.init_processed_files()
+    server.INFERENCE.start()
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, name='benchmark-http', daemon=True).start()
+    return f'http://127.0.0.1:{httpd.server_port}', httpd, server, timer
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmark(args) -> Dict:
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f'目录中没有图片: {args.images}')
+
+    workdir = tempfile.mkdtemp(prefix='lab401-bench-')
+    if args.url:
+        base_url, httpd, server, timer = args.url.rstrip('/'), None, None, None
+    else:
+        base_url, httpd, server, timer = start_local_server(args, workdir)
+
+    total = args.count if args.rate <= 0 or not args.duration else int(args.rate * args.duration)
+    rng = random.Random(args.seed)
+    samples, errors = [], []
+    lock = threading.Lock()
+
+    def task(index: int, arrival: float) -> None:
+        name, data = images[index % len(images)]
+        try:
+            sample = run_one(base_url, name, data, arrival, args.timeout, args.poll_wait)
+        except Exception as e:
+            with lock:
+                errors.append(f'{name}: {e}')
+            return
+        with lock:
+            samples.append(sample)
+
+    # 预热请求不计入统计
+    for i in range(args.warmup):
+        task(i, time.time())
+    samples.clear()
+    errors.clear()
+    if timer is not None:
+        timer.samples.clear()
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        next_arrival = started
+        for i in range(total):
+            if args.rate > 0:
+                # 开环：泊松到达；并发度满时在客户端排队，延迟从计划到达时刻算起
+                next_arrival += rng.expovariate(args.rate)
+                delay = next_arrival - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                arrival = next_arrival
+            else:
+                arrival = time.time()
+            pool.submit(task, i, arrival)
+    elapsed = time.time() - started
+
+    stages: Dict[str, List[float]] = defaultdict(list)
+    batch_sizes = []
+    for sample in samples:
+        timing = sample['timing']
+        for key, stage in WORKER_STAGES.items():
+            if key in timing:
+                stages[stage].append(timing[key])
+        if 'worker_ms' in timing:
+            compute = sum(timing.get(k, 0.0) for k in ('decode_ms', 'preprocess_ms', 'inference_ms'))
+            stages['ipc'].append(max(0.0, timing['worker_ms'] - compute))
+        if 'batch_size' in timing:
+            batch_sizes.append(timing['batch_size'])
+        stages['upload'].append(sample['upload_ms'])
+        stages['poll_detect'].append(sample['poll_detect_ms'])
+    if timer is not None:
+        for stage in ('save', 'result_write'):
+            stages[stage] = list(timer.samples[stage])
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': started,
+        'config': {
+            'target': args.url or 'in-process',
+            'model': 'remote' if args.url else ('real' if args.real_model else 'stub'),
+            'images': len(images),
+            'requests': total,
+            'concurrency': args.concurrency,
+            'rate': args.rate,
+            'cache': bool(args.cache),
+            'stub_batch_ms': args.stub_batch_ms,
+            'stub_image_ms': args.stub_image_ms,
+            'infer_workers': os.environ.get('LAB401_INFER_WORKERS', '1'),
+            'infer_max_batch': os.environ.get('LAB401_INFER_MAX_BATCH', '8'),
+        },
+        'model_version': samples[0]['model_version'] if samples else None,
+        'completed': len(samples),
+        'errors': len(errors),
+        'error_samples': errors[:10],
+        'busy_retries': sum(s['busy_retries'] for s in samples),
+        'duration_s': round(elapsed, 3),
+        'throughput_ips': round(len(samples) / elapsed, 3) if elapsed > 0 else 0.0,
+        'latency_ms': percentiles([s['e2e_ms'] for s in samples]),
+        'stages_ms': {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        'batch_size': percentiles(batch_sizes),
+    }
+
+    if httpd is not None:
+        httpd.shutdown()
+        server.INFERENCE.stop()
+        server.ARCHIVER.shutdown(wait=True)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='上传→识别→结果 全链路基准测试')
+    parser.add_argument('--images', default=os.path.join(BASE_DIR, 'uploads'), help='重放的图片目录')
+    parser.add_argument('--count', type=int, default=100, help='请求总数（--rate 与 --duration 同时给出时忽略）')
+    parser.add_argument('--concurrency', type=int, default=4, help='最大并发请求数')
+    parser.add_argument('--rate', type=float, default=0.0, help='到达速率（张/秒，泊松到达）；0 表示闭环尽快发送')
+    parser.add_argument('--duration', type=float, default=0.0, help='按到达速率持续的秒数')
+    parser.add_argument('--warmup', type=int, default=5, help='不计入统计的预热请求数')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单张图片等待结果的最长时间（秒）')
+    parser.add_argument('--poll-wait', type=float, default=10.0, help='/result 长轮询的 wait 参数（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='到达时间的随机种子')
+    parser.add_argument('--url', help='压测已运行的服务（例如 http://127.0.0.1:5401），不指定则进程内启动')
+    parser.add_argument('--real-model', action='store_true', help='进程内模式下使用真实模型 gsv2.pt')
+    parser.add_argument('--stub-batch-ms', type=float, default=5.0, help='替身模型每批耗时（毫秒）')
+    parser.add_argument('--stub-image-ms', type=float, default=2.0, help='替身模型每张耗时（毫秒）')
+    parser.add_argument('--cache', action='store_true', help='保留去重缓存（默认关闭）')
+    parser.add_argument('--output', default='benchmark.json', help="JSON 报告路径，'-' 表示标准输出")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        latency = report['latency_ms']
+        print(f"完成 {report['completed']}/{report['config']['requests']}，"
+              f"{report['throughput_ips']} 张/秒，p50 {latency.get('p50')} ms，"
+              f"p95 {latency.get('p95')} ms，p99 {latency.get('p99')} ms -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
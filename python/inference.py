@@ -0,0 +1,576 @@
+"""
+常驻推理进程
+
+原先每张上传图片都会启动一次 `model/getShapeVideo2.py` 子进程，
+每次都要重新导入 ultralytics/torch 并加载 gsv2.pt，冷启动耗时数秒。
+这里改为启动一个常驻子进程：模型只加载一次，之后通过管道接收推理请求，
+子进程崩溃或超时无响应时会被自动重启。
+
+子进程内由 getShapeVideo2.MicroBatcher 做动态微批：同时到达的多条请求
+合并为一次 model([...]) 前向推理，再按请求编号拆分回各自的结果。
+推理前先查 RecognitionCache，内容相同（或感知哈希足够接近）的画面直接返回缓存结果。
+
+实际识别由 recognizers/ 中的后端插件完成（YOLO、LeNet、模板匹配），
+每条请求可以指定一个后端或级联（RecognizerSpec），不指定时使用进程池的默认值。
+
+InferencePool 在此之上管理 N 个推理进程和一个有界优先队列，
+让多核服务器可以并行识别，过载时由上传接口直接返回“繁忙，请重试”。
+
+每条请求可带一个追踪 id（trace_id，来自 HTTP 请求头 X-Trace-Id），随请求经过队列
+传到推理进程，推理失败的错误信息与日志都带上它，便于把一次上传的各段日志对应起来。
+
+管道中除推理请求外还可以发送控制消息 ('profile', 选项)，在推理进程内启停采样分析
+（profiler.WorkerProfiler），结束时推理进程回报写出的文件。
+"""
+import itertools
+import multiprocessing as mp
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from metrics import CascadeMetrics
+from profiler import WorkerProfiler
+from recognition_cache import RecognitionCache
+from recognizers import RecognizerRegistry, RecognizerSpec
+
+# 推理结果：(识别的数字, 分类结果, 置信度)，与 predict_and_classify_silent 的返回值一致
+Prediction = Tuple[Optional[int], Optional[str], Optional[float]]
+
+# 推理输入：图片路径、编码后的图片字节，或已解码的 BGR 数组（numpy.ndarray）
+ImageSource = Union[str, bytes, Any]
+
+
+class Recognition(NamedTuple):
+    """一次识别的完整结果"""
+    digit: Optional[int]
+    category: Optional[str]
+    confidence: Optional[float]
+    timing: Dict[str, float]  # 各阶段耗时（毫秒）及批大小
+    model_version: Optional[str]
+    cached: bool = False  # 是否命中去重缓存（未实际推理）
+    recognizer: Optional[str] = None  # 给出结果的后端 id
+    cascade: Optional[Dict] = None  # 级联轨迹：各级置信度、单张耗时与去向
+
+    @property
+    def prediction(self) -> Prediction:
+        return self.digit, self.category, self.confidence
+
+
+class InferenceError(RuntimeError):
+    """推理进程不可用或推理失败"""
+
+
+class WorkerDiedError(InferenceError):
+    """推理进程在处理请求时退出"""
+
+
+def _run_batch(gsv2, registry, caches, default_spec, requests):
+    """
+    在推理进程内处理一批请求 [(图片, RecognizerSpec 或 None)]：
+    解码 → 按后端分组 → 查去重缓存（每种后端各一份）→ 只对未命中的图片执行识别。
+    返回与 requests 一一对应的 (识别结果或异常, 耗时, 是否命中缓存, 模型版本, 后端 id, 级联轨迹)
+    """
+    t0 = time.perf_counter()
+    images = [gsv2.load_image(source) for source, _ in requests]
+    decode_ms = (time.perf_counter() - t0) * 1000
+
+    groups: Dict[RecognizerSpec, list] = {}
+    for i, (_, spec) in enumerate(requests):
+        groups.setdefault(spec or default_spec, []).append(i)
+
+    outputs = [None] * len(images)
+    for spec, indices in groups.items():
+        cache = caches(spec)
+        keys = {}
+        misses = []
+        for i in indices:
+            if images[i] is not None and cache is not None and cache.enabled:
+                cached, keys[i] = cache.lookup(images[i])
+                if cached is not None:
+                    prediction, recognizer_id, version = cached
+                    outputs[i] = (prediction, {'decode_ms': decode_ms, 'batch_size': 0},
+                                  True, version, recognizer_id, None)
+                    continue
+            misses.append(i)
+        if not misses:
+            continue
+
+        timing: Dict[str, float] = {}
+        try:
+            results = registry.run(spec, [images[i] for i in misses], timing)
+        except Exception as e:
+            results = [e] * len(misses)
+        timing.update(decode_ms=decode_ms, batch_size=len(misses))
+        for i, result in zip(misses, results):
+            if isinstance(result, Exception):
+                outputs[i] = (result, timing, False, None, None, None)
+                continue
+            prediction, recognizer_id, version, trace = result
+            outputs[i] = (prediction, timing, False, version, recognizer_id, trace)
+            if i in keys:
+                cache.store(keys[i], (prediction, recognizer_id, version))
+    return outputs
+
+
+def _worker_main(conn, model_dir: str, max_batch_size: int, max_wait: float,
+                 cache_config: Optional[Dict] = None,
+                 default_spec: RecognizerSpec = RecognizerSpec(('yolo',))) -> None:
+    """子进程入口：加载并预热默认后端，然后按微批循环处理请求"""
+    sys.path.insert(0, model_dir)
+    try:
+        import getShapeVideo2 as gsv2
+        registry = RecognizerRegistry(model_dir)
+        for recognizer_id in default_spec.chain:
+            registry.get(recognizer_id)
+        version = registry.get(default_spec.chain[-1]).version
+    except Exception as e:
+        conn.send(('error', f'模型加载失败: {e}'))
+        return
+    conn.send(('ready', version))
+
+    batcher = gsv2.MicroBatcher(max_batch_size=max_batch_size, max_wait=max_wait)
+    caches: Dict[RecognizerSpec, RecognitionCache] = {}
+    profiler = WorkerProfiler()
+
+    def cache_for(spec):
+        if not cache_config:
+            return None
+        if spec not in caches:
+            caches[spec] = RecognitionCache(**cache_config)
+        return caches[spec]
+
+    while True:
+        try:
+            batch, stop = batcher.collect(conn)
+        except (EOFError, OSError):
+            break
+
+        # 控制消息（采样分析启停）与推理请求混在同一条管道中
+        for message in [m for m in batch if m[0] == 'profile']:
+            files = profiler.handle(message[1])
+            if files:
+                conn.send((0, 'profile', files))
+        batch = [m for m in batch if m[0] != 'profile']
+
+        if batch:
+            try:
+                outputs = _run_batch(gsv2, registry, cache_for, default_spec,
+                                     [(source, spec) for _, source, _, spec, _ in batch])
+            except Exception as e:
+                outputs = [(e, {}, False, None, None, None)] * len(batch)
+
+            for (req_id, _, output_path, _, trace_id), output in zip(batch, outputs):
+                prediction = output[0]
+                tag = f'[{trace_id}] ' if trace_id else ''
+                if isinstance(prediction, Exception):
+                    conn.send((req_id, 'error', f'{tag}{prediction}'))
+                    continue
+                try:
+                    if output_path:
+                        with open(output_path, 'w', encoding='utf-8') as f:
+                            f.write(gsv2.format_result(*prediction))
+                    conn.send((req_id, 'ok', output))
+                except Exception as e:
+                    conn.send((req_id, 'error', f'{tag}{e}'))
+        files = profiler.poll()
+        if files:
+            conn.send((0, 'profile', files))
+        if stop:
+            profiler.stop()
+            break
+
+
+class InferenceWorker:
+    """
+    常驻推理进程的管理对象（线程安全）
+
+    - start(): 启动子进程并等待模型预热完成
+    - submit(): 提交一张图片（路径、图片字节或 BGR 数组），立即返回 Future，
+      多线程并发提交的请求会被合批；可指定识别后端（RecognizerSpec），默认使用 recognizer
+    - predict(): submit() 的同步版本，返回 Recognition；
+      指定 output_path 时由推理进程按命令行相同的格式写出结果文件
+    - 子进程退出、管道断开或超时后，下一次调用会自动重启
+    """
+
+    def __init__(self, model_dir: str, timeout: float = 60.0,
+                 startup_timeout: float = 120.0, max_batch_size: int = 8,
+                 max_wait: float = 0.01, cache_config: Optional[Dict] = None,
+                 recognizer: RecognizerSpec = RecognizerSpec(('yolo',)), logger=None):
+        self.model_dir = model_dir
+        self.cache_config = cache_config
+        self.recognizer = recognizer
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.logger = logger
+        self.restarts = 0
+        self.model_version: Optional[str] = None
+        self.load_seconds: Optional[float] = None  # 最近一次启动（加载并预热模型）的耗时
+        self.profile_files: List[str] = []  # 推理进程最近一次采样分析写出的文件
+        self._ctx = mp.get_context('spawn')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Future] = {}
+        self._proc = None
+        self._conn = None
+
+    def _log(self, level: str, msg: str) -> None:
+        if self.logger is not None:
+            getattr(self.logger, level)(msg)
+
+    def is_alive(self) -> bool:
+        return self._proc is not None and self._proc.is_alive()
+
+    def _spawn(self) -> None:
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.model_dir, self.max_batch_size, self.max_wait,
+                  self.cache_config, self.recognizer),
+            name='inference-worker',
+            daemon=True,
+        )
+        started = time.time()
+        proc.start()
+        child_conn.close()
+
+        if not parent_conn.poll(self.startup_timeout):
+            proc.terminate()
+            raise InferenceError('推理进程启动超时')
+        try:
+            status, detail = parent_conn.recv()
+        except EOFError:
+            raise InferenceError('推理进程启动时意外退出')
+        if status != 'ready':
+            proc.join(timeout=1)
+            raise InferenceError(detail)
+
+        self._proc, self._conn = proc, parent_conn
+        self.model_version = detail
+        self.load_seconds = time.time() - started
+        threading.Thread(
+            target=self._reader, args=(proc, parent_conn),
+            name='inference-reader', daemon=True,
+        ).start()
+        self._log('info', f"推理进程已就绪 (pid={proc.pid}, 耗时 {self.load_seconds:.2f}s)")
+
+    def _reader(self, proc, conn) -> None:
+        """读取推理进程的返回，按请求编号完成对应的 Future"""
+        while True:
+            try:
+                req_id, status, detail = conn.recv()
+            except (EOFError, OSError):
+                break
+            if status == 'profile':
+                self.profile_files = detail
+                self._log('info', f"推理进程采样分析已写出: {', '.join(detail)}")
+                continue
+            with self._lock:
+                future = self._pending.pop(req_id, None)
+            if future is None:
+                continue
+            if status == 'ok':
+                prediction, timing, cached, version, recognizer_id, trace = detail
+                future.set_result(Recognition(*prediction, timing, version or self.model_version,
+                                              cached, recognizer_id, trace))
+            else:
+                future.set_exception(InferenceError(detail))
+
+        # 管道断开：该进程上所有未完成的请求都失败，下一次 submit() 时重启
+        with self._lock:
+            if self._proc is proc:
+                self.restarts += 1
+                self._log('warning', f"推理进程意外退出 (exitcode={proc.exitcode})，将在下一次请求时重启")
+                self._kill()
+
+    def _kill(self) -> None:
+        """终止当前进程并让所有未完成的请求失败（调用方需持有 _lock）"""
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        if self._proc is not None and self._proc.is_alive():
+            self._proc.terminate()
+            self._proc.join(timeout=5)
+        exitcode = self._proc.exitcode if self._proc is not None else None
+        self._proc, self._conn = None, None
+
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(WorkerDiedError(f'推理进程已退出 (exitcode={exitcode})'))
+
+    def start(self) -> None:
+        """启动并预热推理进程（已在运行时直接返回）"""
+        with self._lock:
+            if not self.is_alive():
+                self._kill()
+                self._spawn()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.send(None)
+                except Exception:
+                    pass
+            self._kill()
+
+    def submit(self, image: ImageSource, output_path: Optional[str] = None,
+               recognizer: Optional[RecognizerSpec] = None,
+               trace_id: Optional[str] = None) -> Future:
+        """提交一条推理请求，返回 Future（结果为 Recognition）"""
+        future: Future = Future()
+        with self._lock:
+            if not self.is_alive():
+                if self._proc is not None:
+                    self.restarts += 1
+                    self._log('warning', f"推理进程已退出 (exitcode={self._proc.exitcode})，正在重启")
+                self._kill()
+                self._spawn()
+
+            req_id = next(self._ids)
+            self._pending[req_id] = future
+            try:
+                self._conn.send((req_id, image, output_path, recognizer, trace_id))
+            except (EOFError, OSError):
+                self.restarts += 1
+                self._log('warning', "推理进程管道断开，正在重启")
+                self._kill()
+        return future
+
+    def control(self, message: Tuple) -> bool:
+        """向正在运行的推理进程发送控制消息（不启动进程），返回是否已发送"""
+        with self._lock:
+            if not self.is_alive():
+                return False
+            try:
+                self._conn.send(message)
+                return True
+            except (EOFError, OSError):
+                return False
+
+    def wait(self, future: Future) -> Recognition:
+        """等待 Future 完成；超时视为推理进程卡死，终止后由下一次请求重启"""
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                if self._pending:
+                    self._log('error', f"推理超时 ({self.timeout}s)，终止推理进程")
+                    self._kill()
+            raise InferenceError(f'推理超时 ({self.timeout}s)')
+
+    def predict(self, image: ImageSource, output_path: Optional[str] = None,
+                recognizer: Optional[RecognizerSpec] = None) -> Recognition:
+        """对单张图片执行推理，推理进程异常退出时自动重启并重试一次"""
+        try:
+            return self.wait(self.submit(image, output_path, recognizer))
+        except WorkerDiedError:
+            return self.wait(self.submit(image, output_path, recognizer))
+
+
+class PoolBusyError(InferenceError):
+    """等待队列已满，调用方应稍后重试"""
+
+
+class _Job:
+    __slots__ = ('image', 'output_path', 'recognizer', 'trace_id', 'future', 'enqueued_at')
+
+    def __init__(self, image: ImageSource, output_path: Optional[str],
+                 recognizer: Optional[RecognizerSpec] = None, trace_id: Optional[str] = None):
+        self.image = image
+        self.output_path = output_path
+        self.recognizer = recognizer
+        self.trace_id = trace_id
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+
+
+class InferencePool:
+    """
+    多进程推理池
+
+    N 个 InferenceWorker（各自持有一份已加载的模型）共享一个有界优先队列：
+    - put(): 入队并返回 Future，priority 越小越先处理；队列满时抛出 PoolBusyError
+    - 每个推理进程对应一个分发线程，取到一条请求后顺带取走队列中已有的请求，
+      一起提交给推理进程做微批
+    """
+
+    def __init__(self, model_dir: str, workers: int = 1, queue_size: int = 64,
+                 timeout: float = 60.0, max_batch_size: int = 8,
+                 max_wait: float = 0.01, cache_config: Optional[Dict] = None,
+                 recognizer: RecognizerSpec = RecognizerSpec(('yolo',)), logger=None):
+        self.recognizer = recognizer
+        self.workers = [
+            InferenceWorker(model_dir, timeout=timeout, max_batch_size=max_batch_size,
+                            max_wait=max_wait, cache_config=cache_config,
+                            recognizer=recognizer, logger=logger)
+            for _ in range(max(1, int(workers)))
+        ]
+        self.queue_size = max(1, int(queue_size))
+        self._queue: 'queue.PriorityQueue' = queue.PriorityQueue(maxsize=self.queue_size)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.in_flight = 0  # 已交给推理进程、尚未返回结果的请求数
+        self.cascade_metrics = CascadeMetrics()
+        self.logger = logger
+
+    @property
+    def logger(self):
+        return self._logger
+
+    @logger.setter
+    def logger(self, logger) -> None:
+        self._logger = logger
+        for worker in self.workers:
+            worker.logger = logger
+
+    def _log(self, level: str, msg: str) -> None:
+        if self._logger is not None:
+            getattr(self._logger, level)(msg)
+
+    def cache_stats(self) -> Dict[str, float]:
+        """所有推理进程合计的去重缓存命中情况"""
+        with self._lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_rate': self.cache_hits / total if total else 0.0
+            }
+
+    def cascade_stats(self) -> Dict[str, Dict]:
+        """按级联汇总的各阶段计数与直方图"""
+        return self.cascade_metrics.snapshot()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def start(self, warm_up: bool = True, background: bool = False) -> None:
+        """
+        启动分发线程；warm_up 为 True 时并行预热所有推理进程
+
+        background 为 True 时不等待预热完成即返回（预热期间到达的请求在队列中等待）
+        """
+        with self._lock:
+            if self._threads:
+                return
+            for i, worker in enumerate(self.workers):
+                t = threading.Thread(target=self._dispatch, args=(worker,),
+                                     name=f'inference-dispatch-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+        if warm_up:
+            warmers = [threading.Thread(target=self._warm_up, args=(w,), daemon=True)
+                       for w in self.workers]
+            for t in warmers:
+                t.start()
+            if not background:
+                for t in warmers:
+                    t.join()
+
+    def _warm_up(self, worker: InferenceWorker) -> None:
+        try:
+            worker.start()
+        except InferenceError as e:
+            self._log('error', f"推理进程预热失败，将在首次请求时重试: {e}")
+
+    def stop(self) -> None:
+        for worker in self.workers:
+            worker.stop()
+
+    def control(self, message: Tuple) -> int:
+        """向所有正在运行的推理进程发送控制消息，返回发送到的进程数"""
+        return sum(worker.control(message) for worker in self.workers)
+
+    def put(self, image: ImageSource, output_path: Optional[str] = None,
+            priority: int = 10, recognizer: Optional[RecognizerSpec] = None,
+            trace_id: Optional[str] = None) -> Future:
+        """非阻塞入队；队列已满时抛出 PoolBusyError"""
+        if not self._threads:
+            # 未显式 start() 时按需启动分发线程，推理进程在首个请求时加载
+            self.start(warm_up=False)
+        job = _Job(image, output_path, recognizer, trace_id)
+        try:
+            self._queue.put_nowait((priority, next(self._seq), job))
+        except queue.Full:
+            raise PoolBusyError(f'推理队列已满 ({self.queue_size})')
+        return job.future
+
+    @property
+    def model_version(self) -> Optional[str]:
+        for worker in self.workers:
+            if worker.model_version:
+                return worker.model_version
+        return None
+
+    def predict(self, image: ImageSource, output_path: Optional[str] = None,
+                priority: int = 10, timeout: Optional[float] = None,
+                recognizer: Optional[RecognizerSpec] = None) -> Recognition:
+        """同步推理（排队 + 等待结果）"""
+        future = self.put(image, output_path, priority, recognizer)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise InferenceError('等待推理结果超时')
+
+    def _dispatch(self, worker: InferenceWorker) -> None:
+        """分发线程：从队列取一批请求交给绑定的推理进程"""
+        while True:
+            _, _, job = self._queue.get()
+            jobs = [job]
+            while len(jobs) < worker.max_batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait()[2])
+                except queue.Empty:
+                    break
+
+            submitted = []
+            dispatched_at = time.time()
+            for job in jobs:
+                try:
+                    submitted.append((job, worker.submit(job.image, job.output_path, job.recognizer,
+                                                         job.trace_id)))
+                except InferenceError as e:
+                    job.future.set_exception(e)
+            with self._lock:
+                self.in_flight += len(submitted)
+
+            for job, future in submitted:
+                try:
+                    try:
+                        recognition = worker.wait(future)
+                    except WorkerDiedError:
+                        # 推理进程中途退出：重启后重试一次
+                        recognition = worker.wait(
+                            worker.submit(job.image, job.output_path, job.recognizer, job.trace_id))
+                    recognition.timing['queue_wait_ms'] = (dispatched_at - job.enqueued_at) * 1000
+                    # 从交给推理进程到拿到结果的总耗时（含管道往返与批内等待）
+                    recognition.timing['worker_ms'] = (time.time() - dispatched_at) * 1000
+                    with self._lock:
+                        if recognition.cached:
+                            self.cache_hits += 1
+                        else:
+                            self.cache_misses += 1
+                    self.cascade_metrics.observe(recognition.cascade)
+                    job.future.set_result(recognition)
+                except InferenceError as e:
+                    job.future.set_exception(e)
+                except Exception as e:
+                    self._log('error', f"[{job.trace_id}] 推理分发出错: {e}")
+                    job.future.set_exception(InferenceError(str(e)))
+                finally:
+                    with self._lock:
+                        self.in_flight -= 1
@@ -0,0 +1,256 @@
+"""
+计数器与直方图
+
+级联识别需要按阶段统计处理量、放行/升级次数与耗时分布，用来调整置信度阈值。
+直方图使用固定桶（桶上界累计计数，与 Prometheus histogram 的语义一致），
+聚合在 Web 进程中完成：推理进程把每张图片的级联轨迹随结果一起返回。
+
+MetricsRegistry 汇总服务的计数器、直方图与回调指标，按 Prometheus 文本格式输出（/metrics）。
+"""
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+# 单张图片耗时（毫秒）与置信度的默认桶上界
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+# Prometheus 导出的耗时桶（秒）
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+
+
+class Histogram:
+    """固定桶直方图（非线程安全，由调用方加锁）"""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶上界估算分位数（落在 +Inf 桶时返回最大的有限上界）"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for upper, n in zip(self.buckets, self.counts):
+            cumulative += n
+            if cumulative >= target:
+                return upper
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict:
+        cumulative, buckets = 0, {}
+        for upper, n in zip(self.buckets, self.counts):
+            cumulative += n
+            buckets[str(upper)] = cumulative
+        buckets['+Inf'] = self.count
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'mean': round(self.sum / self.count, 3) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': buckets,
+        }
+
+
+class _StageMetrics:
+    OUTCOMES = ('accepted', 'escalated', 'audit', 'overridden')
+
+    def __init__(self):
+        self.requests = 0
+        self.outcomes = dict.fromkeys(self.OUTCOMES, 0)
+        self.latency = Histogram(LATENCY_BUCKETS_MS)
+        self.confidence = Histogram(CONFIDENCE_BUCKETS)
+
+    def snapshot(self) -> Dict:
+        return dict(self.outcomes, requests=self.requests,
+                    latency_ms=self.latency.snapshot(),
+                    confidence=self.confidence.snapshot())
+
+
+class CascadeMetrics:
+    """
+    按级联（如 lenet>yolo）与阶段汇总识别轨迹（线程安全）
+
+    每个阶段统计：处理张数、结果去向（accepted 放行 / escalated 升级 /
+    audit 抽检复核 / overridden 被复核推翻）、单张耗时与置信度直方图；
+    每个级联统计：总张数、抽检与不一致次数、平均每张 CPU 耗时
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cascades: Dict[str, Dict] = {}
+
+    def observe(self, trace: Optional[Dict]) -> None:
+        if not trace or len(trace.get('spec', '').split('>')) < 2:
+            return
+        with self._lock:
+            cascade = self._cascades.get(trace['spec'])
+            if cascade is None:
+                cascade = self._cascades[trace['spec']] = {
+                    'items': 0, 'audited': 0, 'disagreed': 0, 'cpu_ms': 0.0, 'stages': {}
+                }
+            cascade['items'] += 1
+            cascade['audited'] += int(trace.get('audited', False))
+            cascade['disagreed'] += int(trace.get('disagreed', False))
+            for stage in trace['stages']:
+                metrics = cascade['stages'].get(stage['id'])
+                if metrics is None:
+                    metrics = cascade['stages'][stage['id']] = _StageMetrics()
+                metrics.requests += 1
+                metrics.outcomes[stage['outcome']] += 1
+                metrics.latency.observe(stage['ms'])
+                metrics.confidence.observe(stage['confidence'])
+                cascade['cpu_ms'] += stage['ms']
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for name, cascade in self._cascades.items():
+                items = cascade['items']
+                result[name] = {
+                    'items': items,
+                    'audited': cascade['audited'],
+                    'disagreed': cascade['disagreed'],
+                    'disagreement_rate': cascade['disagreed'] / cascade['audited']
+                    if cascade['audited'] else None,
+                    'mean_cpu_ms': round(cascade['cpu_ms'] / items, 3) if items else None,
+                    'stages': {sid: m.snapshot() for sid, m in cascade['stages'].items()},
+                }
+            return result
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        text = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{text}"')
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Family:
+    """一个指标（同名、同类型），按标签取值区分各条时间序列"""
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, kind: str, help_text: str,
+                 labels: Tuple[str, ...] = (), buckets: Iterable[float] = (),
+                 callback: Optional[Callable] = None, max_series: int = 0):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.callback = callback
+        self.max_series = max_series  # 标签组合数上限（0 表示不限），超出后新的组合被丢弃
+        self.series: Dict[Tuple, Union[float, Histogram]] = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _series(self, key: Tuple, default):
+        series = self.series.get(key)
+        if series is None:
+            if self.max_series and len(self.series) >= self.max_series:
+                return None
+            series = self.series[key] = default()
+        return series
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """计数器加 amount"""
+        key = self._key(labels)
+        with self.registry.lock:
+            if self._series(key, float) is not None:
+                self.series[key] += amount
+
+    def observe(self, value: float, **labels) -> None:
+        """直方图记录一个观测值"""
+        with self.registry.lock:
+            histogram = self._series(self._key(labels), lambda: Histogram(self.buckets))
+            if histogram is not None:
+                histogram.observe(value)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        if self.callback is not None:
+            value = self.callback()
+            samples = value.items() if isinstance(value, dict) else [((), value)]
+            for key, v in samples:
+                if v is not None:
+                    lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(v)}')
+            return lines
+        with self.registry.lock:
+            for key, series in self.series.items():
+                if not isinstance(series, Histogram):
+                    lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(series)}')
+                    continue
+                cumulative = 0
+                for upper, n in zip(series.buckets, series.counts):
+                    cumulative += n
+                    le = _format_labels(self.labels, key, f'le="{upper:g}"')
+                    lines.append(f'{self.name}_bucket{le} {cumulative}')
+                inf = _format_labels(self.labels, key, 'le="+Inf"')
+                lines.append(f'{self.name}_bucket{inf} {series.count}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series.sum)}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {series.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表（线程安全），render() 输出 Prometheus 文本格式（0.0.4）
+
+    - counter() / histogram(): 由调用方 inc() / observe() 更新
+    - gauge(): 输出时调用 callback 取值，返回数值或 {标签取值元组: 数值}；
+      kind='counter' 用于导出已有的累计计数（如缓存命中次数）
+    """
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self._families: Dict[str, _Family] = {}
+
+    def _add(self, name: str, **kwargs) -> _Family:
+        family = _Family(self, self.prefix + name, help_text=kwargs.pop('help_text'), **kwargs)
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                max_series: int = 0) -> _Family:
+        return self._add(name, kind='counter', help_text=help_text, labels=labels,
+                         max_series=max_series)
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = SECONDS_BUCKETS,
+                  labels: Tuple[str, ...] = (), max_series: int = 0) -> _Family:
+        return self._add(name, kind='histogram', help_text=help_text, labels=labels,
+                         buckets=sorted(buckets), max_series=max_series)
+
+    def gauge(self, name: str, help_text: str, callback: Callable,
+              labels: Tuple[str, ...] = (), kind: str = 'gauge') -> _Family:
+        return self._add(name, kind=kind, help_text=help_text, labels=labels, callback=callback)
+
+    def render(self) -> str:
+        lines = []
+        for family in list(self._families.values()):
+            try:
+                lines.extend(family.render())
+            except Exception:
+                continue  # 回调出错时跳过该指标，不影响其他指标
+        return '\n'.join(lines) + '\n'
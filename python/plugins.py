@@ -0,0 +1,33 @@
+"""
+插件发现
+
+processors/ 与 recognizers/ 两类插件共用同一套发现逻辑：
+遍历包目录下的模块，读取模块中约定名字的元数据字典（PROCESSOR / RECOGNIZER），
+校验必需字段后按 id 注册。插件模块应保持导入轻量，重的依赖放到实际使用时再导入。
+"""
+import importlib
+import pkgutil
+from typing import Dict, Iterable
+
+
+def discover(package_dir: str, package: str, attr: str, required: Iterable[str],
+             logger=None) -> Dict[str, Dict]:
+    """返回 {id: 元数据}；缺少字段或导入失败的插件记录日志后跳过"""
+    def log(level: str, msg: str) -> None:
+        if logger is not None:
+            getattr(logger, level)(msg)
+
+    found: Dict[str, Dict] = {}
+    for _, name, _ in pkgutil.iter_modules([package_dir]):
+        try:
+            module = importlib.import_module(f'{package}.{name}')
+            meta = getattr(module, attr, None)
+
+            if meta and all(k in meta for k in required):
+                found[meta['id']] = meta
+                log('info', f"加载插件成功: {package}.{meta['id']}")
+            else:
+                log('warning', f"插件 {package}.{name} 缺少必要属性")
+        except Exception as e:
+            log('error', f"加载插件 {package}.{name} 失败: {e}")
+    return found
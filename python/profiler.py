@@ -0,0 +1,243 @@
+"""
+采样分析器
+
+识别慢的时候需要知道时间花在 Python、OpenCV 还是 torch 上。这里不插桩，
+而是由后台线程按固定间隔读取本进程所有线程的调用栈（sys._current_frames()），
+按折叠栈计数，写出 flamegraph.pl / speedscope 可直接读取的 collapsed 格式：
+
+    <线程名>;<外层函数 (目录/文件)>;...;<最内层函数 (目录/文件:行号)> <采样次数>
+
+最内层一帧带行号，调用 cv2 / torch 等 C 扩展的耗时落在发起调用的那一行上。
+默认丢弃阻塞等待中的线程（锁、队列、管道、select），只保留在执行的栈；
+采样间隔 10 ms 时开销通常在 1% 左右，适合在生产环境短时间开启。
+
+- StackSampler：采样线程本身
+- ProfileSession：一次分析（持续 duration 秒或记录满 requests 次请求后结束并写文件）
+- WorkerProfiler：推理进程内的分析，另外可用 torch.profiler 记录算子级跟踪（chrome trace JSON）
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_INTERVAL = 0.01  # 采样间隔（秒）
+MAX_DEPTH = 128          # 每个栈最多保留的帧数（从最内层算起）
+
+# 阻塞等待时的最内层帧：(文件名, 函数名)，默认不计入
+_IDLE_LEAVES = {
+    ('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'), ('selectors.py', 'select'), ('socket.py', 'accept'),
+    ('socket.py', 'readinto'), ('socketserver.py', 'serve_forever'),
+    ('connection.py', '_recv'), ('connection.py', '_poll'), ('connection.py', 'poll'),
+    ('connection.py', 'wait'), ('_base.py', 'result'), ('thread.py', '_worker'),
+}
+
+
+class StackSampler:
+    """后台线程按 interval 秒采样本进程所有线程（自身除外）的 Python 调用栈"""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, include_idle: bool = False):
+        self.interval = max(0.001, float(interval))
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels: Dict = {}  # (code, 行号或 None) -> 帧名，避免每次采样重复拼字符串
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _label(self, code, lineno: Optional[int] = None) -> str:
+        key = (code, lineno)
+        label = self._labels.get(key)
+        if label is None:
+            # 带上一级目录，区分同名文件（如 flask/app.py 与 python/app.py）
+            filename = '/'.join(code.co_filename.replace('\\', '/').rsplit('/', 2)[-2:])
+            location = f'{filename}:{lineno}' if lineno is not None else filename
+            label = self._labels[key] = f'{code.co_name} ({location})'
+        return label
+
+    def _sample(self, own: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if not self.include_idle and \
+                    (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                continue
+            stack = [self._label(code, frame.f_lineno)]
+            frame = frame.f_back
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        next_at = time.perf_counter()
+        while not self._stop.is_set():
+            self._sample(own)
+            next_at += self.interval
+            self._stop.wait(max(0.0, next_at - time.perf_counter()))
+
+    def start(self) -> 'StackSampler':
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def write(self, path: str) -> str:
+        """按采样次数从多到少写出折叠栈"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+
+class ProfileSession:
+    """
+    一次分析：start() 后持续 duration 秒，或 note_request() 记满 requests 次后结束
+    （两者都给出时先到者为准），结束时写出 <directory>/<tag>.collapsed 与 <tag>.json（摘要）。
+    on_finish(session) 在写完文件后调用
+    """
+
+    def __init__(self, directory: str, tag: str, duration: Optional[float] = None,
+                 requests: Optional[int] = None, interval: float = DEFAULT_INTERVAL,
+                 include_idle: bool = False, on_finish: Optional[Callable] = None):
+        self.directory = directory
+        self.tag = tag
+        self.duration = duration
+        self.requests = requests
+        self.on_finish = on_finish
+        self.sampler = StackSampler(interval, include_idle)
+        self.seen = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.files: List[str] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def active(self) -> bool:
+        return self.started_at is not None and self.finished_at is None
+
+    def start(self) -> 'ProfileSession':
+        os.makedirs(self.directory, exist_ok=True)
+        self.started_at = time.time()
+        self.sampler.start()
+        if self.duration:
+            self._timer = threading.Timer(self.duration, self.finish)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def note_request(self) -> None:
+        """记录一次完成的请求，达到 requests 次时结束"""
+        if not self.active or not self.requests:
+            return
+        with self._lock:
+            self.seen += 1
+            done = self.seen >= self.requests
+        if done:
+            self.finish()
+
+    def finish(self) -> List[str]:
+        """结束采样并写出文件（重复调用时直接返回已写出的文件）"""
+        with self._lock:
+            if not self.active:
+                return self.files
+            self.finished_at = time.time()
+        if self._timer is not None:
+            self._timer.cancel()
+        self.sampler.stop()
+        self.files = [self.sampler.write(os.path.join(self.directory, f'{self.tag}.collapsed'))]
+        summary = os.path.join(self.directory, f'{self.tag}.json')
+        with open(summary, 'w', encoding='utf-8') as f:
+            json.dump(self.status(), f, ensure_ascii=False, indent=2)
+        self.files.append(summary)
+        if self.on_finish is not None:
+            self.on_finish(self)
+        return self.files
+
+    def status(self) -> Dict:
+        return {
+            'tag': self.tag,
+            'active': self.active,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': self.duration,
+            'requests': self.requests,
+            'requests_seen': self.seen,
+            'interval': self.sampler.interval,
+            'samples': self.sampler.samples,
+            'files': self.files,
+        }
+
+
+class WorkerProfiler:
+    """
+    推理进程内的分析，由 Web 进程经管道发来的控制消息启停：
+    {'action': 'start', 'directory', 'tag', 'interval', 'idle', 'torch', 'max_seconds'} / {'action': 'stop'}
+
+    torch.profiler 必须在推理线程（子进程主线程）中启停，所以由主循环调用 handle() 与 poll()；
+    超过 max_seconds 仍未收到 stop（例如 Web 进程已退出）时由 poll() 自行结束
+    """
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self._torch = None
+        self._trace_path: Optional[str] = None
+        self._deadline = 0.0
+
+    def handle(self, options: Dict) -> Optional[List[str]]:
+        """处理控制消息；结束时返回写出的文件"""
+        if options.get('action') == 'start':
+            self.stop()
+            self._start(options)
+            return None
+        return self.stop()
+
+    def _start(self, options: Dict) -> None:
+        tag = f"{options['tag']}_worker{os.getpid()}"
+        self.session = ProfileSession(options['directory'], tag, interval=options.get('interval', DEFAULT_INTERVAL),
+                                      include_idle=options.get('idle', False)).start()
+        self._deadline = time.monotonic() + options.get('max_seconds', 120)
+        if options.get('torch'):
+            try:
+                import torch
+                self._torch = torch.profiler.profile(
+                    activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+                self._torch.start()
+                self._trace_path = os.path.join(options['directory'], f'{tag}.torch.json')
+            except Exception as e:  # 没有安装 torch 或 profiler 不可用时只做栈采样
+                print(f'torch profiler 不可用: {e}')
+                self._torch = None
+
+    def poll(self) -> Optional[List[str]]:
+        """主循环每轮调用：超过最长时间时结束并返回文件"""
+        if self.session is not None and time.monotonic() >= self._deadline:
+            return self.stop()
+        return None
+
+    def stop(self) -> Optional[List[str]]:
+        if self.session is None:
+            return None
+        files = self.session.finish()
+        if self._torch is not None:
+            try:
+                self._torch.stop()
+                self._torch.export_chrome_trace(self._trace_path)
+                files = files + [self._trace_path]
+            except Exception as e:
+                print(f'导出 torch profiler 跟踪失败: {e}')
+        self.session, self._torch = None, None
+        return files
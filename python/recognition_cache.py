@@ -0,0 +1,113 @@
+"""
+识别结果去重缓存
+
+传送带上方的固定相机经常拍到完全相同或几乎相同的画面（空带、停带），
+每张仍会被当作新图片完整推理一次。这里按解码后图像内容的哈希缓存识别结果：
+- 精确匹配：像素数据的 SHA-1
+- 可选的感知哈希（dHash，64 位）：汉明距离不超过阈值即视为同一画面
+缓存有容量上限（LRU 淘汰）和过期时间（TTL），并统计命中率。
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def content_hash(image) -> str:
+    """解码后图像的内容哈希（包含尺寸，避免不同形状的数据碰撞）"""
+    digest = hashlib.sha1(str(image.shape).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """差值感知哈希：缩放为 (hash_size+1) x hash_size 灰度图，比较相邻像素明暗"""
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+class RecognitionCache:
+    """
+    LRU + TTL 的识别结果缓存（线程安全）
+
+    max_entries: 最多缓存的画面数，0 表示关闭缓存
+    ttl: 缓存有效期（秒）
+    phash_distance: 感知哈希的汉明距离阈值，小于 0 表示只做精确匹配
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300.0,
+                 phash_distance: int = -1):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl)
+        self.phash_distance = int(phash_distance)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (写入时间, 感知哈希, 识别结果)
+        self._entries: 'OrderedDict[str, Tuple[float, Optional[int], Any]]' = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _keys(self, image) -> Tuple[str, Optional[int]]:
+        phash = dhash(image) if self.phash_distance >= 0 else None
+        return content_hash(image), phash
+
+    def lookup(self, image) -> Tuple[Optional[Any], Tuple[str, Optional[int]]]:
+        """
+        查询缓存，返回 (识别结果或 None, 缓存键)；
+        缓存键可直接传给 store()，避免重复计算哈希
+        """
+        keys = self._keys(image)
+        if not self.enabled:
+            return None, keys
+
+        key, phash = keys
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                # 过期时间从写入时算起，命中不会续期
+                del self._entries[key]
+                entry = None
+            if entry is None and phash is not None:
+                for other_key, other in self._entries.items():
+                    if now - other[0] <= self.ttl and \
+                            bin(phash ^ other[1]).count('1') <= self.phash_distance:
+                        key, entry = other_key, other
+                        break
+            if entry is None:
+                self.misses += 1
+                return None, keys
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2], keys
+
+    def store(self, keys: Tuple[str, Optional[int]], value: Any) -> None:
+        if not self.enabled:
+            return
+        key, phash = keys
+        with self._lock:
+            self._entries[key] = (time.time(), phash, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
@@ -0,0 +1,161 @@
+"""
+Recognizer backend plugins for lab401.
+
+Each recognizer module must expose a dict named RECOGNIZER with keys:
+- id: unique string identifier
+- label: human-friendly name
+- description: optional description
+- cost: estimated CPU cost in milliseconds per image (only used to sort the
+  /recognizers listing; a cascade always runs in the order the request wrote it)
+- accuracy: rough accuracy estimate in [0, 1] for display; it is NOT measured
+  (measured hold-out accuracy of the LeNet/YOLO variants lives in
+  model/variants/variants.json, see model/model_variants.py)
+- load: callable taking (model_dir: str) -> backend
+
+A backend provides:
+- predict_batch(images, timing) -> list of (digit, category, confidence), one per
+  decoded BGR image (None images map to (None, None, None)); timing is a dict that
+  receives preprocess_ms / inference_ms
+- version: string identifying the loaded model
+- warm_up(): optional, run once before the first real request
+
+Modules are discovered in the web process only for their metadata, so heavy
+imports (torch, ultralytics) must happen inside load().
+"""
+import os
+import random
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from plugins import discover
+
+RECOGNIZERS_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUIRED_KEYS = ('id', 'label', 'cost', 'accuracy', 'load')
+CASCADE_ALIAS = 'cascade'
+
+
+class RecognizerSpec(NamedTuple):
+    """
+    一次识别使用的后端：单个后端，或按顺序尝试的级联（置信度低于阈值时交给下一个）。
+    chain 保持请求中书写的顺序，不按 cost 重排。
+    audit_rate 为抽检比例：前面阶段已放行的图片按此比例再交给最后一级复核，
+    结果不一致时以最后一级为准
+    """
+    chain: Tuple[str, ...]
+    threshold: float = 0.0
+    audit_rate: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return '>'.join(self.chain)
+
+
+def discover_recognizers(logger=None) -> Dict[str, Dict]:
+    return discover(RECOGNIZERS_DIR, 'recognizers', 'RECOGNIZER', REQUIRED_KEYS, logger)
+
+
+def parse_spec(text: str, available: Optional[Dict[str, Dict]], default_cascade: str,
+               threshold: float, audit_rate: float = 0.0) -> RecognizerSpec:
+    """
+    解析请求中的后端选择：
+    - 'yolo'：单个后端
+    - 'template>yolo'：级联，依次尝试，置信度不低于 threshold 即采用
+    - 'cascade'：使用默认级联 default_cascade
+    给出 available 时校验后端是否存在，未知后端抛出 ValueError
+    """
+    text = (text or '').strip()
+    if text == CASCADE_ALIAS:
+        text = default_cascade
+    chain = tuple(part.strip() for part in text.split('>') if part.strip())
+    if not chain:
+        raise ValueError('未指定识别后端')
+    unknown = [rid for rid in chain if available is not None and rid not in available]
+    if unknown:
+        raise ValueError(f"未知的识别后端: {', '.join(unknown)}")
+    if len(chain) == 1:
+        return RecognizerSpec(chain)
+    return RecognizerSpec(chain, threshold, audit_rate)
+
+
+class RecognizerRegistry:
+    """
+    推理进程内的后端集合：按需加载（每个后端只加载一次），
+    并按 RecognizerSpec 执行单个后端或级联
+    """
+
+    def __init__(self, model_dir: str, logger=None):
+        self.model_dir = model_dir
+        self.available = discover_recognizers(logger)
+        self._backends: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def get(self, recognizer_id: str):
+        with self._lock:
+            backend = self._backends.get(recognizer_id)
+            if backend is None:
+                meta = self.available.get(recognizer_id)
+                if meta is None:
+                    raise ValueError(f'未知的识别后端: {recognizer_id}')
+                backend = meta['load'](self.model_dir)
+                warm_up = getattr(backend, 'warm_up', None)
+                if warm_up is not None:
+                    warm_up()
+                self._backends[recognizer_id] = backend
+            return backend
+
+    def run(self, spec: RecognizerSpec, images: Sequence,
+            timing: Dict[str, float]) -> List[Tuple[Tuple, str, str, Dict]]:
+        """
+        对已解码的图片执行 spec，返回每张图片的 (识别结果, 给出结果的后端 id, 模型版本, 轨迹)。
+
+        级联时只有置信度低于阈值的图片才交给下一个后端；无法解码的图片不再升级。
+        已放行的图片按 audit_rate 抽检，和升级的图片一起交给最后一级，数字不一致时以最后一级为准。
+        轨迹记录每一级的置信度、单张耗时与去向（accepted / escalated / audit / overridden）
+        """
+        outputs: List[Optional[list]] = [None] * len(images)
+        traces = [{'spec': spec.name, 'stages': [], 'audited': False, 'disagreed': False}
+                  for _ in images]
+        remaining = list(range(len(images)))
+        audits: List[int] = []
+        timing.update({'preprocess_ms': 0.0, 'inference_ms': 0.0})
+
+        for level, recognizer_id in enumerate(spec.chain):
+            last = level == len(spec.chain) - 1
+            batch = remaining + (audits if last else [])
+            if not batch:
+                continue
+            backend = self.get(recognizer_id)
+            stage: Dict[str, float] = {}
+            t0 = time.perf_counter()
+            predictions = backend.predict_batch([images[i] for i in batch], stage)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            timing[f'{recognizer_id}_ms'] = elapsed_ms
+            timing['preprocess_ms'] += stage.get('preprocess_ms', 0.0)
+            timing['inference_ms'] += stage.get('inference_ms', 0.0)
+            per_image_ms = elapsed_ms / len(batch)
+
+            escalate = []
+            for n, (i, prediction) in enumerate(zip(batch, predictions)):
+                confidence = prediction[2] or 0.0
+                entry = {'id': recognizer_id, 'confidence': confidence, 'ms': per_image_ms}
+                traces[i]['stages'].append(entry)
+                if n >= len(remaining):
+                    # 抽检复核：与之前放行的结果比较数字，不一致时改用本级结果
+                    entry['outcome'] = 'audit'
+                    if prediction[0] != outputs[i][0][0]:
+                        traces[i]['disagreed'] = True
+                        traces[i]['stages'][-2]['outcome'] = 'overridden'
+                        outputs[i] = [prediction, recognizer_id, backend.version]
+                elif last or images[i] is None or confidence >= spec.threshold:
+                    entry['outcome'] = 'accepted'
+                    outputs[i] = [prediction, recognizer_id, backend.version]
+                    if not last and images[i] is not None and random.random() < spec.audit_rate:
+                        traces[i]['audited'] = True
+                        audits.append(i)
+                else:
+                    entry['outcome'] = 'escalated'
+                    escalate.append(i)
+            remaining = escalate
+        return [(prediction, recognizer_id, version, trace)
+                for (prediction, recognizer_id, version), trace in zip(outputs, traces)]
@@ -0,0 +1,35 @@
+import sys
+
+
+class _LeNetBackend:
+    """MNIST LeNet（model/getShapeVideo1.py 的 ShapeAnalysis），批量张量推理"""
+
+    def __init__(self, model_dir: str):
+        if model_dir not in sys.path:
+            sys.path.insert(0, model_dir)
+        import getShapeVideo1 as gsv1
+        self._analyzer = gsv1.ShapeAnalysis()
+        variant = self._analyzer.variant
+        self.version = f"lenet:{variant['name'] if variant else 'MNistLeNet.pth'}"
+
+    def warm_up(self):
+        import numpy as np
+        self._analyzer.analyze_batch([np.zeros((32, 32, 3), dtype=np.uint8)])
+
+    def predict_batch(self, images, timing):
+        outputs = [(None, None, None)] * len(images)
+        valid = [i for i, img in enumerate(images) if img is not None]
+        results = self._analyzer.analyze_batch([images[i] for i in valid], timing=timing)
+        for i, (digit, confidence, category) in zip(valid, results):
+            outputs[i] = (digit, category, confidence)
+        return outputs
+
+
+RECOGNIZER = {
+    'id': 'lenet',
+    'label': 'LeNet 数字分类',
+    'description': 'MNistLeNet.pth 小型分类网络，速度快，适合作为级联的第一级',
+    'cost': 2.0,
+    'accuracy': 0.95,  # 未经评估的粗略估计；实测准确率见 model_variants.py 的留出集评估
+    'load': _LeNetBackend,
+}
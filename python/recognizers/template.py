@@ -0,0 +1,97 @@
+import sys
+import time
+
+# 模板字形：OpenCV 自带的 Hershey 字体，每个数字按多种字体/笔画粗细渲染
+_FONTS = ('FONT_HERSHEY_SIMPLEX', 'FONT_HERSHEY_DUPLEX', 'FONT_HERSHEY_COMPLEX', 'FONT_HERSHEY_TRIPLEX')
+_THICKNESS = (3, 6)
+_SIZE = 28  # 比较时统一缩放到的边长
+
+
+class _TemplateBackend:
+    """
+    模板匹配：二值化后取面积最大的轮廓外接框，居中补成正方形并缩放，
+    与 0~9 的字形模板做归一化相关，相关系数作为置信度。
+    只用 OpenCV/NumPy，每张图片耗时远低于神经网络，适合作为级联的第一级
+    """
+
+    version = 'template@hershey-v1'
+
+    def __init__(self, model_dir: str):
+        if model_dir not in sys.path:
+            sys.path.insert(0, model_dir)
+        import cv2
+        import numpy as np
+        import getShapeVideo2 as gsv2
+        self._cv2, self._np, self._gsv2 = cv2, np, gsv2
+        self._preprocessor = gsv2.Preprocessor()
+        self._labels, self._templates = self._render_templates()
+
+    def _normalize(self, patch):
+        """展平为零均值、单位范数的向量，点积即为归一化相关系数"""
+        vec = patch.astype(self._np.float32).ravel()
+        vec -= vec.mean()
+        norm = self._np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _crop(self, binary, largest_only):
+        """取前景外接框（largest_only 时只取面积最大的轮廓），居中补成正方形后缩放"""
+        cv2, np = self._cv2, self._np
+        if largest_only:
+            contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if not contours:
+                return None
+            x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        else:
+            points = cv2.findNonZero(binary)
+            if points is None:
+                return None
+            x, y, w, h = cv2.boundingRect(points)
+        side = max(w, h)
+        square = np.zeros((side, side), dtype=np.uint8)
+        square[(side - h) // 2:(side - h) // 2 + h, (side - w) // 2:(side - w) // 2 + w] = \
+            binary[y:y + h, x:x + w]
+        return cv2.resize(square, (_SIZE, _SIZE), interpolation=cv2.INTER_AREA)
+
+    def _render_templates(self):
+        cv2, np = self._cv2, self._np
+        labels, vectors = [], []
+        for font in _FONTS:
+            for thickness in _THICKNESS:
+                for digit in range(10):
+                    canvas = np.zeros((96, 96), dtype=np.uint8)
+                    cv2.putText(canvas, str(digit), (16, 80), getattr(cv2, font), 2.5, 255, thickness)
+                    labels.append(digit)
+                    vectors.append(self._normalize(self._crop(canvas, largest_only=False)))
+        return np.array(labels), np.stack(vectors)
+
+    def predict_batch(self, images, timing):
+        outputs = [(None, None, None)] * len(images)
+        preprocess = inference = 0.0
+        for i, img in enumerate(images):
+            if img is None:
+                continue
+            t0 = time.perf_counter()
+            patch = self._crop(self._preprocessor.binarize(img), largest_only=True)
+            t1 = time.perf_counter()
+            preprocess += t1 - t0
+            if patch is None:
+                outputs[i] = (None, "未检测到数字", 0.0)
+                continue
+            scores = self._templates @ self._normalize(patch)
+            best = int(scores.argmax())
+            digit = int(self._labels[best])
+            confidence = max(0.0, float(scores[best]))
+            outputs[i] = (digit, self._gsv2.classify_number_logic(digit), confidence)
+            inference += time.perf_counter() - t1
+        timing.update({'preprocess_ms': preprocess * 1000, 'inference_ms': inference * 1000})
+        return outputs
+
+
+RECOGNIZER = {
+    'id': 'template',
+    'label': '模板匹配',
+    'description': 'OpenCV 字形模板匹配，无需模型文件，耗时最低、准确率最低',
+    'cost': 0.5,
+    'accuracy': 0.8,  # 未经评估的粗略估计（模板匹配没有留出集评估），仅供 /recognizers 展示
+    'load': _TemplateBackend,
+}
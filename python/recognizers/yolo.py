@@ -0,0 +1,29 @@
+import sys
+
+
+class _YoloBackend:
+    """ultralytics YOLO（model/getShapeVideo2.py），支持 LAB401_YOLO_VARIANT 选择的导出变体"""
+
+    def __init__(self, model_dir: str):
+        if model_dir not in sys.path:
+            sys.path.insert(0, model_dir)
+        import getShapeVideo2 as gsv2
+        self._gsv2 = gsv2
+        self.version = None
+
+    def warm_up(self):
+        self._gsv2.warm_up()
+        self.version = self._gsv2.model_version()
+
+    def predict_batch(self, images, timing):
+        return self._gsv2.predict_and_classify_batch(images, timing=timing)
+
+
+RECOGNIZER = {
+    'id': 'yolo',
+    'label': 'YOLO 数字检测',
+    'description': 'gsv2.pt 目标检测模型，准确率最高、耗时最长',
+    'cost': 20.0,
+    'accuracy': 0.99,  # 未经评估的粗略估计；实测准确率见 model_variants.py 的留出集评估
+    'load': _YoloBackend,
+}
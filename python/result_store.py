@@ -0,0 +1,212 @@
+"""
+结构化结果存储
+
+识别结果保存在 SQLite（WAL 模式）表中，以上传文件名为主键，
+记录数字、置信度、分类、时间戳、各阶段耗时与上传请求的追踪 id；按完成时间建索引，支持范围查询。
+热点记录放在内存 LRU 缓存中，/result 的轮询不再每次都访问磁盘。
+原先的 `<base>_result.txt` 文本文件作为可选的兼容导出保留。
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    filename      TEXT PRIMARY KEY,
+    digit         INTEGER,
+    confidence    REAL,
+    category      TEXT,
+    created_at    REAL NOT NULL,
+    finished_at   REAL NOT NULL,
+    latency_ms    REAL,
+    timing        TEXT,
+    model_version TEXT,
+    recognizer    TEXT,
+    trace_id      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_finished_at ON results (finished_at);
+"""
+
+_COLUMNS = ('filename', 'digit', 'confidence', 'category', 'created_at',
+            'finished_at', 'latency_ms', 'timing', 'model_version', 'recognizer', 'trace_id')
+
+# 旧版本数据库缺少的列：(列名, 类型)，打开时自动补上
+_ADDED_COLUMNS = (('recognizer', 'TEXT'), ('trace_id', 'TEXT'))
+
+
+def result_text_name(filename: str) -> str:
+    """上传文件名对应的兼容文本文件名：<上传文件名不含扩展>_result.txt"""
+    base, _ = os.path.splitext(filename)
+    return f"{base}_result.txt"
+
+
+def format_result_text(record: Dict) -> str:
+    """生成兼容旧格式的结果文本（与 getShapeVideo2.format_result 保持一致）"""
+    if record.get('digit') is not None:
+        return (
+            f"识别的数字:{record['digit']}\n"
+            f"置信度为:{record['confidence']:.2f}\n"
+            f"分类结果：{record['category']}\n"
+        )
+    return (
+        f"识别的数字:无\n"
+        f"置信度为:0.00\n"
+        f"分类结果：{record.get('category')}\n"
+    )
+
+
+class ResultStore:
+    """
+    线程安全的结果存储
+
+    - put(): 写入/覆盖一条结果，并放入 LRU 缓存
+    - get(): 按上传文件名查询，优先命中缓存
+    - query(): 按完成时间范围查询
+    - prune(): 删除完成时间早于给定时刻的记录（保留策略）
+    - export_text(): 导出兼容旧格式的文本文件（需指定 export_dir，
+      或 export_path：文本文件名 -> 路径，例如按日期分片）
+    """
+
+    def __init__(self, db_path: str, cache_size: int = 256,
+                 export_dir: Optional[str] = None,
+                 export_path: Optional[Callable[[str], str]] = None):
+        self.db_path = db_path
+        self.cache_size = max(0, int(cache_size))
+        self.export_dir = export_dir
+        self.export_path = export_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._cache: 'OrderedDict[str, Dict]' = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(results)')}
+        for column, column_type in _ADDED_COLUMNS:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE results ADD COLUMN {column} {column_type}')
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用自己的连接（sqlite3 连接不能跨线程共享）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # ---- 缓存 ----
+    def _cache_get(self, filename: str) -> Optional[Dict]:
+        with self._cache_lock:
+            record = self._cache.get(filename)
+            if record is not None:
+                self._cache.move_to_end(filename)
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+            return record
+
+    def _cache_put(self, record: Dict) -> None:
+        if self.cache_size == 0:
+            return
+        with self._cache_lock:
+            self._cache[record['filename']] = record
+            self._cache.move_to_end(record['filename'])
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---- 读写 ----
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        record['timing'] = json.loads(record['timing']) if record['timing'] else {}
+        return record
+
+    def put(self, record: Dict) -> Dict:
+        """写入一条结果，record 至少包含 filename、created_at、finished_at"""
+        record = {k: record.get(k) for k in _COLUMNS}
+        record['timing'] = record['timing'] or {}
+        if record['latency_ms'] is None:
+            record['latency_ms'] = (record['finished_at'] - record['created_at']) * 1000
+
+        values = dict(record, timing=json.dumps(record['timing']))
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute(
+                f"INSERT OR REPLACE INTO results ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + c for c in _COLUMNS)})",
+                values
+            )
+            conn.commit()
+        self._cache_put(record)
+        return record
+
+    def get(self, filename: str) -> Optional[Dict]:
+        record = self._cache_get(filename)
+        if record is not None:
+            return record
+
+        row = self._conn().execute(
+            'SELECT * FROM results WHERE filename = ?', (filename,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = self._row_to_record(row)
+        self._cache_put(record)
+        return record
+
+    def contains(self, filename: str) -> bool:
+        """是否已有该结果；只查缓存与主键，不计入缓存命中统计（长轮询会反复调用）"""
+        with self._cache_lock:
+            if filename in self._cache:
+                return True
+        return self._conn().execute(
+            'SELECT 1 FROM results WHERE filename = ?', (filename,)
+        ).fetchone() is not None
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 100) -> List[Dict]:
+        """按完成时间范围查询（新的在前）"""
+        clauses, params = [], []
+        if since is not None:
+            clauses.append('finished_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('finished_at < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        params.append(int(limit))
+        rows = self._conn().execute(
+            f'SELECT * FROM results {where} ORDER BY finished_at DESC LIMIT ?', params
+        ).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def prune(self, before: float) -> int:
+        """删除 finished_at 早于 before 的记录（走 finished_at 索引），同时移出缓存，返回删除条数"""
+        with self._write_lock:
+            conn = self._conn()
+            deleted = conn.execute('DELETE FROM results WHERE finished_at < ?', (before,)).rowcount
+            conn.commit()
+        with self._cache_lock:
+            for filename in [f for f, r in self._cache.items() if r['finished_at'] < before]:
+                del self._cache[filename]
+        return deleted
+
+    def count(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def export_text(self, record: Dict) -> str:
+        """导出兼容旧格式的 `<base>_result.txt` 文本文件，返回文件路径"""
+        name = result_text_name(record['filename'])
+        path = self.export_path(name) if self.export_path else os.path.join(self.export_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(format_result_text(record))
+        return path
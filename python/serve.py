@@ -0,0 +1,98 @@
+"""
+生产环境入口
+
+`python python/app.py` 是开发模式（单进程 Werkzeug 开发服务器 + debug reloader）。
+这里用 gunicorn 以多进程 × 多线程（gthread）方式运行同一个 Flask 应用：
+
+- 不启用 reloader 与 debug，连接保持（keep-alive）由 gunicorn 处理
+- 每个工作进程各自启动推理进程池（LAB401_INFER_WORKERS 个推理进程/工作进程），
+  已登记的上传、结果事件与最新图片保存在共享状态（result/results.db）中，所有工作进程可见
+- 上传的图片由各进程的归档线程在后台写盘，请求线程不等待磁盘 I/O；
+  静态文件通过 wsgi.file_wrapper（sendfile）发送
+- 长轮询与 SSE 连接各占一个线程，并发连接数约为 workers × threads
+
+Windows 上没有 gunicorn，退回 waitress（单进程多线程）。
+
+用法：
+    python python/serve.py --workers 2 --threads 64 --bind 0.0.0.0:5401
+也可以直接交给 gunicorn（不要加 --preload，推理进程池必须在各工作进程中启动）：
+    cd python && gunicorn -k gthread -w 2 --threads 64 -b 0.0.0.0:5401 'serve:create_app()'
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+WEB_WORKERS = int(os.environ.get('LAB401_WEB_WORKERS', '2'))
+WEB_THREADS = int(os.environ.get('LAB401_WEB_THREADS', '64'))
+WEB_KEEPALIVE = int(os.environ.get('LAB401_WEB_KEEPALIVE', '5'))  # 空闲连接保持秒数
+WEB_BIND = os.environ.get('LAB401_WEB_BIND', '0.0.0.0:5401')
+
+
+def create_app():
+    """在工作进程中导入应用、初始化共享状态并启动推理进程池"""
+    import app as server
+    server.app.logger.setLevel(logging.INFO)
+    server.init_processed_files()
+    server._mark_startup('manifest')
+    server.start_serving()
+    return server.app
+
+
+def _worker_exit(arbiter, worker) -> None:
+    """gunicorn 工作进程退出时停止它的推理进程"""
+    server = sys.modules.get('app')
+    if server is not None:
+        server.INFERENCE.stop()
+
+
+def run_gunicorn(bind: str, workers: int, threads: int, keepalive: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class _Application(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': bind,
+                'workers': workers,
+                'worker_class': 'gthread',
+                'threads': threads,
+                'keepalive': keepalive,
+                # gthread 的 timeout 只针对工作进程心跳，长轮询与 SSE 不受影响
+                'timeout': 120,
+                'worker_exit': _worker_exit,
+                'preload_app': False,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app()
+
+    _Application().run()
+
+
+def run_waitress(bind: str, threads: int) -> None:
+    from waitress import serve
+
+    host, _, port = bind.rpartition(':')
+    serve(create_app(), host=host or '0.0.0.0', port=int(port), threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='以生产模式运行服务（多进程 gunicorn / Windows 上为 waitress）')
+    parser.add_argument('--bind', default=WEB_BIND, help='监听地址，默认 0.0.0.0:5401')
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS, help='Web 工作进程数')
+    parser.add_argument('--threads', type=int, default=WEB_THREADS, help='每个工作进程的线程数')
+    parser.add_argument('--keepalive', type=int, default=WEB_KEEPALIVE, help='空闲连接保持秒数')
+    args = parser.parse_args()
+
+    if os.name == 'nt':
+        run_waitress(args.bind, args.workers * args.threads)
+    else:
+        run_gunicorn(args.bind, args.workers, args.threads, args.keepalive)
+
+
+if __name__ == '__main__':
+    main()
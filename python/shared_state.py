@@ -0,0 +1,165 @@
+"""
+跨进程共享的服务状态
+
+多进程部署（serve.py）时每个 Web 工作进程各有一份内存，原先的 PROCESSED_FILES、
+LATEST_IMAGE 与结果事件队列只在单个进程内可见。这里把它们放进与结果库同一个
+SQLite 文件（WAL 模式，读写互不阻塞）：
+
+- uploads：已登记的上传文件名（替代 PROCESSED_FILES 与 uploads/.manifest），收到上传时即登记
+  （早于后台写盘，用于多进程之间去重），archived_at 列实为登记时间（列名沿用旧版本）；
+  由 prune_uploads() 按保留天数与条数定期裁剪，不随运行时间无限增长
+- events：结果推送事件（自增序号即 SSE 的事件 id），只保留最近 history 条；
+  最新一条事件即为最新图片（替代 LATEST_IMAGE）
+
+等待结果的请求在本进程的条件变量上被及时唤醒；其他进程写入的结果通过
+按 poll_interval 短间隔重新查询感知。
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    filename    TEXT PRIMARY KEY,
+    archived_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_archived_at ON uploads (archived_at);
+CREATE TABLE IF NOT EXISTS events (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    payload    TEXT NOT NULL
+);
+"""
+
+
+class SharedState:
+    """
+    线程安全、多进程安全的共享状态
+
+    - add_upload() / discard_upload(): 登记/撤销上传文件名
+    - publish(): 追加一条结果事件并唤醒本进程内的等待者
+    - events_since() / latest_event(): 读取事件（SSE 补发、最新图片）
+    - wait_until(): 等待条件成立（本进程通知 + 跨进程轮询）
+    """
+
+    def __init__(self, db_path: str, history: int = 100, poll_interval: float = 0.25):
+        self.db_path = db_path
+        self.history = max(1, int(history))
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # 本进程发布事件时递增，等待者据此判断是否有新通知，避免检查与等待之间漏掉唤醒
+        self._changed = threading.Condition()
+        self._generation = 0
+
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用自己的连接（sqlite3 连接不能跨线程共享）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # ---- 上传文件 ----
+    def add_upload(self, filename: str) -> bool:
+        """登记上传文件名，返回是否为新文件（其他进程已登记时返回 False）"""
+        with self._write_lock:
+            conn = self._conn()
+            cursor = conn.execute('INSERT OR IGNORE INTO uploads VALUES (?, ?)',
+                                  (filename, time.time()))
+            conn.commit()
+        return cursor.rowcount == 1
+
+    def add_uploads(self, filenames: Iterable[str]) -> None:
+        """批量登记（启动时导入旧的清单或目录扫描结果）"""
+        now = time.time()
+        with self._write_lock:
+            conn = self._conn()
+            conn.executemany('INSERT OR IGNORE INTO uploads VALUES (?, ?)',
+                             ((name, now) for name in filenames))
+            conn.commit()
+
+    def discard_upload(self, filename: str) -> None:
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute('DELETE FROM uploads WHERE filename = ?', (filename,))
+            conn.commit()
+
+    def upload_count(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM uploads').fetchone()[0]
+
+    def prune_uploads(self, older_than: Optional[float] = None, keep: int = 0) -> int:
+        """删除登记时间早于 older_than 的记录，并只保留最新的 keep 条（0 表示不限），返回删除条数"""
+        with self._write_lock:
+            conn = self._conn()
+            deleted = 0
+            if older_than is not None:
+                deleted += conn.execute('DELETE FROM uploads WHERE archived_at < ?',
+                                        (older_than,)).rowcount
+            if keep > 0:
+                deleted += conn.execute(
+                    'DELETE FROM uploads WHERE filename IN ('
+                    'SELECT filename FROM uploads ORDER BY archived_at DESC LIMIT -1 OFFSET ?)',
+                    (keep,)).rowcount
+            conn.commit()
+        return deleted
+
+    # ---- 结果事件 ----
+    def publish(self, event: Dict) -> int:
+        """追加一条事件并返回其序号；超出 history 的旧事件随之删除"""
+        with self._write_lock:
+            conn = self._conn()
+            seq = conn.execute('INSERT INTO events (created_at, payload) VALUES (?, ?)',
+                               (time.time(), json.dumps(event, ensure_ascii=False))).lastrowid
+            conn.execute('DELETE FROM events WHERE seq <= ?', (seq - self.history,))
+            conn.commit()
+        self.notify()
+        return seq
+
+    def notify(self) -> None:
+        """唤醒本进程内所有等待者"""
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    def events_since(self, seq: int) -> List[Tuple[int, Dict]]:
+        rows = self._conn().execute(
+            'SELECT seq, payload FROM events WHERE seq > ? ORDER BY seq', (seq,)
+        ).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def latest_event(self) -> Optional[Tuple[int, Dict]]:
+        row = self._conn().execute(
+            'SELECT seq, payload FROM events ORDER BY seq DESC LIMIT 1'
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row is not None else None
+
+    def last_seq(self) -> int:
+        latest = self.latest_event()
+        return latest[0] if latest is not None else 0
+
+    def wait_until(self, predicate: Callable[[], bool], timeout: float) -> bool:
+        """
+        等待 predicate() 成立，最长 timeout 秒，返回最终结果。
+        predicate 在锁外执行（通常会查询数据库）；本进程的 notify() 立即唤醒，
+        其他进程的写入最迟 poll_interval 秒后被发现
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            generation = self._generation
+            if predicate():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self._changed:
+                self._changed.wait_for(lambda: self._generation != generation,
+                                       timeout=min(remaining, self.poll_interval))
@@ -0,0 +1,282 @@
+"""
+按日期分片的文件存储与保留策略
+
+uploads/ 与 result/ 原先是一个平铺目录，文件只增不减。ShardedStore 把新文件写入
+按日期分片的子目录（`<根目录>/YYYYMMDD/<文件名>`），日期取自文件名中的
+`%Y%m%d%H%M%S_` 时间戳（上传文件名、`<处理器>_<上传文件名>` 与 `_result.txt` 都带有），
+所以只凭文件名就能定位，`/uploads/<文件名>` 等 URL 保持不变；不带时间戳的文件仍放在根目录。
+
+enforce() 由后台线程定期调用：
+- 超过 compact_after_days 天的分片打包为 `archive/YYYYMMDD.zip` 后删除原文件
+  （图片已是压缩格式，默认只存储不再压缩；zip 有中央目录，可按文件名直接读取单个文件）
+- 按天数、文件数、字节数保留：超出时从最旧的一天开始整天删除（分片或归档），当天的分片不删除
+- 旧版本留在根目录的文件只在 migrate=True 时逐批移入分片
+
+多个工作进程共用同一目录时，用根目录下的锁文件保证同一时间只有一个进程整理。
+"""
+import os
+import re
+import shutil
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+ARCHIVE_DIR = 'archive'
+LOCK_NAME = '.storage.lock'
+LOCK_STALE = 3600.0       # 锁文件超过该秒数视为持有者已退出
+MIGRATE_BATCH = 1000      # 每次整理最多移入分片的旧文件数
+
+_SHARD_RE = re.compile(r'^\d{8}$')
+_STAMP_RE = re.compile(r'(?:^|_)(\d{8})\d{6}_')
+
+
+def shard_of(filename: str) -> Optional[str]:
+    """文件名对应的分片（YYYYMMDD）；文件名中没有合法时间戳时返回 None"""
+    match = _STAMP_RE.search(filename)
+    if match is None:
+        return None
+    try:
+        datetime.strptime(match.group(1), '%Y%m%d')
+    except ValueError:
+        return None
+    return match.group(1)
+
+
+def _plain_name(filename: str) -> bool:
+    """只接受不含路径的文件名"""
+    return bool(filename) and filename == os.path.basename(filename) and \
+        '\\' not in filename and not filename.startswith('.')
+
+
+class ShardedStore:
+    """
+    一个根目录下的分片存储
+
+    - path_for(): 文件应写入的路径（按文件名确定分片）
+    - locate(): 磁盘上实际存在的路径（分片优先，其次根目录），不存在时返回 None
+    - read_archived(): 从归档 zip 中读取已打包的文件
+    - iter_files(): 根目录与各分片中的文件（不含已打包的）
+    - enforce(): 打包、按保留策略删除（以及可选的旧文件迁移），返回本次统计
+    """
+
+    def __init__(self, root: str, managed: Callable[[str], bool],
+                 retention_days: float = 30, max_files: int = 0, max_bytes: int = 0,
+                 compact_after_days: float = 2, compression: int = zipfile.ZIP_STORED,
+                 migrate: bool = False):
+        self.root = root
+        self.managed = managed
+        self.retention_days = retention_days
+        self.max_files = max(0, int(max_files))    # 0 表示不限
+        self.max_bytes = max(0, int(max_bytes))    # 0 表示不限
+        self.compact_after_days = compact_after_days
+        self.compression = compression
+        self.migrate = migrate
+        self.archive_dir = os.path.join(root, ARCHIVE_DIR)
+        # 已统计过的分片/归档：路径 -> (mtime, 文件数, 字节数)，目录 mtime 不变时不再重新扫描
+        self._sizes: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    # ---- 路径 ----
+    def path_for(self, filename: str, create: bool = False) -> str:
+        shard = shard_of(filename)
+        if shard is None:
+            return os.path.join(self.root, filename)
+        directory = os.path.join(self.root, shard)
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, filename)
+
+    def locate(self, filename: str) -> Optional[str]:
+        if not _plain_name(filename):
+            return None
+        path = self.path_for(filename)
+        if os.path.isfile(path):
+            return path
+        legacy = os.path.join(self.root, filename)
+        return legacy if os.path.isfile(legacy) else None
+
+    def read_archived(self, filename: str) -> Optional[bytes]:
+        shard = shard_of(filename) if _plain_name(filename) else None
+        if shard is None:
+            return None
+        archive = os.path.join(self.archive_dir, f'{shard}.zip')
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                return zf.read(filename)
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def iter_files(self) -> Iterator[Tuple[str, str]]:
+        """根目录与各日期分片中的文件（不含已打包进归档的）：按文件名排序的 (文件名, 路径)"""
+        files = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    if _plain_name(entry.name):
+                        files.append((entry.name, entry.path))
+                elif entry.is_dir() and _SHARD_RE.match(entry.name):
+                    with os.scandir(entry.path) as shard:
+                        files.extend((e.name, e.path) for e in shard if e.is_file())
+        return iter(sorted(files))
+
+    # ---- 统计 ----
+    def _measure(self, path: str, kind: str) -> tuple:
+        mtime = os.stat(path).st_mtime
+        cached = self._sizes.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+        if kind == 'shard':
+            files = size = 0
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        files += 1
+                        size += entry.stat().st_size
+        else:
+            with zipfile.ZipFile(path) as zf:
+                files = len(zf.infolist())
+            size = os.path.getsize(path)
+        self._sizes[path] = (mtime, files, size)
+        return files, size
+
+    def _units(self) -> List[Dict]:
+        """按日期从旧到新列出分片与归档：[{day, kind, path, files, bytes}]"""
+        units = []
+        with os.scandir(self.root) as entries:
+            shards = [(e.name, e.path) for e in entries if e.is_dir() and _SHARD_RE.match(e.name)]
+        for day, path in shards:
+            units.append({'day': day, 'kind': 'shard', 'path': path})
+        if os.path.isdir(self.archive_dir):
+            with os.scandir(self.archive_dir) as entries:
+                for e in entries:
+                    day, ext = os.path.splitext(e.name)
+                    if ext == '.zip' and _SHARD_RE.match(day):
+                        units.append({'day': day, 'kind': 'archive', 'path': e.path})
+        for unit in units:
+            try:
+                unit['files'], unit['bytes'] = self._measure(unit['path'], unit['kind'])
+            except (OSError, zipfile.BadZipFile):
+                unit['files'], unit['bytes'] = 0, 0
+        units.sort(key=lambda u: (u['day'], u['kind']))
+        return units
+
+    def usage(self) -> Dict:
+        units = self._units()
+        return {
+            'files': sum(u['files'] for u in units),
+            'bytes': sum(u['bytes'] for u in units),
+            'shards': sum(1 for u in units if u['kind'] == 'shard'),
+            'archives': sum(1 for u in units if u['kind'] == 'archive'),
+        }
+
+    # ---- 整理 ----
+    def _acquire(self) -> bool:
+        """创建锁文件（跨进程互斥）；持有者超过 LOCK_STALE 秒未释放时清除，下一轮再获取"""
+        path = os.path.join(self.root, LOCK_NAME)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE:
+                    os.remove(path)
+            except OSError:
+                pass
+            return False
+
+    def _release(self) -> None:
+        try:
+            os.remove(os.path.join(self.root, LOCK_NAME))
+        except OSError:
+            pass
+
+    def _migrate(self) -> int:
+        """把根目录中带时间戳的旧文件移入对应分片（每次最多 MIGRATE_BATCH 个）"""
+        moved = 0
+        with os.scandir(self.root) as entries:
+            names = [e.name for e in entries if e.is_file() and self.managed(e.name)]
+        for name in names:
+            if moved >= MIGRATE_BATCH:
+                break
+            if shard_of(name) is None:
+                continue
+            os.replace(os.path.join(self.root, name), self.path_for(name, create=True))
+            moved += 1
+        return moved
+
+    def _compact(self, unit: Dict) -> int:
+        """把一个分片打包进 archive/YYYYMMDD.zip（已有归档时追加），然后删除原文件"""
+        with os.scandir(unit['path']) as entries:
+            names = sorted(e.name for e in entries if e.is_file())
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archive = os.path.join(self.archive_dir, f"{unit['day']}.zip")
+        tmp = archive + '.tmp'
+        # 先写临时文件再替换，正在读取旧归档的请求不受影响
+        if os.path.exists(archive):
+            shutil.copyfile(archive, tmp)
+        with zipfile.ZipFile(tmp, 'a', self.compression) as zf:
+            existing = set(zf.namelist())
+            for name in names:
+                if name not in existing:
+                    zf.write(os.path.join(unit['path'], name), name)
+        os.replace(tmp, archive)
+        for name in names:
+            os.remove(os.path.join(unit['path'], name))
+        try:
+            os.rmdir(unit['path'])
+        except OSError:
+            pass  # 打包期间又写入了新文件，下一轮再处理
+        return len(names)
+
+    def _delete(self, unit: Dict) -> None:
+        if unit['kind'] == 'shard':
+            shutil.rmtree(unit['path'], ignore_errors=True)
+        else:
+            os.remove(unit['path'])
+        self._sizes.pop(unit['path'], None)
+
+    def enforce(self, now: Optional[datetime] = None) -> Dict:
+        """执行一次整理，返回 {migrated, compacted, deleted_files, deleted_bytes, files, bytes}"""
+        stats = {'migrated': 0, 'compacted': 0, 'deleted_files': 0, 'deleted_bytes': 0}
+        with self._lock:
+            if not self._acquire():
+                stats['skipped'] = True
+                return stats
+            try:
+                now = now or datetime.now()
+                today = now.strftime('%Y%m%d')
+                expire_before = (now - timedelta(days=self.retention_days)).strftime('%Y%m%d') \
+                    if self.retention_days else ''
+                if self.migrate:
+                    stats['migrated'] = self._migrate()
+
+                if self.compact_after_days is not None and self.compact_after_days >= 0:
+                    compact_before = (now - timedelta(days=self.compact_after_days)).strftime('%Y%m%d')
+                    for unit in self._units():
+                        # 已超过保留天数的分片马上会被删除，不再打包
+                        if unit['kind'] == 'shard' and expire_before <= unit['day'] < min(compact_before, today):
+                            stats['compacted'] += self._compact(unit)
+
+                units = self._units()
+                files = sum(u['files'] for u in units)
+                size = sum(u['bytes'] for u in units)
+                for unit in units:
+                    if unit['day'] >= today:
+                        break
+                    expired = unit['day'] < expire_before
+                    over = (self.max_files and files > self.max_files) or \
+                        (self.max_bytes and size > self.max_bytes)
+                    if not (expired or over):
+                        continue
+                    self._delete(unit)
+                    files -= unit['files']
+                    size -= unit['bytes']
+                    stats['deleted_files'] += unit['files']
+                    stats['deleted_bytes'] += unit['bytes']
+                stats['files'], stats['bytes'] = files, size
+            finally:
+                self._release()
+        return stats
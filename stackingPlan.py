@@ -0,0 +1,58 @@
+"""
+堆垛坐标规划
+
+堆垛循环原先每放一件都重新调用 maduoXYZ.getXYZList 计算整个坐标网格、整体反转后只取一项。
+StackingPlan 对一组托盘参数（行/列优先、Z/S 次序、原点、行列层数）只计算一次网格，
+保存为 [N, 3] 的 NumPy 数组，按剩余件数 O(1) 取目标点（索引语义与 xyzList[::-1][n - 1] 相同）。
+
+get_plan() 按参数缓存；PLC 托盘参数变化时调用 invalidate() 清空缓存。
+upcoming() 提前给出之后的目标点，运动规划可以在当前搬运结束前开始。
+"""
+from functools import lru_cache
+
+import numpy as np
+
+import maduoXYZ
+
+
+class StackingPlan:
+    """一组托盘参数对应的堆垛坐标网格（只读）"""
+
+    def __init__(self, ranks, order, origin, counts):
+        x, y, z = origin
+        xNum, yNum, zNum = counts
+        grid = np.asarray(maduoXYZ.getXYZList(ranks, order, x, y, z, xNum, yNum, zNum), dtype=np.float64)
+        self.grid = grid.reshape(-1, 3)
+        self.grid.flags.writeable = False
+        # 原代码先把列表整体反转再按 n - 1 取值，这里用反向视图（不拷贝）保持同样的索引
+        self._reversed = self.grid[::-1]
+
+    def __len__(self):
+        return len(self.grid)
+
+    def target(self, remaining):
+        """剩余 remaining 件时的放料点（等同于 getXYZList(...)[::-1][remaining - 1]）"""
+        return self._reversed[remaining - 1].tolist()
+
+    def upcoming(self, remaining, count=1):
+        """
+        当前这一件之后的 count 个放料点，[(剩余件数, 坐标)]，用于提前规划；
+        主循环在剩余件数为 0 时仍搬运一件（num >= 0），所以包含 n == 0
+        """
+        return [(n, self.target(n)) for n in range(remaining - 1, max(remaining - 1 - count, -1), -1)]
+
+
+@lru_cache(maxsize=8)
+def _cached_plan(ranks, order, origin, counts):
+    return StackingPlan(ranks, order, origin, counts)
+
+
+def get_plan(ranks, order, origin, counts):
+    """按参数取（必要时计算）堆垛规划；origin 为原点 [x, y, z]，counts 为 (行数, 列数, 层数)"""
+    return _cached_plan(int(ranks), int(order), tuple(float(v) for v in origin),
+                        tuple(int(v) for v in counts))
+
+
+def invalidate(*_):
+    """清空缓存（PLC 托盘参数变化时调用，可直接作为 PlcSnapshot 的订阅回调）"""
+    _cached_plan.cache_clear()
@@ -0,0 +1,296 @@
+"""
+视觉识别云平台客户端（机械臂 / PLC 主程序使用）
+
+- 复用同一个 requests.Session：连接池 + keep-alive，每次识别不再重新建立 TCP 连接
+- ROI 在内存中编码为 JPEG 直接上传，不写临时文件
+- 优先调用 POST /recognize（一次请求返回结果）；旧版服务端没有该接口（404）时
+  退回 POST /upload + GET /result?wait= 长轮询
+- 连接失败、超时与 5xx 按指数退避 + 随机抖动重试（503 时按 Retry-After），
+  所有重试都受同一个总截止时间约束；上传类 POST（/upload、/recognize）不是幂等的，
+  只在连接未建立或服务端以 503 + Retry-After 拒绝（未登记上传）时重试，
+  读取超时等请求可能已被处理的情况不再重发，避免重复上传与重复推理
+- 每次识别打印各步骤耗时（编码、上传/识别、等待结果、服务端耗时、重试次数）
+- 每次识别生成一个追踪 id，随该次识别的所有请求放在请求头 X-Trace-Id 中，
+  服务端日志、结果记录与 /metrics 可以据此对应；report() 把一次分拣周期的各步骤耗时
+  在后台线程中上报到 POST /client_metrics，不阻塞主流程
+"""
+import queue
+import random
+import threading
+import time
+import uuid
+
+import cv2 as cv
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+CLOUD_API_URL = "http://192.168.40.49:5401"
+
+# ROI 约 140x130，质量 90 时约 3 KB；降到 80 只省约 1 KB，识别一致性却开始下降
+JPEG_QUALITY = 90
+DEADLINE = 30.0          # 一次识别（含全部重试）的总时限（秒）
+CONNECT_TIMEOUT = 3.0    # 建立连接的超时（秒）
+RESULT_WAIT = 10         # 长轮询时每次请求在服务端最多挂起的秒数
+BACKOFF_BASE = 0.2       # 第一次重试的最大退避（秒），之后每次翻倍
+BACKOFF_CAP = 2.0        # 单次退避上限（秒）
+TRACE_HEADER = "X-Trace-Id"
+REPORT_QUEUE_SIZE = 64   # 待上报的耗时条数上限，云平台不可达时多出的直接丢弃
+REPORT_TIMEOUT = 2.0     # 上报请求的超时（秒）
+
+
+class VisionError(Exception):
+    """识别失败（上传被拒绝、截止时间内未拿到结果、结果无法解析等）"""
+
+
+def parse_result(data):
+    """
+    从服务端返回中取出 (数字, 置信度, 分类)；
+    新版服务端直接返回结构化字段，旧版只有 3 行文本时按行解析
+    """
+    if "digit" in data:
+        return data.get("digit"), data.get("confidence"), data.get("category")
+
+    out = conf = shape_type = None
+    for line in (line.strip() for line in data.get("content", "").split("\n")):
+        # 识别的数字:7
+        if line.startswith("识别的数字:"):
+            num_str = line.split(":", 1)[1].strip()
+            if num_str.isdigit():
+                out = int(num_str)
+            else:
+                print(f"⚠️ 识别数字格式错误：{num_str}（应为整数）")
+        # 置信度为:0.98
+        elif line.startswith("置信度为:"):
+            conf_str = line.split(":", 1)[1].strip()
+            try:
+                conf = float(conf_str)
+            except ValueError:
+                print(f"⚠️ 置信度格式错误：{conf_str}（应为小数）")
+        # 分类结果：奇（中文冒号）
+        elif line.startswith("分类结果："):
+            shape_type = line.split("：", 1)[1].strip().replace(" ", "").lower()
+    return out, conf, shape_type
+
+
+def _not_sent(error):
+    """请求是否肯定没有发到服务端：连接超时，或无法建立连接（拒绝连接、地址不可达等）"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class VisionClient:
+    """
+    云平台识别客户端（同一个实例可被反复调用，线程安全性同 requests.Session，
+    多线程同时调用时每个线程使用各自的实例）
+    """
+
+    def __init__(self, base_url=CLOUD_API_URL, jpeg_quality=JPEG_QUALITY, deadline=DEADLINE,
+                 recognizer=None, client_name="robot"):
+        self.base_url = base_url.rstrip("/")
+        self.client_name = client_name  # 上报耗时时的客户端名称（区分多台设备）
+        self.jpeg_quality = jpeg_quality
+        self.deadline = deadline
+        self.recognizer = recognizer  # 服务端识别后端（如 'cascade'），None 使用服务端默认
+        self.session = requests.Session()
+        # 重试由 _request 统一处理，适配器本身不重试
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._has_recognize = True
+        self.last_timing = {}  # 最近一次识别的耗时（含 trace_id），可直接交给 report()
+        self._reports = queue.Queue(maxsize=REPORT_QUEUE_SIZE)
+        self._reporter = None
+
+    def close(self):
+        if self._reporter is not None:
+            try:
+                self._reports.put_nowait(None)
+            except queue.Full:
+                pass
+            self._reporter.join(timeout=REPORT_TIMEOUT)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def encode(self, frame):
+        try:
+            ok, encoded = cv.imencode(".jpg", frame, [cv.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        except cv.error as e:  # 空图像等情况 OpenCV 直接抛异常
+            raise VisionError(f"图像编码失败：{e}")
+        if not ok:
+            raise VisionError("图像编码失败")
+        return encoded.tobytes()
+
+    def _request(self, method, path, deadline, timing, step, read_timeout, idempotent=True, **kwargs):
+        """
+        发送请求；连接失败、超时与 5xx 时退避重试，直到 deadline（time.monotonic()）。
+        idempotent=False 时只在请求未发出（见 _not_sent）或 503 + Retry-After 时重试，其余失败直接报错。
+        耗时累加到 timing[f'{step}_ms']，请求次数记在 timing[f'{step}_attempts']
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise VisionError(f"{path} 在截止时间内未成功")
+            retry_after = None
+            t0 = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, self.base_url + path,
+                    timeout=(min(CONNECT_TIMEOUT, remaining), min(read_timeout, remaining)),
+                    **kwargs)
+                if response.status_code < 500:
+                    return response
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+                retryable = idempotent or (response.status_code == 503 and retry_after is not None)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = idempotent or _not_sent(e)
+            finally:
+                timing[f"{step}_ms"] = timing.get(f"{step}_ms", 0.0) + (time.perf_counter() - t0) * 1000
+                timing[f"{step}_attempts"] = attempt
+
+            if not retryable:
+                raise VisionError(f"{path} 请求失败（{error}），服务端可能已处理该请求，不再重发")
+
+            # 全抖动退避：在 [0, min(上限, 基数 * 2^(n-1))] 内随机，避免多台设备同时重试
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+            if retry_after is not None:
+                try:
+                    delay = float(retry_after)
+                except ValueError:
+                    pass
+            if time.monotonic() + delay >= deadline:
+                raise VisionError(f"{path} 请求失败（{error}），截止时间内无法再重试")
+            print(f"⚠️ {path} 第{attempt}次请求失败：{error}，{delay:.2f} 秒后重试")
+            time.sleep(delay)
+
+    @staticmethod
+    def _json(response, path):
+        try:
+            data = response.json()
+        except ValueError:
+            raise VisionError(f"{path} 返回的不是 JSON（HTTP {response.status_code}）")
+        if response.status_code >= 400 or not data.get("success", False):
+            raise VisionError(f"{path} 失败：{data.get('message', f'HTTP {response.status_code}')}")
+        return data
+
+    def _recognize(self, filename, image_bytes, deadline, timing):
+        """POST /recognize：一次请求上传并返回结果；服务端不支持时返回 None"""
+        response = self._request(
+            "POST", "/recognize", deadline, timing, "recognize", read_timeout=DEADLINE + 5, idempotent=False,
+            files={"file": (filename, image_bytes, "image/jpeg")},
+            data={"recognizer": self.recognizer} if self.recognizer else None,
+            headers={TRACE_HEADER: timing["trace_id"]})
+        if response.status_code == 404:
+            print("⚠️ 云平台不支持 /recognize，改用上传 + 长轮询")
+            self._has_recognize = False
+            return None
+        return self._json(response, "/recognize")
+
+    def _upload_and_wait(self, filename, image_bytes, deadline, timing):
+        """POST /upload 后用 GET /result?wait= 长轮询，结果写出时立即返回"""
+        response = self._request(
+            "POST", "/upload", deadline, timing, "upload", read_timeout=DEADLINE, idempotent=False,
+            files={"file": (filename, image_bytes, "image/jpeg")},
+            data={"recognizer": self.recognizer} if self.recognizer else None,
+            headers={TRACE_HEADER: timing["trace_id"]})
+        uploaded = self._json(response, "/upload").get("filename")
+        if not uploaded:
+            raise VisionError("云平台未返回文件名")
+        timing["filename"] = uploaded
+
+        while True:
+            wait = max(1, min(RESULT_WAIT, int(deadline - time.monotonic())))
+            response = self._request(
+                "GET", "/result", deadline, timing, "result", read_timeout=wait + 5,
+                params={"filename": uploaded, "wait": wait},
+                headers={TRACE_HEADER: timing["trace_id"]})
+            data = self._json(response, "/result")
+            if data.get("ready", False):
+                return data
+            if time.monotonic() >= deadline:
+                raise VisionError(f"超时未获取到解析结果（{self.deadline:.0f}秒）")
+
+    def recognize(self, frame, filename):
+        """
+        识别一帧 BGR 图像（或已编码的 JPEG 字节），filename 为上传时使用的文件名。
+        返回 (数字, 置信度, 分类, 服务端原始返回)，失败时抛出 VisionError；
+        各步骤耗时保存在 last_timing 中
+        """
+        timing = {"trace_id": uuid.uuid4().hex[:16]}
+        self.last_timing = timing
+        t0 = time.perf_counter()
+        image_bytes = frame if isinstance(frame, (bytes, bytearray)) else self.encode(frame)
+        timing["encode_ms"] = (time.perf_counter() - t0) * 1000
+        timing["bytes"] = len(image_bytes)
+        deadline = time.monotonic() + self.deadline
+
+        try:
+            data = None
+            if self._has_recognize:
+                data = self._recognize(filename, image_bytes, deadline, timing)
+            if data is None:
+                data = self._upload_and_wait(filename, image_bytes, deadline, timing)
+            server_ms = (data.get("timing") or {}).get("total_ms")
+            if server_ms is not None:
+                timing["server_ms"] = server_ms
+        finally:
+            timing["total_ms"] = (time.perf_counter() - t0) * 1000
+            self._log_timing(timing)
+        return parse_result(data) + (data,)
+
+    @staticmethod
+    def _log_timing(timing):
+        parts = []
+        for key, value in timing.items():
+            if not key.endswith("_ms"):
+                continue
+            step = key[:-3]
+            attempts = timing.get(f"{step}_attempts", 1)
+            parts.append(f"{step}={value:.1f}ms" + (f"（{attempts}次）" if attempts > 1 else ""))
+        print(f"⏱️ 识别耗时（{timing['bytes']} 字节，trace={timing['trace_id']}）：{'，'.join(parts)}")
+
+    def report(self, timing, trace_id=None):
+        """
+        上报一次分拣周期的各步骤耗时（{"<步骤>_ms": 毫秒}，其余项忽略）到 POST /client_metrics。
+        只放入队列，由后台线程发送；队列已满或上报失败时丢弃，不影响主流程
+        """
+        stages = {k: round(v, 3) for k, v in timing.items()
+                  if k.endswith("_ms") and isinstance(v, (int, float))}
+        if not stages:
+            return
+        if self._reporter is None:
+            self._reporter = threading.Thread(target=self._report_loop, name="metrics-report", daemon=True)
+            self._reporter.start()
+        try:
+            self._reports.put_nowait({"client": self.client_name,
+                                      "trace_id": trace_id or timing.get("trace_id"),
+                                      "timing": stages})
+        except queue.Full:
+            pass
+
+    def _report_loop(self):
+        # requests.Session 不保证多线程安全，上报使用单独的会话
+        with requests.Session() as session:
+            while True:
+                payload = self._reports.get()
+                if payload is None:
+                    return
+                try:
+                    response = session.post(self.base_url + "/client_metrics", json=payload,
+                                            timeout=(CONNECT_TIMEOUT, REPORT_TIMEOUT))
+                    if response.status_code == 404:
+                        print("⚠️ 云平台不支持 /client_metrics，停止上报耗时")
+                        return
+                except requests.exceptions.RequestException as e:
+                    print(f"⚠️ 耗时上报失败：{e}")